@@ -3,14 +3,23 @@ ASGI config for gesti_pc project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+When ``TELEGRAM_WEBHOOK_URL`` is set, the application also receives the Telegram
+bot's updates (see ``tg_bot.webhook``).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gesti_pc.settings")
 
 application = get_asgi_application()
+
+if settings.TELEGRAM_WEBHOOK_URL:
+    from tg_bot.webhook import TelegramWebhook
+
+    application = TelegramWebhook(application)
@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
+
+from gesti_pc.database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -79,12 +82,8 @@ WSGI_APPLICATION = "gesti_pc.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
-}
+# Set DATABASE_URL to use PostgreSQL; see gesti_pc/database.py for the options.
+DATABASES = {"default": database_config(BASE_DIR, os.environ)}
 
 
 # Password validation
@@ -154,10 +153,38 @@ TELEGRAM_LOCKED_THREAD_IDS = [int(x) for x in _locked_ids.split(",") if x.strip(
 _no_msg_ids = os.getenv("TELEGRAM_NO_MESSAGE_THREAD_IDS", "")
 TELEGRAM_NO_MESSAGE_THREAD_IDS = [int(x) for x in _no_msg_ids.split(",") if x.strip()]
 
+# Webhook mode: public HTTPS URL Telegram should POST updates to, served by the ASGI
+# app (gesti_pc.asgi). Leave empty to receive updates with `runbot` (long polling).
+# In webhook mode run `runbot --jobs-only` once for the scheduled jobs.
+# Example: TELEGRAM_WEBHOOK_URL=https://gesti-pc.example.org/telegram/webhook/
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+# Secret Telegram sends back in X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _, -).
+# Required in webhook mode: the ASGI app refuses to start without it.
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+# Webhook mode needs a single process (conversation state is in memory): a second
+# worker on the same host fails to start on this lock.
+TELEGRAM_WEBHOOK_LOCK_FILE = os.getenv(
+    "TELEGRAM_WEBHOOK_LOCK_FILE",
+    os.path.join(tempfile.gettempdir(), "gesti-pc-telegram-webhook.lock"),
+)
+# How many updates from different users are processed at the same time; each user's
+# updates are still handled in order.
+TELEGRAM_CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", "16"))
+# In-process cache of Telegram user -> Volontario: max entries and lifetime (seconds).
+# Edits made in another process (e.g. the admin while the bot runs with `runbot`)
+# are seen once the entry expires.
+TELEGRAM_IDENTITY_CACHE_SIZE = int(os.getenv("TELEGRAM_IDENTITY_CACHE_SIZE", "1024"))
+TELEGRAM_IDENTITY_CACHE_TTL = int(os.getenv("TELEGRAM_IDENTITY_CACHE_TTL", "300"))
+
 # AllertaLOM — allerte meteo Regione Lombardia
 # Codice ISTAT del comune da monitorare (default: comune di riferimento del gruppo).
 ALLERTALOM_COMUNE_ISTAT = os.getenv("ALLERTALOM_COMUNE_ISTAT", "108055")
 
+# Più comuni da monitorare, come codici ISTAT separati da virgola. I comuni della
+# stessa zona omogenea condividono una sola richiesta. Vuoto = solo il comune sopra.
+_allerta_comuni = os.getenv("ALLERTALOM_COMUNI_ISTAT", "")
+ALLERTALOM_COMUNI_ISTAT = [c.strip() for c in _allerta_comuni.split(",") if c.strip()]
+
 # Categorie da monitorare e ogni quanto (secondi), come coppie "cdTipologiaGis:intervallo"
 # separate da virgola. Categorie: 7=temporali, 9=idrogeologico, 10=idraulico,
 # 8=vento forte, 2=neve, 3=incendi boschivi. Stringa vuota = feature disattivata.
@@ -169,6 +196,15 @@ ALLERTALOM_MONITOR = {
     if p.strip()
 }
 
+# Polling adattivo: con un'allerta almeno gialla l'intervallo di ALLERTALOM_MONITOR
+# viene moltiplicato per ALLERTALOM_STORM_FACTOR, con tutto verde per
+# ALLERTALOM_CALM_FACTOR.
+ALLERTALOM_STORM_FACTOR = float(os.getenv("ALLERTALOM_STORM_FACTOR", "0.5"))
+ALLERTALOM_CALM_FACTOR = float(os.getenv("ALLERTALOM_CALM_FACTOR", "2"))
+
+# Giorni di conservazione dell'archivio delle previsioni AllertaLOM.
+ALLERTALOM_ARCHIVE_DAYS = int(os.getenv("ALLERTALOM_ARCHIVE_DAYS", "365"))
+
 # Orizzonte temporale (ore) entro cui considerare un'allerta "in corso".
 ALLERTALOM_HORIZON_HOURS = int(os.getenv("ALLERTALOM_HORIZON_HOURS", "24"))
 
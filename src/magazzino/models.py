@@ -1,6 +1,7 @@
 from uuid import uuid4
 
 from django.db import models
+from django.db.models import Count, Exists, OuterRef
 
 from volontario.models import Volontario
 
@@ -73,16 +74,55 @@ class RequisitoServizioType(models.Model):
         return f"{self.servizio_type} richiede {self.tipo_dotazione}"
 
 
+def volontari_idonei_per_servizio(servizio_type, volontari) -> set:
+    """Ritorna le pk dei volontari che hanno tutte le dotazioni richieste (attive) per
+    il ServizioType.
+
+    ``volontari`` può contenere istanze o pk (anche un queryset). Due query in tutto,
+    indipendentemente dal numero di volontari e di requisiti.
+    """
+    pks = {getattr(v, "pk", v) for v in volontari}
+    if servizio_type is None or not pks:
+        return pks
+    requisiti = set(
+        RequisitoServizioType.objects.filter(servizio_type=servizio_type).values_list(
+            "tipo_dotazione", flat=True
+        )
+    )
+    if not requisiti:
+        return pks
+    return set(
+        Dotazione.objects.filter(
+            volontario__in=pks,
+            tipo__in=requisiti,
+            data_restituzione__isnull=True,
+        )
+        .values("volontario")
+        .annotate(tipi=Count("tipo", distinct=True))
+        .filter(tipi=len(requisiti))
+        .values_list("volontario", flat=True)
+    )
+
+
 def volontario_ha_dotazioni_per_servizio(volontario, servizio_type) -> bool:
     """Ritorna True se il volontario ha tutte le dotazioni richieste (attive) per il ServizioType."""
-    requisiti = RequisitoServizioType.objects.filter(servizio_type=servizio_type)
-    if not requisiti.exists():
-        return True
-    for req in requisiti:
-        if not Dotazione.objects.filter(
-            volontario=volontario,
-            tipo=req.tipo_dotazione,
-            data_restituzione__isnull=True,
-        ).exists():
-            return False
-    return True
+    return volontario.pk in volontari_idonei_per_servizio(servizio_type, [volontario])
+
+
+def dotazioni_idonee(volontario: str, servizio_type: str) -> Exists:
+    """Espressione booleana per ``annotate()``: il volontario ha tutte le dotazioni
+    richieste (attive) per il ServizioType.
+
+    ``volontario`` e ``servizio_type`` sono i percorsi dei campi nel queryset
+    annotato (es. ``"fkvolontario"``, ``"fkservizio__type"``); senza ServizioType il
+    risultato è True. Calcolata nella stessa query, senza query per riga.
+    """
+    dotazione_attiva = Dotazione.objects.filter(
+        volontario=OuterRef(OuterRef(volontario)),
+        tipo=OuterRef("tipo_dotazione"),
+        data_restituzione__isnull=True,
+    )
+    requisiti_mancanti = RequisitoServizioType.objects.filter(
+        servizio_type=OuterRef(servizio_type)
+    ).exclude(Exists(dotazione_attiva))
+    return ~Exists(requisiti_mancanti)
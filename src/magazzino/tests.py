@@ -1,3 +1,118 @@
+from datetime import date
+
 from django.test import TestCase
 
-# Create your tests here.
+from servizio.models import Servizio, ServizioType, VolontarioServizioMap
+from volontario.models import Volontario
+
+from .models import (
+    Dotazione,
+    RequisitoServizioType,
+    TipoDotazione,
+    dotazioni_idonee,
+    volontari_idonei_per_servizio,
+    volontario_ha_dotazioni_per_servizio,
+)
+
+CFS = ["RSSMRA90A01H501W", "BNCLGU85M10F205B", "VRDGPP80A01L219M"]
+
+
+class IdoneitaTests(TestCase):
+    """Tests for the dotazioni-based eligibility helpers."""
+
+    def setUp(self):
+        self.tipo_servizio = ServizioType.objects.create(nome="Antincendio")
+        self.casco = TipoDotazione.objects.create(nome="Casco")
+        self.guanti = TipoDotazione.objects.create(nome="Guanti")
+        for tipo in (self.casco, self.guanti):
+            RequisitoServizioType.objects.create(
+                servizio_type=self.tipo_servizio, tipo_dotazione=tipo
+            )
+        self.completo, self.parziale, self.restituito = [
+            Volontario.objects.create(
+                codice_fiscale=cf, nome=f"Nome{i}", cognome="Test"
+            )
+            for i, cf in enumerate(CFS)
+        ]
+        self._assegna(self.completo, self.casco)
+        self._assegna(self.completo, self.guanti)
+        self._assegna(self.parziale, self.casco)
+        self._assegna(self.restituito, self.casco)
+        self._assegna(self.restituito, self.guanti, restituita=True)
+
+    def _assegna(self, volontario, tipo, restituita=False):
+        Dotazione.objects.create(
+            volontario=volontario,
+            tipo=tipo,
+            data_assegnazione=date(2026, 1, 1),
+            data_restituzione=date(2026, 2, 1) if restituita else None,
+        )
+
+    def test_bulk_returns_only_fully_equipped(self):
+        volontari = [self.completo, self.parziale, self.restituito]
+
+        with self.assertNumQueries(2):
+            idonei = volontari_idonei_per_servizio(self.tipo_servizio, volontari)
+
+        self.assertEqual(idonei, {self.completo.pk})
+
+    def test_bulk_accepts_pks_and_querysets(self):
+        self.assertEqual(
+            volontari_idonei_per_servizio(self.tipo_servizio, Volontario.objects.all()),
+            {self.completo.pk},
+        )
+        self.assertEqual(
+            volontari_idonei_per_servizio(self.tipo_servizio, [self.parziale.pk]),
+            set(),
+        )
+
+    def test_without_requirements_everyone_is_eligible(self):
+        libero = ServizioType.objects.create(nome="Segreteria")
+        volontari = [self.completo, self.parziale]
+
+        self.assertEqual(
+            volontari_idonei_per_servizio(libero, volontari),
+            {self.completo.pk, self.parziale.pk},
+        )
+        self.assertEqual(
+            volontari_idonei_per_servizio(None, volontari),
+            {self.completo.pk, self.parziale.pk},
+        )
+
+    def test_single_volontario_helper(self):
+        self.assertTrue(
+            volontario_ha_dotazioni_per_servizio(self.completo, self.tipo_servizio)
+        )
+        self.assertFalse(
+            volontario_ha_dotazioni_per_servizio(self.restituito, self.tipo_servizio)
+        )
+
+    def test_annotation_matches_bulk_api(self):
+        servizio = Servizio.objects.create(
+            nome="Presidio",
+            data_ora=date(2026, 7, 1),
+            type=self.tipo_servizio,
+            send_message=False,
+        )
+        senza_tipo = Servizio.objects.create(
+            nome="Riunione", data_ora=date(2026, 7, 2), send_message=False
+        )
+        for volontario in (self.completo, self.parziale, self.restituito):
+            for s in (servizio, senza_tipo):
+                VolontarioServizioMap.objects.create(
+                    fkvolontario=volontario, fkservizio=s
+                )
+
+        rows = VolontarioServizioMap.objects.annotate(
+            idoneo=dotazioni_idonee("fkvolontario", "fkservizio__type")
+        ).values_list("fkvolontario", "fkservizio", "idoneo")
+
+        self.assertEqual(
+            {(v, s) for v, s, idoneo in rows if idoneo},
+            {
+                (self.completo.pk, servizio.pk),
+                (self.completo.pk, senza_tipo.pk),
+                (self.parziale.pk, senza_tipo.pk),
+                (self.restituito.pk, senza_tipo.pk),
+            },
+        )
@@ -1,16 +1,27 @@
-from django.contrib import admin
+from datetime import timedelta
 
-from magazzino.models import RequisitoServizioType, volontario_ha_dotazioni_per_servizio
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from magazzino.models import RequisitoServizioType, dotazioni_idonee
+from tg_bot import tasks
+from tg_bot.models import BackgroundTask
 
 from .models import (
     ChecklistItem,
     ChecklistTemplateItem,
+    RiepilogoOre,
     ScheduledTask,
     Servizio,
     ServizioType,
     Timbratura,
     VolontarioServizioMap,
 )
+from .signals import close_polls_now, resend_polls_now
 
 
 class ChecklistTemplateItemInline(admin.TabularInline):
@@ -43,15 +54,115 @@ class ServizioAdmin(admin.ModelAdmin):
         "data_ora_fine",
         "send_message",
         "volontari_count",
+        "risposte_si",
+        "risposte_no",
+        "risposte_in_attesa",
     ]
     list_filter = ["type", "data_ora", "send_message"]
+    list_select_related = ["type"]
     search_fields = ["nome"]
     date_hierarchy = "data_ora"
+    actions = ["close_polls", "resend_polls"]
+
+    def get_queryset(self, request):
+        # Response counts for the whole page in the changelist query itself.
+        risposta = "volontarioserviziomap__risposta"
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                n_volontari=Count("volontarioserviziomap"),
+                n_si=Count(
+                    "volontarioserviziomap",
+                    filter=Q(**{risposta: VolontarioServizioMap.Risposta.SI}),
+                ),
+                n_no=Count(
+                    "volontarioserviziomap",
+                    filter=Q(**{risposta: VolontarioServizioMap.Risposta.NO}),
+                ),
+                n_in_attesa=Count(
+                    "volontarioserviziomap",
+                    filter=Q(**{f"{risposta}__isnull": True}),
+                ),
+            )
+        )
 
+    @admin.display(description="Volontari", ordering="n_volontari")
     def volontari_count(self, obj):
-        return obj.volontari.count()
+        return obj.n_volontari
+
+    @admin.display(description="Sì", ordering="n_si")
+    def risposte_si(self, obj):
+        return obj.n_si
+
+    @admin.display(description="No", ordering="n_no")
+    def risposte_no(self, obj):
+        return obj.n_no
+
+    @admin.display(description="In attesa", ordering="n_in_attesa")
+    def risposte_in_attesa(self, obj):
+        return obj.n_in_attesa
+
+    # Each poll action queues a single background task that makes all its Telegram
+    # calls concurrently: nothing waits on Telegram inside the admin request, and
+    # the task's error lists every servizio whose call failed.
+
+    def _survey_chat_id(self, request):
+        chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
+        if not chat_id or not getattr(settings, "TELEGRAM_BOT_TOKEN", None):
+            self.message_user(
+                request,
+                "Bot Telegram o chat dei sondaggi non configurati.",
+                messages.ERROR,
+            )
+            return None
+        return chat_id
+
+    def _queued(self, request, task, count, done_message):
+        message = f"{done_message}: {count} servizi."
+        task_admin = self.admin_site.get_model_admin(BackgroundTask)
+        if task_admin.has_view_permission(request, task):
+            url = reverse("admin:tg_bot_backgroundtask_change", args=[task.pk])
+            message = format_html('{} <a href="{}">Esito</a>', message, url)
+        self.message_user(request, message)
 
-    volontari_count.short_description = "Volontari"
+    @admin.action(description="Chiudi i sondaggi dei servizi selezionati")
+    def close_polls(self, request, queryset):
+        if self._survey_chat_id(request) is None:
+            return
+        servizi = [
+            str(pkid)
+            for pkid in queryset.filter(
+                poll_message_id__isnull=False, poll_closed=False
+            ).values_list("pkid", flat=True)
+        ]
+        if not servizi:
+            self.message_user(request, "Nessun sondaggio aperto.", messages.WARNING)
+            return
+        task = tasks.enqueue(close_polls_now, servizio_ids=servizi)
+        self._queued(request, task, len(servizi), "Chiusura dei sondaggi avviata")
+
+    @admin.action(description="Reinvia i sondaggi dei servizi selezionati")
+    def resend_polls(self, request, queryset):
+        if self._survey_chat_id(request) is None:
+            return
+        # Servizi without polls or already started are left alone.
+        eligible = queryset.filter(send_message=True, data_ora__gt=timezone.now())
+        polls = {
+            str(pkid): poll_id
+            for pkid, poll_id in eligible.values_list("pkid", "poll_id")
+        }
+        skipped = queryset.count() - len(polls)
+
+        if polls:
+            task = tasks.enqueue(resend_polls_now, polls=polls)
+            self._queued(request, task, len(polls), "Reinvio dei sondaggi avviato")
+        if skipped:
+            self.message_user(
+                request,
+                f"{skipped} servizi saltati (sondaggio disattivato o già iniziati).",
+                messages.WARNING,
+            )
 
 
 @admin.register(VolontarioServizioMap)
@@ -64,17 +175,50 @@ class VolontarioServizioMapAdmin(admin.ModelAdmin):
         "idoneo_display",
     ]
     list_filter = ["risposta", "fkservizio"]
+    list_select_related = ["fkvolontario", "fkservizio"]
     search_fields = ["fkvolontario__nome", "fkvolontario__cognome", "fkservizio__nome"]
     raw_id_fields = ["fkvolontario", "fkservizio"]
 
-    @admin.display(description="Dotazioni idonee", boolean=True)
-    def idoneo_display(self, obj):
-        if obj.fkservizio.type is None:
-            return True
-        return volontario_ha_dotazioni_per_servizio(
-            obj.fkvolontario, obj.fkservizio.type
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(idoneo=dotazioni_idonee("fkvolontario", "fkservizio__type"))
         )
 
+    @admin.display(description="Dotazioni idonee", boolean=True, ordering="idoneo")
+    def idoneo_display(self, obj):
+        return obj.idoneo
+
+
+class DurataFilter(admin.SimpleListFilter):
+    """Entries longer than a threshold, filtered on the SQL ``durata`` annotation."""
+
+    title = "durata"
+    parameter_name = "durata"
+
+    # value -> (label, minimum duration)
+    THRESHOLDS = {
+        "1h": ("Più di 1 ora", timedelta(hours=1)),
+        "4h": ("Più di 4 ore", timedelta(hours=4)),
+        "8h": ("Più di 8 ore", timedelta(hours=8)),
+        "12h": ("Più di 12 ore", timedelta(hours=12)),
+    }
+
+    def lookups(self, request, model_admin):
+        return [
+            *((value, label) for value, (label, _) in self.THRESHOLDS.items()),
+            ("open", "In corso"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == "open":
+            return queryset.filter(clock_out__isnull=True)
+        if self.value() not in self.THRESHOLDS:
+            return queryset
+        _, minimum = self.THRESHOLDS[self.value()]
+        return queryset.with_duration().filter(durata__gt=minimum)
+
 
 @admin.register(Timbratura)
 class TimbraturaAdmin(admin.ModelAdmin):
@@ -86,19 +230,54 @@ class TimbraturaAdmin(admin.ModelAdmin):
         "fkservizio",
         "fkscheduled_task",
     ]
-    list_filter = ["clock_in", "fkservizio", "fkscheduled_task"]
+    list_filter = ["clock_in", DurataFilter, "fkservizio", "fkscheduled_task"]
+    list_select_related = [
+        "fkvolontario__fkorganizzazione",
+        "fkservizio",
+        "fkscheduled_task",
+    ]
     search_fields = ["fkvolontario__nome", "fkvolontario__cognome"]
     raw_id_fields = ["fkvolontario", "fkservizio", "fkscheduled_task"]
     date_hierarchy = "clock_in"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_duration()
+
+    @admin.display(description="Durata", ordering="durata")
     def duration_display(self, obj):
-        if obj.duration is None:
+        if obj.durata is None:
             return "In corso"
-        hours = int(obj.duration // 60)
-        minutes = int(obj.duration % 60)
-        return f"{hours}h {minutes}m"
+        total_minutes = int(obj.durata.total_seconds() // 60)
+        return f"{total_minutes // 60}h {total_minutes % 60}m"
 
-    duration_display.short_description = "Durata"
+
+@admin.register(RiepilogoOre)
+class RiepilogoOreAdmin(admin.ModelAdmin):
+    list_display = [
+        "fkvolontario",
+        "mese",
+        "fkservizio_type",
+        "ore_display",
+        "sessioni",
+    ]
+    list_filter = ["mese", "fkservizio_type", "fkvolontario__fkorganizzazione"]
+    list_select_related = ["fkvolontario__fkorganizzazione", "fkservizio_type"]
+    search_fields = ["fkvolontario__nome", "fkvolontario__cognome"]
+    date_hierarchy = "mese"
+
+    # Rows are derived from Timbratura: edit the entries, not the rollup.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Ore", ordering="minuti")
+    def ore_display(self, obj):
+        return f"{obj.minuti // 60}h {obj.minuti % 60}m"
 
 
 class ChecklistItemInline(admin.TabularInline):
@@ -112,13 +291,16 @@ class ChecklistItemInline(admin.TabularInline):
 class ScheduledTaskAdmin(admin.ModelAdmin):
     list_display = ["nome", "type", "deadline", "completed", "volontari_count"]
     list_filter = ["type", "completed", "deadline"]
+    list_select_related = ["type"]
     search_fields = ["nome"]
     filter_horizontal = ["volontari"]
     date_hierarchy = "deadline"
     inlines = [ChecklistItemInline]
     readonly_fields = ["completed", "completed_at", "notification_sent"]
 
-    def volontari_count(self, obj):
-        return obj.volontari.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(n_volontari=Count("volontari"))
 
-    volontari_count.short_description = "Volontari"
+    @admin.display(description="Volontari", ordering="n_volontari")
+    def volontari_count(self, obj):
+        return obj.n_volontari
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from servizio.models import ricostruisci_riepilogo_ore
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce da zero il riepilogo mensile delle ore dalle timbrature "
+        "(dopo la migrazione o modifiche fatte senza passare dai modelli)"
+    )
+
+    def handle(self, *args, **options):
+        created = ricostruisci_riepilogo_ore()
+        self.stdout.write(self.style.SUCCESS(f"Creati {created} riepiloghi"))
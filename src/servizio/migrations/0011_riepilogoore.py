@@ -0,0 +1,65 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:01
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def popola_riepilogo_ore(apps, schema_editor):
+    """Fill RiepilogoOre from the existing entries, like ricostruisci_riepilogo_ore."""
+    Timbratura = apps.get_model('servizio', 'Timbratura')
+    RiepilogoOre = apps.get_model('servizio', 'RiepilogoOre')
+    totali = (
+        Timbratura.objects.filter(clock_out__isnull=False)
+        .order_by()
+        .annotate(
+            durata=ExpressionWrapper(F('clock_out') - F('clock_in'), output_field=DurationField()),
+            tipo=Coalesce('fkservizio__type', 'fkscheduled_task__type'),
+            mese=TruncMonth('clock_in', output_field=models.DateField()),
+        )
+        .values('fkvolontario_id', 'mese', 'tipo')
+        .annotate(totale=Sum('durata'), n=Count('pk'))
+    )
+    righe = [
+        RiepilogoOre(
+            fkvolontario_id=row['fkvolontario_id'],
+            mese=row['mese'],
+            fkservizio_type_id=row['tipo'],
+            minuti=max(int(row['totale'].total_seconds() // 60), 0) if row['totale'] else 0,
+            sessioni=row['n'],
+        )
+        for row in totali
+    ]
+    RiepilogoOre.objects.bulk_create(righe, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servizio', '0010_servizio_poll_close_date_and_more'),
+        ('volontario', '0003_volontario_birth_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiepilogoOre',
+            fields=[
+                ('pkid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('mese', models.DateField(help_text='Primo giorno del mese (ora locale)')),
+                ('minuti', models.PositiveIntegerField(default=0)),
+                ('sessioni', models.PositiveIntegerField(default=0)),
+                ('fkservizio_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='servizio.serviziotype')),
+                ('fkvolontario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='riepiloghi_ore', to='volontario.volontario')),
+            ],
+            options={
+                'verbose_name': 'Riepilogo Ore',
+                'verbose_name_plural': 'Riepiloghi Ore',
+                'ordering': ['-mese'],
+                'indexes': [models.Index(fields=['mese', 'fkservizio_type'], name='riepilogo_ore_mese_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fkvolontario', 'mese', 'fkservizio_type'), name='riepilogo_ore_unique'), models.UniqueConstraint(condition=models.Q(('fkservizio_type__isnull', True)), fields=('fkvolontario', 'mese'), name='riepilogo_ore_unique_untyped')],
+            },
+        ),
+        migrations.RunPython(popola_riepilogo_ore, migrations.RunPython.noop),
+    ]
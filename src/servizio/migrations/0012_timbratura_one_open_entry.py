@@ -0,0 +1,53 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def close_duplicate_open_entries(apps, schema_editor):
+    """Keep only the latest open entry per volunteer: each older one is closed
+    when the next one was opened, so the new constraint can be created."""
+    Timbratura = apps.get_model('servizio', 'Timbratura')
+    duplicated = (
+        Timbratura.objects.filter(clock_out__isnull=True)
+        .values('fkvolontario')
+        .annotate(n=Count('pk'))
+        .filter(n__gt=1)
+        .values_list('fkvolontario', flat=True)
+    )
+    for volontario_id in list(duplicated):
+        entries = list(
+            Timbratura.objects.filter(
+                fkvolontario_id=volontario_id, clock_out__isnull=True
+            ).order_by('clock_in')
+        )
+        for entry, following in zip(entries, entries[1:]):
+            entry.clock_out = following.clock_in
+            entry.notes = (entry.notes + '\n' if entry.notes else '') + (
+                'Chiusa automaticamente: entrata duplicata'
+            )
+            entry.save(update_fields=['clock_out', 'notes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servizio', '0011_riepilogoore'),
+        ('volontario', '0003_volontario_birth_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_entries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timbratura',
+            index=models.Index(fields=['fkservizio', 'clock_out'], name='timbratura_servizio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timbratura',
+            index=models.Index(fields=['fkscheduled_task', 'checklist_message_id'], name='timbratura_task_msg_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timbratura',
+            constraint=models.UniqueConstraint(condition=models.Q(('clock_out__isnull', True)), fields=('fkvolontario',), name='timbratura_one_open_entry'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.1.2 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servizio', '0012_timbratura_one_open_entry'),
+        ('volontario', '0003_volontario_birth_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledtask',
+            index=models.Index(condition=models.Q(('completed', False), ('notification_sent', False)), fields=['deadline'], name='task_reminder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servizio',
+            index=models.Index(condition=models.Q(('notification_sent', False)), fields=['data_ora'], name='servizio_reminder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servizio',
+            index=models.Index(condition=models.Q(('end_reminder_sent', False)), fields=['data_ora_fine'], name='servizio_end_reminder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servizio',
+            index=models.Index(condition=models.Q(('poll_closed', False), ('poll_message_id__isnull', False)), fields=['poll_close_date', 'data_ora'], name='servizio_open_poll_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
+from datetime import date, datetime, time, timedelta
 from uuid import uuid4
-from django.db import models
-from django.utils import timezone
 
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
 
 from volontario.models import Volontario
 
@@ -84,6 +88,25 @@ class Servizio(models.Model):
     class Meta:
         verbose_name = "Servizio"
         verbose_name_plural = "Servizi"
+        # Partial indexes for the reminder jobs (tg_bot.deadlines): each covers only
+        # the rows still waiting for that job, so they stay small as history grows.
+        indexes = [
+            models.Index(
+                fields=["data_ora"],
+                condition=models.Q(notification_sent=False),
+                name="servizio_reminder_idx",
+            ),
+            models.Index(
+                fields=["data_ora_fine"],
+                condition=models.Q(end_reminder_sent=False),
+                name="servizio_end_reminder_idx",
+            ),
+            models.Index(
+                fields=["poll_close_date", "data_ora"],
+                condition=models.Q(poll_closed=False, poll_message_id__isnull=False),
+                name="servizio_open_poll_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.nome} - {self.data_ora:%d/%m/%Y %H:%M}"
@@ -109,6 +132,14 @@ class ScheduledTask(models.Model):
         verbose_name = "Attivita Programmata"
         verbose_name_plural = "Attivita Programmate"
         ordering = ["deadline"]
+        indexes = [
+            # Open tasks still to be reminded of (tg_bot.deadlines).
+            models.Index(
+                fields=["deadline"],
+                condition=models.Q(notification_sent=False, completed=False),
+                name="task_reminder_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.nome} - scadenza {self.deadline:%d/%m/%Y %H:%M}"
@@ -143,6 +174,48 @@ class ChecklistItem(models.Model):
         return f"{self.descrizione} ({status})"
 
 
+class TimbraturaQuerySet(models.QuerySet):
+    def with_duration(self):
+        """Annotate ``durata`` (a timedelta, None while open), computed in SQL."""
+        return self.annotate(
+            durata=ExpressionWrapper(
+                F("clock_out") - F("clock_in"), output_field=DurationField()
+            )
+        )
+
+    def total_duration(self) -> timedelta:
+        """Total duration of the completed entries, as a single SUM query."""
+        return self.with_duration().aggregate(
+            totale=Sum("durata", default=timedelta())
+        )["totale"]
+
+    def clock_in(self, volontario, **links) -> tuple["Timbratura", bool]:
+        """Open an entry for ``volontario``, or return the one already open.
+
+        Returns ``(entry, created)``. Relies on the ``timbratura_one_open_entry``
+        constraint instead of checking first, so two concurrent clock-ins cannot
+        both create an entry. If the conflicting entry was closed before it could be
+        read, the insert is retried once; any other integrity error is re-raised.
+        """
+        retried = False
+        while True:
+            try:
+                with transaction.atomic():
+                    return self.create(fkvolontario=volontario, **links), True
+            except IntegrityError:
+                entry = self.filter(
+                    fkvolontario=volontario, clock_out__isnull=True
+                ).first()
+                if entry is not None:
+                    return entry, False
+                if retried:
+                    raise
+                retried = True
+
+    async def aclock_in(self, volontario, **links) -> tuple["Timbratura", bool]:
+        return await sync_to_async(self.clock_in)(volontario, **links)
+
+
 class Timbratura(models.Model):
     """Tracks volunteer clock in/out times."""
 
@@ -168,6 +241,8 @@ class Timbratura(models.Model):
     )
     checklist_message_id = models.BigIntegerField(null=True, blank=True)
 
+    objects = TimbraturaQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Registrazione Ore"
         verbose_name_plural = "Registrazioni Ore"
@@ -180,6 +255,24 @@ class Timbratura(models.Model):
                 ),
                 name="timbratura_single_link",
             ),
+            # At most one open entry per volunteer; also the index behind every
+            # "open entry of this volunteer" lookup.
+            models.UniqueConstraint(
+                fields=["fkvolontario"],
+                condition=models.Q(clock_out__isnull=True),
+                name="timbratura_one_open_entry",
+            ),
+        ]
+        indexes = [
+            # Volunteers still clocked in for given servizi (clock-out reminders).
+            models.Index(
+                fields=["fkservizio", "clock_out"], name="timbratura_servizio_idx"
+            ),
+            # Checklist messages to refresh for a task.
+            models.Index(
+                fields=["fkscheduled_task", "checklist_message_id"],
+                name="timbratura_task_msg_idx",
+            ),
         ]
 
     def __str__(self) -> str:
@@ -197,3 +290,137 @@ class Timbratura(models.Model):
             return None
         delta = self.clock_out - self.clock_in
         return delta.total_seconds() / 60
+
+
+class RiepilogoOre(models.Model):
+    """Completed hours per volunteer, month and servizio type.
+
+    Maintained by the Timbratura signals (see :func:`aggiorna_riepilogo_ore`) and
+    rebuilt from scratch by the ``rebuild_riepilogo_ore`` command. Entries without a
+    servizio type are grouped under ``fkservizio_type=None``.
+    """
+
+    pkid = models.UUIDField(default=uuid4, primary_key=True)
+    fkvolontario = models.ForeignKey(
+        Volontario, on_delete=models.CASCADE, related_name="riepiloghi_ore"
+    )
+    mese = models.DateField(help_text="Primo giorno del mese (ora locale)")
+    fkservizio_type = models.ForeignKey(
+        ServizioType, on_delete=models.CASCADE, null=True, blank=True
+    )
+    minuti = models.PositiveIntegerField(default=0)
+    sessioni = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Riepilogo Ore"
+        verbose_name_plural = "Riepiloghi Ore"
+        ordering = ["-mese"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["fkvolontario", "mese", "fkservizio_type"],
+                name="riepilogo_ore_unique",
+            ),
+            # NULLs are distinct in unique indexes: untyped rows need their own.
+            models.UniqueConstraint(
+                fields=["fkvolontario", "mese"],
+                condition=models.Q(fkservizio_type__isnull=True),
+                name="riepilogo_ore_unique_untyped",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["mese", "fkservizio_type"], name="riepilogo_ore_mese_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.fkvolontario} - {self.mese:%m/%Y} ({self.minuti} min)"
+
+
+def mese_di(dt: datetime) -> date:
+    """First day of the local month ``dt`` falls in."""
+    return timezone.localtime(dt).date().replace(day=1)
+
+
+def _limiti_mese(mese: date) -> tuple[datetime, datetime]:
+    successivo = (mese.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return (
+        timezone.make_aware(datetime.combine(mese, time.min)),
+        timezone.make_aware(datetime.combine(successivo, time.min)),
+    )
+
+
+def _totali_timbrature(queryset):
+    """Group completed entries of ``queryset`` by servizio type, with duration and count."""
+    return (
+        queryset.filter(clock_out__isnull=False)
+        .order_by()
+        .with_duration()
+        .annotate(tipo=Coalesce("fkservizio__type", "fkscheduled_task__type"))
+    )
+
+
+def _riga(volontario_id, mese, tipo, durata, sessioni) -> RiepilogoOre:
+    minuti = max(int(durata.total_seconds() // 60), 0) if durata else 0
+    return RiepilogoOre(
+        fkvolontario_id=volontario_id,
+        mese=mese,
+        fkservizio_type_id=tipo,
+        minuti=minuti,
+        sessioni=sessioni,
+    )
+
+
+def aggiorna_riepilogo_ore(volontario_id, mese: date) -> None:
+    """Recompute the RiepilogoOre rows of one volunteer for one month.
+
+    Only that volunteer's entries for the month are read, so the cost does not grow
+    with the size of the table.
+    """
+    inizio, fine = _limiti_mese(mese)
+    totali = (
+        _totali_timbrature(
+            Timbratura.objects.filter(
+                fkvolontario_id=volontario_id, clock_in__gte=inizio, clock_in__lt=fine
+            )
+        )
+        .values("tipo")
+        .annotate(totale=Sum("durata"), n=Count("pk"))
+    )
+    righe = [
+        _riga(volontario_id, mese, row["tipo"], row["totale"], row["n"])
+        for row in totali
+    ]
+    with transaction.atomic():
+        RiepilogoOre.objects.filter(fkvolontario_id=volontario_id, mese=mese).delete()
+        RiepilogoOre.objects.bulk_create(righe)
+
+
+def aggiorna_riepilogo_ore_timbrature(timbrature) -> None:
+    """Recompute the RiepilogoOre rows the completed entries of ``timbrature`` count towards."""
+    chiavi = {
+        (volontario_id, mese_di(clock_in))
+        for volontario_id, clock_in in timbrature.filter(
+            clock_out__isnull=False
+        ).values_list("fkvolontario_id", "clock_in")
+    }
+    for volontario_id, mese in chiavi:
+        aggiorna_riepilogo_ore(volontario_id, mese)
+
+
+def ricostruisci_riepilogo_ore() -> int:
+    """Rebuild the whole RiepilogoOre table from Timbratura. Returns the rows created."""
+    totali = (
+        _totali_timbrature(Timbratura.objects.all())
+        .annotate(mese=TruncMonth("clock_in", output_field=models.DateField()))
+        .values("fkvolontario_id", "mese", "tipo")
+        .annotate(totale=Sum("durata"), n=Count("pk"))
+    )
+    righe = [
+        _riga(row["fkvolontario_id"], row["mese"], row["tipo"], row["totale"], row["n"])
+        for row in totali
+    ]
+    with transaction.atomic():
+        RiepilogoOre.objects.all().delete()
+        RiepilogoOre.objects.bulk_create(righe, batch_size=1000)
+    return len(righe)
@@ -1,18 +1,40 @@
-import asyncio
 import logging
 
 from django.conf import settings
-from django.db import transaction
-from django.db.models.signals import post_save, pre_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from telegram import Bot
-
-from .models import ChecklistItem, ChecklistTemplateItem, ScheduledTask, Servizio
+from telegram.error import BadRequest
+
+from tg_bot import client as telegram_client
+from tg_bot import tasks
+
+from .models import (
+    ChecklistItem,
+    ChecklistTemplateItem,
+    ScheduledTask,
+    Servizio,
+    Timbratura,
+    aggiorna_riepilogo_ore,
+    aggiorna_riepilogo_ore_timbrature,
+    mese_di,
+)
 
 logger = logging.getLogger(__name__)
 
 
-async def _send_poll(servizio_nome, servizio_data_ora):
+def poll_kwargs(chat_id, thread_id, servizio_nome, servizio_data_ora) -> dict:
+    """Arguments of the ``send_poll`` call for a servizio's availability poll."""
+    return {
+        "chat_id": chat_id,
+        "message_thread_id": thread_id,
+        "question": f"📢 {servizio_nome} - {servizio_data_ora:%d/%m/%Y %H:%M}\nSei disponibile?",
+        "options": ["✅ Sì", "❌ No"],
+        "is_anonymous": False,
+        "allows_multiple_answers": False,
+    }
+
+
+def _send_poll(servizio_nome, servizio_data_ora):
     """Send a native Telegram poll to the configured group chat. Returns (poll_id, message_id)."""
     chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
     token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
@@ -26,32 +48,37 @@ async def _send_poll(servizio_nome, servizio_data_ora):
         logger.warning("TELEGRAM_BOT_TOKEN not configured, skipping poll")
         return None, None
 
-    bot = Bot(token=token)
-
-    async with bot:
-        message = await bot.send_poll(
-            chat_id=chat_id,
-            message_thread_id=thread_id,
-            question=f"📢 {servizio_nome} - {servizio_data_ora:%d/%m/%Y %H:%M}\nSei disponibile?",
-            options=["✅ Sì", "❌ No"],
-            is_anonymous=False,
-            allows_multiple_answers=False,
+    message = telegram_client.run(
+        lambda bot: bot.send_poll(
+            **poll_kwargs(chat_id, thread_id, servizio_nome, servizio_data_ora)
         )
+    )
 
     return message.poll.id, message.message_id
 
 
 def send_availability_poll(servizio: Servizio) -> None:
-    """Send availability poll and update the servizio with poll info."""
+    """Queue the availability poll for the servizio."""
+    if servizio.poll_id:
+        logger.info(f"Servizio {servizio.pkid} already has poll_id, skipping")
+        return
+
+    tasks.enqueue(send_availability_poll_now, servizio_id=servizio.pkid)
+
+
+def send_availability_poll_now(servizio_id: int) -> None:
+    """Background task: send the availability poll and store its ids on the servizio."""
+    servizio = Servizio.objects.filter(pk=servizio_id).first()
+    if servizio is None:
+        logger.info(f"Servizio {servizio_id} no longer exists, skipping poll")
+        return
     if servizio.poll_id:
         logger.info(f"Servizio {servizio.pkid} already has poll_id, skipping")
         return
 
-    # Send the poll (async)
-    poll_id, message_id = asyncio.run(_send_poll(servizio.nome, servizio.data_ora))
+    poll_id, message_id = _send_poll(servizio.nome, servizio.data_ora)
 
     if poll_id:
-        # Update the database after the async call completes
         Servizio.objects.filter(pk=servizio.pkid).update(
             poll_id=poll_id,
             poll_message_id=message_id,
@@ -67,7 +94,7 @@ def send_availability_poll(servizio: Servizio) -> None:
 POLL_CONTENT_FIELDS = ("nome", "data_ora")
 
 
-async def _send_poll_update(text, reply_to_message_id):
+def _send_poll_update(text, reply_to_message_id):
     """Post a text message replying to (quoting) an existing poll message."""
     chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
     token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
@@ -81,18 +108,18 @@ async def _send_poll_update(text, reply_to_message_id):
         logger.warning("TELEGRAM_BOT_TOKEN not configured, skipping poll update")
         return
 
-    bot = Bot(token=token)
-    async with bot:
-        await bot.send_message(
+    telegram_client.run(
+        lambda bot: bot.send_message(
             chat_id=chat_id,
             message_thread_id=thread_id,
             text=text,
             reply_to_message_id=reply_to_message_id,
         )
+    )
 
 
 def notify_poll_update(servizio: Servizio, poll_message_id: int) -> None:
-    """Post a follow-up quoting the poll message with the servizio's updated details.
+    """Queue a follow-up quoting the poll message with the servizio's updated details.
 
     Telegram does not allow editing a poll's question, so rather than re-creating the
     poll (which would discard existing votes) we reply to it announcing the new data.
@@ -103,16 +130,26 @@ def notify_poll_update(servizio: Servizio, poll_message_id: int) -> None:
         )
         return
 
+    tasks.enqueue(
+        notify_poll_update_now,
+        servizio_id=servizio.pkid,
+        poll_message_id=poll_message_id,
+    )
+
+
+def notify_poll_update_now(servizio_id: int, poll_message_id: int) -> None:
+    """Background task: post the poll update with the servizio's current details."""
+    servizio = Servizio.objects.filter(pk=servizio_id).first()
+    if servizio is None:
+        logger.info(f"Servizio {servizio_id} no longer exists, skipping poll update")
+        return
+
     text = (
         "✏️ Attenzione, i dettagli sono cambiati:\n"
         f"📢 {servizio.nome} - {servizio.data_ora:%d/%m/%Y %H:%M}"
     )
-
-    try:
-        asyncio.run(_send_poll_update(text, poll_message_id))
-        logger.info(f"Posted update for servizio {servizio.pkid} poll")
-    except Exception as e:
-        logger.error(f"Failed to post update for servizio {servizio.pkid}: {e}")
+    _send_poll_update(text, poll_message_id)
+    logger.info(f"Posted update for servizio {servizio.pkid} poll")
 
 
 @receiver(pre_save, sender=Servizio)
@@ -130,8 +167,8 @@ def servizio_created(sender, instance, created, **kwargs):
     if created:
         if not instance.poll_id and instance.send_message:
             logger.info(f"New servizio created: {instance.nome}, sending poll")
-            # Use on_commit to ensure the transaction is complete before sending
-            transaction.on_commit(lambda: send_availability_poll(instance))
+            # Queued in the same transaction, so the poll is sent only if it commits
+            send_availability_poll(instance)
         return
 
     previous = getattr(instance, "_pre_save_instance", None)
@@ -141,7 +178,7 @@ def servizio_created(sender, instance, created, **kwargs):
     # send_message was just turned on and no poll exists yet: send a fresh poll.
     if instance.send_message and not previous.send_message and not instance.poll_id:
         logger.info(f"send_message enabled for servizio {instance.pkid}, sending poll")
-        transaction.on_commit(lambda: send_availability_poll(instance))
+        send_availability_poll(instance)
         return
 
     # Poll content changed while an open poll exists: post a follow-up update.
@@ -151,34 +188,146 @@ def servizio_created(sender, instance, created, **kwargs):
     )
     if instance.poll_id and not instance.poll_closed and content_changed:
         logger.info(f"Servizio {instance.pkid} details changed, posting poll update")
-        poll_message_id = instance.poll_message_id
-        transaction.on_commit(lambda: notify_poll_update(instance, poll_message_id))
+        notify_poll_update(instance, instance.poll_message_id)
 
 
-async def _delete_poll_message(chat_id, message_id):
+def _delete_poll_message(chat_id, message_id):
     """Delete a poll message from Telegram."""
     token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
     if not token:
         logger.warning("TELEGRAM_BOT_TOKEN not configured, cannot delete message")
         return
 
-    bot = Bot(token=token)
-    async with bot:
-        await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    telegram_client.run(
+        lambda bot: bot.delete_message(chat_id=chat_id, message_id=message_id)
+    )
 
 
 def delete_poll_message(message_id: int) -> None:
-    """Delete the poll message from Telegram."""
+    """Queue deletion of the poll message from Telegram."""
     chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
     if not chat_id:
         logger.warning("TELEGRAM_SURVEY_CHAT_ID not configured, cannot delete message")
         return
 
-    try:
-        asyncio.run(_delete_poll_message(chat_id, message_id))
-        logger.info(f"Deleted poll message {message_id}")
-    except Exception as e:
-        logger.error(f"Failed to delete poll message {message_id}: {e}")
+    tasks.enqueue(delete_poll_message_now, chat_id=chat_id, message_id=message_id)
+
+
+def delete_poll_message_now(chat_id, message_id: int) -> None:
+    """Background task: delete a poll message."""
+    _delete_poll_message(chat_id, message_id)
+    logger.info(f"Deleted poll message {message_id}")
+
+
+def _raise_failures(action: str, failures: dict) -> None:
+    """Fail the task with one line per servizio whose Telegram call failed.
+
+    The summary ends up in the task's ``last_error``. The task is retried unless
+    every failure is permanent (e.g. a message that no longer exists).
+    """
+    if not failures:
+        return
+    summary = f"{action} failed for {len(failures)} servizi: " + "; ".join(
+        f"{servizio.nome} ({servizio.pkid}): {error!r}"
+        for servizio, error in failures.items()
+    )
+    if all(isinstance(error, tasks.PERMANENT_ERRORS) for error in failures.values()):
+        raise BadRequest(summary)
+    raise RuntimeError(summary)
+
+
+def close_polls_now(servizio_ids: list) -> None:
+    """Background task: stop the polls of several servizi in one concurrent batch.
+
+    Servizi whose poll is already closed are skipped, so a retry only repeats the
+    calls that failed.
+    """
+    chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
+    if not chat_id:
+        logger.warning("TELEGRAM_SURVEY_CHAT_ID not configured, cannot close polls")
+        return
+    servizi = list(
+        Servizio.objects.filter(
+            pk__in=servizio_ids, poll_message_id__isnull=False, poll_closed=False
+        )
+    )
+
+    results = telegram_client.run_many(
+        [
+            lambda bot, message_id=servizio.poll_message_id: bot.stop_poll(
+                chat_id=chat_id, message_id=message_id
+            )
+            for servizio in servizi
+        ]
+    )
+    closed, failures = [], {}
+    for servizio, result in zip(servizi, results, strict=True):
+        if isinstance(result, Exception):
+            failures[servizio] = result
+        else:
+            closed.append(servizio.pkid)
+    Servizio.objects.filter(pk__in=closed).update(poll_closed=True)
+    logger.info(f"Closed {len(closed)} of {len(servizi)} polls")
+    _raise_failures("Closing polls", failures)
+
+
+def resend_polls_now(polls: dict) -> None:
+    """Background task: send fresh polls for several servizi in one concurrent batch.
+
+    ``polls`` maps each servizio id to the poll id it had when the resend was
+    requested; a servizio whose poll changed since (e.g. already resent by an
+    earlier attempt of this task) is skipped. The old messages are deleted only
+    once the new polls are sent and stored, so a failed send leaves the servizio
+    with its original, still-working poll.
+    """
+    chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
+    thread_id = getattr(settings, "TELEGRAM_SURVEY_THREAD_ID", None)
+    if not chat_id:
+        logger.warning("TELEGRAM_SURVEY_CHAT_ID not configured, cannot resend polls")
+        return
+    servizi = [
+        servizio
+        for servizio in Servizio.objects.filter(pk__in=polls)
+        if servizio.poll_id == polls[str(servizio.pkid)]
+    ]
+
+    results = telegram_client.run_many(
+        [
+            lambda bot, servizio=servizio: bot.send_poll(
+                **poll_kwargs(chat_id, thread_id, servizio.nome, servizio.data_ora)
+            )
+            for servizio in servizi
+        ]
+    )
+    old_message_ids, failures = [], {}
+    for servizio, result in zip(servizi, results, strict=True):
+        if isinstance(result, Exception):
+            failures[servizio] = result
+            continue
+        Servizio.objects.filter(pk=servizio.pkid).update(
+            poll_id=result.poll.id,
+            poll_message_id=result.message_id,
+            poll_closed=False,
+        )
+        if servizio.poll_message_id:
+            old_message_ids.append(servizio.poll_message_id)
+    logger.info(f"Resent {len(servizi) - len(failures)} of {len(servizi)} polls")
+
+    deleted = telegram_client.run_many(
+        [
+            lambda bot, message_id=message_id: bot.delete_message(
+                chat_id=chat_id, message_id=message_id
+            )
+            for message_id in old_message_ids
+        ]
+    )
+    for message_id, result in zip(old_message_ids, deleted, strict=True):
+        if isinstance(result, tasks.PERMANENT_ERRORS):
+            logger.info(f"Old poll message {message_id} already gone: {result}")
+        elif isinstance(result, Exception):
+            delete_poll_message(message_id)
+
+    _raise_failures("Resending polls", failures)
 
 
 @receiver(post_save, sender=ScheduledTask)
@@ -217,3 +366,70 @@ def servizio_deleted(sender, instance, **kwargs):
             f"Servizio {instance.pkid} deleted, removing poll message {instance.poll_message_id}"
         )
         delete_poll_message(instance.poll_message_id)
+
+
+# Fields deciding which RiepilogoOre rows an entry counts towards.
+RIEPILOGO_KEY_FIELDS = {"fkvolontario", "fkvolontario_id", "clock_in"}
+
+
+@receiver(pre_save, sender=Timbratura)
+def pre_timbratura_saved(sender, instance, update_fields=None, **kwargs) -> None:
+    """Remember the volunteer/month the entry counted towards before this save."""
+    instance._pre_save_riepilogo = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not RIEPILOGO_KEY_FIELDS & set(update_fields):
+        return
+    previous = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("fkvolontario_id", "clock_in")
+        .first()
+    )
+    if previous is not None:
+        instance._pre_save_riepilogo = (previous[0], mese_di(previous[1]))
+
+
+@receiver(post_save, sender=Timbratura)
+def timbratura_saved(sender, instance, created, **kwargs) -> None:
+    """Keep RiepilogoOre up to date on clock-out and on edits of an entry."""
+    if created and instance.clock_out is None:
+        return  # A clock-in: nothing completed yet.
+    keys = {(instance.fkvolontario_id, mese_di(instance.clock_in))}
+    previous = getattr(instance, "_pre_save_riepilogo", None)
+    if previous is not None:
+        keys.add(previous)
+    for volontario_id, mese in keys:
+        aggiorna_riepilogo_ore(volontario_id, mese)
+
+
+@receiver(post_delete, sender=Timbratura)
+def timbratura_deleted(sender, instance, **kwargs) -> None:
+    if instance.clock_out is not None:
+        aggiorna_riepilogo_ore(instance.fkvolontario_id, mese_di(instance.clock_in))
+
+
+@receiver(post_save, sender=Servizio)
+def servizio_type_changed(sender, instance, created, **kwargs) -> None:
+    """Move the servizio's hours to the new type in RiepilogoOre."""
+    previous = getattr(instance, "_pre_save_instance", None)
+    if created or previous is None or previous.type_id == instance.type_id:
+        return
+    aggiorna_riepilogo_ore_timbrature(Timbratura.objects.filter(fkservizio=instance))
+
+
+@receiver(pre_save, sender=ScheduledTask)
+def pre_scheduled_task_saved(sender, instance, **kwargs) -> None:
+    """Remember the task's type before this save."""
+    instance._pre_save_type_id = (
+        sender.objects.filter(pk=instance.pk).values_list("type_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=ScheduledTask)
+def scheduled_task_type_changed(sender, instance, created, **kwargs) -> None:
+    """Move the task's hours to the new type in RiepilogoOre."""
+    if created or getattr(instance, "_pre_save_type_id", None) == instance.type_id:
+        return
+    aggiorna_riepilogo_ore_timbrature(
+        Timbratura.objects.filter(fkscheduled_task=instance)
+    )
@@ -1,10 +1,33 @@
-from datetime import timedelta
-from unittest.mock import patch
+import asyncio
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from django.test import TestCase
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
+from telegram.error import NetworkError
 
-from .models import Servizio
+from magazzino.models import Dotazione, RequisitoServizioType, TipoDotazione
+from tg_bot import client, tasks
+from tg_bot.models import BackgroundTask
+from volontario.models import Volontario
+
+from .models import (
+    RiepilogoOre,
+    ScheduledTask,
+    Servizio,
+    ServizioType,
+    Timbratura,
+    TimbraturaQuerySet,
+    VolontarioServizioMap,
+)
 
 
 class ServizioPollSignalTests(TestCase):
@@ -135,3 +158,670 @@ class ServizioPollSignalTests(TestCase):
 
         mock_send.assert_not_called()
         mock_notify.assert_not_called()
+
+
+class ServizioPollTaskTests(TestCase):
+    """The poll signals queue background tasks instead of calling Telegram inline."""
+
+    def setUp(self):
+        self.data_ora = timezone.now() + timedelta(days=1)
+
+    @patch("servizio.signals._send_poll", return_value=("poll-1", 42))
+    def test_poll_is_sent_by_background_task(self, mock_send_poll):
+        servizio = Servizio.objects.create(
+            nome="Servizio A", data_ora=self.data_ora, send_message=True
+        )
+        mock_send_poll.assert_not_called()
+        self.assertEqual(BackgroundTask.objects.count(), 1)
+
+        tasks.run_pending()
+
+        mock_send_poll.assert_called_once_with("Servizio A", servizio.data_ora)
+        servizio.refresh_from_db()
+        self.assertEqual(servizio.poll_id, "poll-1")
+        self.assertEqual(servizio.poll_message_id, 42)
+
+    @override_settings(TELEGRAM_SURVEY_CHAT_ID="-100")
+    @patch("servizio.signals._delete_poll_message")
+    def test_delete_queues_poll_message_removal(self, mock_delete):
+        servizio = Servizio.objects.create(
+            nome="Servizio A",
+            data_ora=self.data_ora,
+            send_message=False,
+            poll_id="poll-1",
+            poll_message_id=42,
+        )
+
+        servizio.delete()
+        mock_delete.assert_not_called()
+
+        tasks.run_pending()
+        mock_delete.assert_called_once_with("-100", 42)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="token", TELEGRAM_SURVEY_CHAT_ID="-100")
+class ServizioPollAdminActionTests(TestCase):
+    """Bulk poll actions queue one background task per servizio."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(self.user)
+        self.data_ora = timezone.now() + timedelta(days=1)
+        self.servizi = [
+            Servizio.objects.create(
+                nome=f"Servizio {i}",
+                data_ora=self.data_ora,
+                send_message=True,
+                poll_id=f"poll-{i}",
+                poll_message_id=100 + i,
+            )
+            for i in range(3)
+        ]
+
+        self.bot = MagicMock()
+        self.bot.initialize = AsyncMock()
+        self.bot.shutdown = AsyncMock()
+        self.bot.stop_poll = AsyncMock()
+        self.bot.delete_message = AsyncMock(return_value=True)
+        self.bot.send_poll = AsyncMock()
+        bot_client = client.BotClient("token")
+        self.addCleanup(bot_client.close)
+        for patcher in [
+            patch.object(client, "Bot", return_value=self.bot),
+            patch.object(client, "get_client", return_value=bot_client),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run_action(self, action, servizi):
+        return self.client.post(
+            reverse("admin:servizio_servizio_changelist"),
+            {"action": action, "_selected_action": [s.pkid for s in servizi]},
+            follow=True,
+        )
+
+    def test_close_polls(self):
+        async def stop_poll(chat_id, message_id):
+            if message_id == 101:
+                raise NetworkError("timeout")
+
+        self.bot.stop_poll.side_effect = stop_poll
+
+        response = self._run_action("close_polls", self.servizi)
+
+        self.bot.stop_poll.assert_not_awaited()
+        self.assertContains(response, "Chiusura dei sondaggi avviata: 3 servizi.")
+        task = BackgroundTask.objects.get()
+
+        tasks.run_pending()
+
+        self.assertEqual(self.bot.stop_poll.await_count, 3)
+        self.assertEqual(Servizio.objects.filter(poll_closed=True).count(), 2)
+        # One task for the batch; its error names the servizio that failed, and
+        # the retry only repeats that call.
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.PENDING)
+        self.assertIn("Servizio 1", task.last_error)
+        self.assertNotIn("Servizio 0", task.last_error)
+
+        self.bot.stop_poll.side_effect = None
+        BackgroundTask.objects.update(next_attempt_at=timezone.now())
+        tasks.run_pending()
+        self.assertEqual(self.bot.stop_poll.await_count, 4)
+        self.assertEqual(Servizio.objects.filter(poll_closed=True).count(), 3)
+
+    def test_close_polls_runs_calls_concurrently(self):
+        in_flight = []
+        peak = []
+
+        async def stop_poll(chat_id, message_id):
+            in_flight.append(message_id)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(message_id)
+
+        self.bot.stop_poll.side_effect = stop_poll
+
+        self._run_action("close_polls", self.servizi)
+        tasks.run_pending()
+
+        self.assertEqual(max(peak), 3)
+
+    def test_delete_selected_queues_poll_removal(self):
+        Timbratura.objects.create(
+            fkvolontario=Volontario.objects.create(
+                codice_fiscale="RSSMRA90A01H501W", nome="Mario", cognome="Rossi"
+            ),
+            fkservizio=self.servizi[0],
+            clock_out=timezone.now(),
+        )
+        url = reverse("admin:servizio_servizio_changelist")
+        data = {
+            "action": "delete_selected",
+            "_selected_action": [s.pkid for s in self.servizi],
+        }
+
+        # Servizi with time entries are protected: the confirmation page says so.
+        response = self.client.post(url, data)
+        self.assertTrue(response.context["protected"])
+        self.assertEqual(Servizio.objects.count(), 3)
+
+        data["_selected_action"] = [s.pkid for s in self.servizi[1:]]
+        self.client.post(url, {**data, "post": "yes"})
+        self.assertEqual(Servizio.objects.count(), 1)
+
+        tasks.run_pending()
+        self.assertEqual(
+            sorted(
+                call.kwargs["message_id"]
+                for call in self.bot.delete_message.await_args_list
+            ),
+            [101, 102],
+        )
+
+    def test_resend_polls(self):
+        self.bot.send_poll.side_effect = [
+            MagicMock(message_id=200 + i, poll=MagicMock(id=f"new-{i}"))
+            for i in range(3)
+        ]
+
+        response = self._run_action("resend_polls", self.servizi)
+
+        self.bot.send_poll.assert_not_awaited()
+        self.assertContains(response, "Reinvio dei sondaggi avviato: 3 servizi.")
+
+        tasks.run_pending()
+
+        self.assertEqual(self.bot.send_poll.await_count, 3)
+        self.assertEqual(self.bot.delete_message.await_count, 3)
+        self.assertEqual(
+            sorted(Servizio.objects.values_list("poll_message_id", flat=True)),
+            [200, 201, 202],
+        )
+        self.assertEqual(
+            BackgroundTask.objects.get().status, BackgroundTask.Status.DONE
+        )
+
+    def test_resend_keeps_old_poll_when_send_fails(self):
+        async def send_poll(question, **kwargs):
+            if "Servizio 1" in question:
+                raise NetworkError("timeout")
+            return MagicMock(message_id=200, poll=MagicMock(id="new-0"))
+
+        self.bot.send_poll.side_effect = send_poll
+
+        self._run_action("resend_polls", self.servizi[:2])
+        tasks.run_pending()
+
+        self.bot.delete_message.assert_awaited_once_with(chat_id="-100", message_id=100)
+        self.servizi[1].refresh_from_db()
+        self.assertEqual(self.servizi[1].poll_message_id, 101)
+        self.assertEqual(self.servizi[1].poll_id, "poll-1")
+
+        # The retry resends only the poll that failed.
+        self.bot.send_poll.side_effect = [
+            MagicMock(message_id=201, poll=MagicMock(id="new-1"))
+        ]
+        BackgroundTask.objects.update(next_attempt_at=timezone.now())
+        tasks.run_pending()
+        self.assertEqual(self.bot.send_poll.await_count, 3)
+        self.assertEqual(
+            sorted(Servizio.objects.values_list("poll_message_id", flat=True)),
+            [102, 200, 201],
+        )
+
+    def test_resend_skips_disabled_and_past_servizi(self):
+        Servizio.objects.filter(pk=self.servizi[0].pkid).update(send_message=False)
+        Servizio.objects.filter(pk=self.servizi[1].pkid).update(
+            data_ora=timezone.now() - timedelta(hours=1)
+        )
+
+        response = self._run_action("resend_polls", self.servizi)
+
+        self.assertContains(response, "Reinvio dei sondaggi avviato: 1 servizi.")
+        self.assertContains(response, "2 servizi saltati")
+        task = BackgroundTask.objects.get()
+        self.assertEqual(list(task.kwargs["polls"]), [str(self.servizi[2].pkid)])
+
+
+class VolontarioServizioMapAdminTests(TestCase):
+    """The changelist computes idoneità without per-row queries."""
+
+    CFS = ["RSSMRA90A01H501W", "BNCLGU85M10F205B", "VRDGPP80A01L219M"]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(self.user)
+        self.url = reverse("admin:servizio_volontarioserviziomap_changelist")
+        self.tipo = ServizioType.objects.create(nome="Antincendio")
+        casco = TipoDotazione.objects.create(nome="Casco")
+        RequisitoServizioType.objects.create(
+            servizio_type=self.tipo, tipo_dotazione=casco
+        )
+        self.volontari = [
+            Volontario.objects.create(
+                codice_fiscale=cf, nome=f"Nome{i}", cognome="Test"
+            )
+            for i, cf in enumerate(self.CFS)
+        ]
+        Dotazione.objects.create(
+            volontario=self.volontari[0],
+            tipo=casco,
+            data_assegnazione=timezone.now().date(),
+        )
+
+    def _add_rows(self, servizio_type):
+        servizio = Servizio.objects.create(
+            nome="Presidio",
+            data_ora=timezone.now() + timedelta(days=1),
+            type=servizio_type,
+            send_message=False,
+        )
+        for volontario in self.volontari:
+            VolontarioServizioMap.objects.create(
+                fkvolontario=volontario, fkservizio=servizio
+            )
+
+    def _changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self._add_rows(self.tipo)
+        _, few = self._changelist_queries()
+
+        for _ in range(3):
+            self._add_rows(self.tipo)
+            self._add_rows(None)
+        response, many = self._changelist_queries()
+
+        self.assertEqual(many, few)
+        idonei = {
+            (obj.fkvolontario_id, obj.fkservizio.type_id, obj.idoneo)
+            for obj in response.context["cl"].result_list
+        }
+        self.assertIn((self.volontari[0].pk, self.tipo.pk, True), idonei)
+        self.assertIn((self.volontari[1].pk, self.tipo.pk, False), idonei)
+        self.assertIn((self.volontari[1].pk, None, True), idonei)
+
+
+class ServizioChangelistCountTests(TestCase):
+    """Volunteer counts come from annotations, not one COUNT per row."""
+
+    CFS = ["RSSMRA90A01H501W", "BNCLGU85M10F205B", "VRDGPP80A01L219M"]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(self.user)
+        self.tipo = ServizioType.objects.create(nome="Presidio")
+        self.volontari = [
+            Volontario.objects.create(
+                codice_fiscale=cf, nome=f"Nome{i}", cognome="Test"
+            )
+            for i, cf in enumerate(self.CFS)
+        ]
+
+    def _add_servizio(self):
+        servizio = Servizio.objects.create(
+            nome="Presidio",
+            data_ora=timezone.now() + timedelta(days=1),
+            type=self.tipo,
+            send_message=False,
+        )
+        risposte = [
+            VolontarioServizioMap.Risposta.SI,
+            VolontarioServizioMap.Risposta.NO,
+            None,
+        ]
+        for volontario, risposta in zip(self.volontari, risposte):
+            VolontarioServizioMap.objects.create(
+                fkvolontario=volontario, fkservizio=servizio, risposta=risposta
+            )
+        return servizio
+
+    def _add_task(self):
+        task = ScheduledTask.objects.create(
+            nome="Controllo mezzi",
+            type=self.tipo,
+            deadline=timezone.now() + timedelta(days=1),
+        )
+        task.volontari.set(self.volontari[:2])
+        return task
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_servizio_changelist_query_count_is_constant(self):
+        url = reverse("admin:servizio_servizio_changelist")
+        self._add_servizio()
+        _, few = self._queries(url)
+
+        for _ in range(5):
+            self._add_servizio()
+        response, many = self._queries(url)
+
+        self.assertEqual(many, few)
+        servizio = response.context["cl"].result_list[0]
+        self.assertEqual(
+            (
+                servizio.n_volontari,
+                servizio.n_si,
+                servizio.n_no,
+                servizio.n_in_attesa,
+            ),
+            (3, 1, 1, 1),
+        )
+
+    def test_servizio_changelist_sorts_by_count(self):
+        self._add_servizio()
+        Servizio.objects.create(
+            nome="Vuoto", data_ora=timezone.now(), send_message=False
+        )
+        url = reverse("admin:servizio_servizio_changelist")
+        # list_display also has the action checkbox in column 0.
+        column = (
+            self.client.get(url).context["cl"].list_display.index("volontari_count")
+        )
+
+        response = self.client.get(url, {"o": str(column)})
+
+        self.assertEqual(
+            [s.nome for s in response.context["cl"].result_list],
+            ["Vuoto", "Presidio"],
+        )
+
+    def test_scheduled_task_changelist_query_count_is_constant(self):
+        url = reverse("admin:servizio_scheduledtask_changelist")
+        self._add_task()
+        _, few = self._queries(url)
+
+        for _ in range(5):
+            self._add_task()
+        response, many = self._queries(url)
+
+        self.assertEqual(many, few)
+        self.assertEqual(response.context["cl"].result_list[0].n_volontari, 2)
+
+
+class RiepilogoOreTests(TestCase):
+    """The monthly rollup follows clock-outs, edits and deletions of Timbratura."""
+
+    def setUp(self):
+        self.volontario = Volontario.objects.create(
+            codice_fiscale="RSSMRA90A01H501W", nome="Mario", cognome="Rossi"
+        )
+        self.tipo = ServizioType.objects.create(nome="Presidio")
+        self.servizio = Servizio.objects.create(
+            nome="Presidio",
+            data_ora=self._local(2026, 3, 10, 8),
+            type=self.tipo,
+            send_message=False,
+        )
+
+    def _local(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def _entry(self, clock_in, minutes, **kwargs):
+        return Timbratura.objects.create(
+            fkvolontario=self.volontario,
+            clock_in=clock_in,
+            clock_out=clock_in + timedelta(minutes=minutes) if minutes else None,
+            **kwargs,
+        )
+
+    def _rows(self):
+        return {
+            (r.mese, r.fkservizio_type_id): (r.minuti, r.sessioni)
+            for r in RiepilogoOre.objects.all()
+        }
+
+    def test_open_entry_is_not_counted_until_clock_out(self):
+        entry = self._entry(self._local(2026, 3, 10, 8), None)
+        self.assertEqual(self._rows(), {})
+
+        entry.clock_out = entry.clock_in + timedelta(minutes=90)
+        entry.save(update_fields=["clock_out"])
+
+        self.assertEqual(self._rows(), {(date(2026, 3, 1), None): (90, 1)})
+
+    def test_groups_by_servizio_type(self):
+        self._entry(self._local(2026, 3, 10, 8), 60, fkservizio=self.servizio)
+        self._entry(self._local(2026, 3, 11, 8), 30, fkservizio=self.servizio)
+        self._entry(self._local(2026, 3, 12, 8), 45)
+
+        self.assertEqual(
+            self._rows(),
+            {
+                (date(2026, 3, 1), self.tipo.pk): (90, 2),
+                (date(2026, 3, 1), None): (45, 1),
+            },
+        )
+
+    def test_month_is_local(self):
+        # 00:30 in Rome on April 1st is still March 31st in UTC.
+        self._entry(self._local(2026, 4, 1, 0, 30), 60)
+
+        self.assertEqual(self._rows(), {(date(2026, 4, 1), None): (60, 1)})
+
+    def test_moving_entry_updates_both_months(self):
+        entry = self._entry(self._local(2026, 3, 10, 8), 60)
+
+        entry.clock_in = self._local(2026, 2, 10, 8)
+        entry.clock_out = entry.clock_in + timedelta(minutes=120)
+        entry.save()
+
+        self.assertEqual(self._rows(), {(date(2026, 2, 1), None): (120, 1)})
+
+    def test_delete_removes_hours(self):
+        keep = self._entry(self._local(2026, 3, 10, 8), 60)
+        self._entry(self._local(2026, 3, 11, 8), 30).delete()
+
+        self.assertEqual(self._rows(), {(date(2026, 3, 1), None): (60, 1)})
+        keep.delete()
+        self.assertEqual(self._rows(), {})
+
+    def test_rebuild_matches_incremental(self):
+        self._entry(self._local(2026, 3, 10, 8), 60, fkservizio=self.servizio)
+        self._entry(self._local(2026, 3, 12, 8), 45)
+        self._entry(self._local(2026, 4, 1, 0, 30), 61)
+        self._entry(self._local(2026, 4, 2, 8), None)
+        incremental = self._rows()
+        # Bulk updates bypass the signals, leaving the rollup stale.
+        Timbratura.objects.update(notes="x")
+        RiepilogoOre.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_riepilogo_ore", stdout=out)
+
+        self.assertEqual(self._rows(), incremental)
+        self.assertIn("Creati 3 riepiloghi", out.getvalue())
+
+    def test_changing_servizio_type_moves_hours(self):
+        self._entry(self._local(2026, 3, 10, 8), 60, fkservizio=self.servizio)
+        altro = ServizioType.objects.create(nome="Antincendio")
+
+        self.servizio.type = altro
+        self.servizio.save()
+
+        self.assertEqual(self._rows(), {(date(2026, 3, 1), altro.pk): (60, 1)})
+
+    def test_changing_scheduled_task_type_moves_hours(self):
+        task = ScheduledTask.objects.create(
+            nome="Controllo", deadline=self._local(2026, 3, 10, 8)
+        )
+        self._entry(self._local(2026, 3, 10, 8), 30, fkscheduled_task=task)
+        self.assertEqual(self._rows(), {(date(2026, 3, 1), None): (30, 1)})
+
+        task.type = self.tipo
+        task.save()
+
+        self.assertEqual(self._rows(), {(date(2026, 3, 1), self.tipo.pk): (30, 1)})
+
+    def test_migration_backfill_matches_incremental(self):
+        backfill = import_module("servizio.migrations.0011_riepilogoore")
+        self._entry(self._local(2026, 3, 10, 8), 60, fkservizio=self.servizio)
+        self._entry(self._local(2026, 4, 1, 0, 30), 61)
+        incremental = self._rows()
+        RiepilogoOre.objects.all().delete()
+
+        backfill.popola_riepilogo_ore(django_apps, None)
+
+        self.assertEqual(self._rows(), incremental)
+
+
+class TimbraturaDurationTests(TestCase):
+    """Durations are computed in SQL: sortable, filterable and summable."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(self.user)
+        self.volontario = Volontario.objects.create(
+            codice_fiscale="RSSMRA90A01H501W", nome="Mario", cognome="Rossi"
+        )
+        start = timezone.now() - timedelta(days=2)
+        self.entries = {
+            minutes: Timbratura.objects.create(
+                fkvolontario=self.volontario,
+                clock_in=start + timedelta(hours=i * 13),
+                clock_out=start + timedelta(hours=i * 13, minutes=minutes),
+            )
+            for i, minutes in enumerate([30, 300, 90])
+        }
+        self.open_entry = Timbratura.objects.create(
+            fkvolontario=self.volontario, clock_in=timezone.now()
+        )
+        self.url = reverse("admin:servizio_timbratura_changelist")
+
+    def test_with_duration(self):
+        durations = dict(Timbratura.objects.with_duration().values_list("pk", "durata"))
+
+        self.assertEqual(durations[self.entries[300].pk], timedelta(minutes=300))
+        self.assertIsNone(durations[self.open_entry.pk])
+
+    def test_total_duration_is_one_query(self):
+        with self.assertNumQueries(1):
+            total = Timbratura.objects.total_duration()
+
+        self.assertEqual(total, timedelta(minutes=420))
+        self.assertEqual(
+            Timbratura.objects.filter(clock_out__isnull=True).total_duration(),
+            timedelta(),
+        )
+
+    def test_changelist_sorts_by_duration(self):
+        column = (
+            self.client.get(self.url)
+            .context["cl"]
+            .list_display.index("duration_display")
+        )
+
+        response = self.client.get(self.url, {"o": str(column)})
+
+        result = [e.pk for e in response.context["cl"].result_list]
+        expected = [self.entries[m].pk for m in (30, 90, 300)]
+        self.assertEqual([pk for pk in result if pk != self.open_entry.pk], expected)
+        self.assertContains(response, "5h 0m")
+        self.assertContains(response, "In corso")
+
+    def test_changelist_filters_longer_than(self):
+        response = self.client.get(self.url, {"durata": "1h"})
+        self.assertEqual(
+            {e.pk for e in response.context["cl"].result_list},
+            {self.entries[300].pk, self.entries[90].pk},
+        )
+
+        response = self.client.get(self.url, {"durata": "open"})
+        self.assertEqual(
+            [e.pk for e in response.context["cl"].result_list], [self.open_entry.pk]
+        )
+
+
+class TimbraturaOpenEntryTests(TestCase):
+    """At most one open entry per volunteer, enforced by a partial unique index."""
+
+    def setUp(self):
+        self.volontario = Volontario.objects.create(
+            codice_fiscale="RSSMRA90A01H501W", nome="Mario", cognome="Rossi"
+        )
+        self.servizio = Servizio.objects.create(
+            nome="Presidio", data_ora=timezone.now(), send_message=False
+        )
+
+    def test_second_open_entry_is_rejected(self):
+        Timbratura.objects.create(fkvolontario=self.volontario)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Timbratura.objects.create(fkvolontario=self.volontario)
+
+    def test_closed_entries_do_not_conflict(self):
+        for _ in range(2):
+            Timbratura.objects.create(
+                fkvolontario=self.volontario, clock_out=timezone.now()
+            )
+        Timbratura.objects.create(fkvolontario=self.volontario)
+
+        self.assertEqual(Timbratura.objects.count(), 3)
+
+    def test_clock_in_returns_the_open_entry(self):
+        entry, created = Timbratura.objects.clock_in(
+            self.volontario, fkservizio=self.servizio
+        )
+        again, created_again = Timbratura.objects.clock_in(self.volontario)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, entry.pk)
+        self.assertEqual(again.fkservizio_id, self.servizio.pk)
+        self.assertEqual(Timbratura.objects.count(), 1)
+
+    def test_clock_in_retries_when_the_open_entry_was_closed_meanwhile(self):
+        create = TimbraturaQuerySet.create
+        conflicts = [IntegrityError("timbratura_one_open_entry")]
+
+        def racing_create(queryset, **kwargs):
+            if conflicts:
+                raise conflicts.pop()
+            return create(queryset, **kwargs)
+
+        with patch.object(TimbraturaQuerySet, "create", racing_create):
+            entry, created = Timbratura.objects.clock_in(self.volontario)
+
+        self.assertTrue(created)
+        self.assertEqual(Timbratura.objects.get().pk, entry.pk)
+
+    def test_clock_in_reraises_other_integrity_errors(self):
+        with (
+            patch.object(
+                TimbraturaQuerySet, "create", side_effect=IntegrityError("other")
+            ) as create,
+            self.assertRaisesMessage(IntegrityError, "other"),
+        ):
+            Timbratura.objects.clock_in(self.volontario)
+        self.assertEqual(create.call_count, 2)
+
+    @skipUnlessDBFeature("supports_partial_indexes")
+    def test_hot_lookups_use_their_indexes(self):
+        task = ScheduledTask.objects.create(nome="Controllo", deadline=timezone.now())
+        lookups = {
+            "timbratura_one_open_entry": Timbratura.objects.filter(
+                fkvolontario=self.volontario, clock_out__isnull=True
+            ),
+            "timbratura_servizio_idx": Timbratura.objects.filter(
+                fkservizio__in=[self.servizio.pk], clock_out__isnull=True
+            ),
+            "timbratura_task_msg_idx": Timbratura.objects.filter(
+                fkscheduled_task=task, checklist_message_id__isnull=False
+            ),
+        }
+        if connection.vendor == "postgresql":
+            # The test tables are tiny: make PostgreSQL show the index it would use.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        for index, queryset in lookups.items():
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
@@ -1,6 +1,20 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 
-from .models import AllertaMeteoStato, LoginToken, TelegramUser
+from . import allertalom
+from .models import (
+    AllertaMeteoSnapshot,
+    AllertaMeteoStato,
+    BackgroundTask,
+    LoginToken,
+    OutboxMessage,
+    TelegramUser,
+)
 
 
 @admin.register(TelegramUser)
@@ -93,3 +107,201 @@ class AllertaMeteoStatoAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(AllertaMeteoSnapshot)
+class AllertaMeteoSnapshotAdmin(admin.ModelAdmin):
+    list_display = [
+        "fetched_at",
+        "cd_tipologia_gis",
+        "codice_zona",
+        "nome_zona",
+        "starts_at",
+    ]
+    list_filter = ["cd_tipologia_gis", "codice_zona", "fetched_at"]
+    search_fields = ["codice_zona", "nome_zona"]
+    date_hierarchy = "fetched_at"
+    change_list_template = "admin/tg_bot/allertameteosnapshot/change_list.html"
+
+    # Righe (previsioni) mostrate al massimo nella timeline.
+    timeline_max_rows = 200
+    timeline_default_days = 2
+
+    def has_module_permission(self, request):
+        if request.user.is_superuser:
+            return True
+        return request.user.groups.filter(name="IT Admin").exists()
+
+    def has_view_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                "timeline/",
+                self.admin_site.admin_view(self.timeline_view),
+                name="tg_bot_allertameteosnapshot_timeline",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def timeline_view(self, request):
+        """Evoluzione delle previsioni di una zona: una riga per previsione scaricata,
+        una colonna per ora prevista.
+
+        Legge solo le colonne necessarie delle previsioni degli ultimi ``giorni``
+        (al massimo ``timeline_max_rows``): i livelli orari sono già compattati in
+        una riga per previsione.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        zones = list(
+            AllertaMeteoSnapshot.objects.order_by("cd_tipologia_gis", "codice_zona")
+            .values_list("cd_tipologia_gis", "codice_zona")
+            .distinct()
+        )
+        # ?zona=<categoria>|<codice zona>
+        categoria_raw, _, zona = request.GET.get("zona", "").partition("|")
+        try:
+            categoria = int(categoria_raw)
+        except ValueError:
+            categoria, zona = zones[0] if zones else (None, "")
+        try:
+            giorni = min(max(int(request.GET.get("giorni", "")), 1), 31)
+        except ValueError:
+            giorni = self.timeline_default_days
+
+        snapshots = (
+            AllertaMeteoSnapshot.objects.filter(
+                cd_tipologia_gis=categoria,
+                codice_zona=zona,
+                fetched_at__gte=timezone.now() - timedelta(days=giorni),
+            )
+            .order_by("-fetched_at")
+            .values_list("fetched_at", "starts_at", "levels")[: self.timeline_max_rows]
+        )
+        decoded = [
+            (fetched_at, dict(allertalom.decode_levels(starts_at, levels)))
+            for fetched_at, starts_at, levels in snapshots
+        ]
+        hours = sorted({hour for _, levels in decoded for hour in levels})
+        rows = [
+            (
+                fetched_at,
+                [
+                    allertalom.LEVEL_INFO.get(levels.get(hour), ("", ""))
+                    for hour in hours
+                ],
+            )
+            for fetched_at, levels in decoded
+        ]
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Timeline previsioni AllertaLOM",
+            "zones": [
+                (c, z, allertalom.category_name(c), c == categoria and z == zona)
+                for c, z in zones
+            ],
+            "categoria": categoria,
+            "zona": zona,
+            "giorni": giorni,
+            "hours": hours,
+            "rows": rows,
+        }
+        return TemplateResponse(
+            request, "admin/tg_bot/allertameteosnapshot/timeline.html", context
+        )
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = [
+        "dedupe_key",
+        "chat_id",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "sent_at",
+    ]
+    list_filter = ["status", "created_at"]
+    search_fields = ["dedupe_key", "chat_id"]
+    readonly_fields = [
+        "dedupe_key",
+        "chat_id",
+        "payload",
+        "priority",
+        "attempts",
+        "last_error",
+        "created_at",
+        "sent_at",
+    ]
+
+    def has_module_permission(self, request):
+        if request.user.is_superuser:
+            return True
+        return request.user.groups.filter(name="IT Admin").exists()
+
+    def has_view_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_delete_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = [
+        "name",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["status", "name", "created_at"]
+    search_fields = ["name"]
+    readonly_fields = [
+        "name",
+        "kwargs",
+        "attempts",
+        "last_error",
+        "created_at",
+        "started_at",
+        "finished_at",
+    ]
+
+    def has_module_permission(self, request):
+        if request.user.is_superuser:
+            return True
+        return request.user.groups.filter(name="IT Admin").exists()
+
+    def has_view_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_delete_permission(self, request, obj=None):
+        return self.has_module_permission(request)
+
+    def has_add_permission(self, request):
+        return False
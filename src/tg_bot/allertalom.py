@@ -6,8 +6,14 @@ solo logica pura e I/O di rete: il rilevamento delle variazioni e l'invio dei me
 Telegram sono gestiti dal job in :mod:`tg_bot.bot`.
 """
 
+import asyncio
+import hashlib
+import importlib.util
 import logging
-from datetime import datetime, timedelta, timezone as dt_timezone
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta, timezone as dt_timezone
 from xml.etree import ElementTree
 
 import httpx
@@ -17,6 +23,26 @@ logger = logging.getLogger(__name__)
 
 BASE_URL = "https://www.allertalom.regione.lombardia.it/lista-zone"
 
+# Timeout (secondi) di ogni richiesta, dall'apertura della connessione alla risposta.
+REQUEST_TIMEOUT = 20
+
+# Ore di previsione lette oltre l'orizzonte richiesto, così una risposta invariata
+# può essere riusata per qualche controllo prima di doverla rileggere.
+PARSE_MARGIN = timedelta(hours=6)
+
+# Circuit breaker: richieste fallite di fila prima di sospendere le interrogazioni,
+# e pausa (secondi) prima di riprovare, raddoppiata a ogni nuovo fallimento.
+BREAKER_THRESHOLD = 3
+BREAKER_BACKOFF = 60
+BREAKER_MAX_BACKOFF = 3600
+
+# Intervallo minimo (secondi) tra due controlli, anche in caso di allerta.
+MIN_POLL_INTERVAL = 60
+
+# Byte passati al parser XML per volta: con l'arresto anticipato il resto della
+# risposta non viene nemmeno letto.
+PARSE_CHUNK_SIZE = 4096
+
 # cdTipologiaGis -> nome leggibile del fenomeno.
 CATEGORY_NAMES = {
     2: "Neve",
@@ -46,53 +72,436 @@ def portal_url(categoria: int, cd_istat_comune: str) -> str:
     return f"{BASE_URL}?cdTipologiaGis={categoria}&cdIstatComune={cd_istat_comune}"
 
 
-def parse_forecast(xml_text: str) -> list[dict]:
-    """Converte l'XML di AllertaLOM in una lista di dict (uno per ora di previsione).
+@dataclass(slots=True)
+class ForecastItem:
+    """Una previsione oraria: ``dt`` (datetime aware UTC), ``cd_livello`` (int),
+    ``livello``, ``nome_zona``, ``codice_zona`` (str).
+    """
+
+    dt: datetime
+    cd_livello: int
+    livello: str
+    nome_zona: str
+    codice_zona: str
 
-    Ogni elemento contiene: ``dt`` (datetime aware UTC), ``cd_livello`` (int),
-    ``livello`` (str), ``nome_zona`` (str), ``codice_zona`` (str). Gli item non
-    parsabili vengono ignorati.
+
+def iter_forecast(
+    xml: str | bytes, until: datetime | None = None
+) -> Iterator[ForecastItem]:
+    """Legge l'XML di AllertaLOM in streaming, un item alla volta.
+
+    Gli item non parsabili vengono ignorati. AllertaLOM restituisce le previsioni in
+    ordine cronologico, quindi con ``until`` la lettura si ferma al primo item
+    successivo: quell'item viene comunque restituito, così chi usa il risultato sa
+    che la lista è stata troncata e da quando mancano i dati (vedi
+    :func:`_alert_validity`).
     """
-    root = ElementTree.fromstring(xml_text)
-    items = []
-    for item in root.findall("item"):
-        dt_raw = item.findtext("dtPrevisione")
-        cd_raw = item.findtext("cdLivello")
-        if dt_raw is None or cd_raw is None:
-            continue
-        try:
-            dt = datetime.fromtimestamp(int(dt_raw) / 1000, tz=dt_timezone.utc)
-            cd_livello = int(cd_raw)
-        except (ValueError, TypeError):
-            continue
-        items.append(
-            {
-                "dt": dt,
-                "cd_livello": cd_livello,
-                "livello": item.findtext("livello", "") or "",
-                "nome_zona": item.findtext("nomeZonaOmogenea", "") or "",
-                "codice_zona": item.findtext("codiceZonaOmogenea", "") or "",
-            }
-        )
-    return items
+    if isinstance(xml, str):
+        xml = xml.encode()
+    parser = ElementTree.XMLPullParser(events=("end",))
+    for offset in range(0, len(xml), PARSE_CHUNK_SIZE):
+        parser.feed(xml[offset : offset + PARSE_CHUNK_SIZE])
+        for _event, elem in parser.read_events():
+            if elem.tag != "item":
+                continue
+            fields = {child.tag: child.text for child in elem}
+            elem.clear()
+            try:
+                dt = datetime.fromtimestamp(
+                    int(fields["dtPrevisione"]) / 1000, tz=dt_timezone.utc
+                )
+                cd_livello = int(fields["cdLivello"])
+            except (KeyError, ValueError, TypeError):
+                continue
+            yield ForecastItem(
+                dt,
+                cd_livello,
+                fields.get("livello") or "",
+                fields.get("nomeZonaOmogenea") or "",
+                fields.get("codiceZonaOmogenea") or "",
+            )
+            if until is not None and dt > until:
+                return
+    parser.close()
 
 
-async def fetch_forecast(categoria: int, cd_istat_comune: str) -> list[dict]:
-    """Scarica e parsa la previsione per una categoria e un comune.
+def parse_forecast(
+    xml: str | bytes, until: datetime | None = None
+) -> list[ForecastItem]:
+    """Converte l'XML di AllertaLOM in una lista di :class:`ForecastItem` (uno per ora
+    di previsione), fermandosi dopo ``until`` come :func:`iter_forecast`.
+    """
+    return list(iter_forecast(xml, until))
+
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Client HTTP condiviso da tutte le richieste ad AllertaLOM.
+
+    Le connessioni restano aperte (keep-alive) tra un controllo e l'altro, così un
+    ciclo su più categorie paga un solo handshake TLS; se il pacchetto ``h2`` è
+    installato le richieste concorrenti viaggiano su un'unica connessione HTTP/2.
+    Il client è legato all'event loop che lo crea: un loop diverso ne crea uno nuovo.
 
     Nota TLS: il server AllertaLOM invia solo il certificato foglia (manca l'intermedio
     Actalis) quindi la verifica standard fallisce. L'endpoint è pubblico e in sola
     lettura, perciò disabilitiamo la verifica del certificato.
     """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            verify=False,
+            timeout=REQUEST_TIMEOUT,
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    """Chiude il client condiviso (allo spegnimento del bot)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+@dataclass
+class CacheStats:
+    """Contatori della cache: risposte HTTP e calcoli di ``current_alert`` evitati."""
+
+    http_hits: int = 0
+    http_misses: int = 0
+    alert_hits: int = 0
+    alert_misses: int = 0
+
+
+@dataclass
+class _CachedForecast:
+    etag: str | None
+    last_modified: str | None
+    digest: str
+    content: bytes
+    until: datetime | None
+    items: list[ForecastItem]
+    full_items: list[ForecastItem] | None = None
+
+
+@dataclass
+class _CachedAlert:
+    items: list[ForecastItem]
+    params: tuple
+    valid_from: datetime
+    valid_until: datetime
+    alert: dict | None
+
+
+cache_stats = CacheStats()
+_forecast_cache: dict[tuple[int, str], _CachedForecast] = {}
+_alert_cache: dict[tuple[int, str], _CachedAlert] = {}
+
+
+def clear_cache() -> None:
+    """Svuota la cache e azzera i contatori."""
+    _forecast_cache.clear()
+    _alert_cache.clear()
+    for field in ("http_hits", "http_misses", "alert_hits", "alert_misses"):
+        setattr(cache_stats, field, 0)
+
+
+async def fetch_forecast(
+    categoria: int, cd_istat_comune: str, horizon_hours: int | None = None
+) -> list[ForecastItem]:
+    """Scarica e parsa la previsione per una categoria e un comune.
+
+    Con ``horizon_hours`` il parsing si ferma poco oltre l'orizzonte (``now +
+    horizon_hours + PARSE_MARGIN``, vedi :func:`iter_forecast`); senza, legge tutto.
+
+    Le richieste sono condizionali (``If-None-Match``/``If-Modified-Since``) quando il
+    server ha fornito ``ETag``/``Last-Modified``; se risponde 304, o se il contenuto è
+    identico byte per byte al precedente (confronto SHA-256, per i server che non
+    inviano quegli header), viene restituita la *stessa* lista già parsata, senza
+    rifare il parsing, purché copra ancora l'orizzonte. L'identità della lista
+    permette a :func:`cached_alert` di riusare anche l'allerta calcolata.
+    """
+    needed = None
+    if horizon_hours is not None:
+        needed = timezone.now() + timedelta(hours=horizon_hours)
+
+    key = (categoria, cd_istat_comune)
+    cached = _forecast_cache.get(key)
     params = {"cdTipologiaGis": categoria, "cdIstatComune": cd_istat_comune}
-    async with httpx.AsyncClient(verify=False, timeout=20) as client:
-        resp = await client.get(BASE_URL, params=params)
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    resp = await get_client().get(BASE_URL, params=params, headers=headers)
+    not_modified = resp.status_code == 304 and cached is not None
+    if not_modified:
+        content = cached.content
+        etag, last_modified = cached.etag, cached.last_modified
+    else:
         resp.raise_for_status()
-    return parse_forecast(resp.text)
+        content = resp.content
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+
+    digest = hashlib.sha256(content).hexdigest()
+    unchanged = cached is not None and cached.digest == digest
+    if not_modified or unchanged:
+        cache_stats.http_hits += 1
+    else:
+        cache_stats.http_misses += 1
+
+    covered = cached is not None and (
+        cached.until is None or (needed is not None and needed <= cached.until)
+    )
+    if unchanged and covered:
+        items, until = cached.items, cached.until
+    else:
+        # Payload nuovo, o la parte già letta non arriva più fino all'orizzonte.
+        until = needed + PARSE_MARGIN if needed is not None else None
+        items = parse_forecast(content, until)
+    _forecast_cache[key] = _CachedForecast(
+        etag=etag,
+        last_modified=last_modified,
+        digest=digest,
+        content=content,
+        until=until,
+        items=items,
+        full_items=cached.full_items if unchanged else None,
+    )
+    return items
+
+
+def full_forecast(
+    key: tuple[int, str], items: list[ForecastItem]
+) -> list[ForecastItem]:
+    """La previsione completa da cui provengono ``items`` (ritornati da
+    :func:`fetch_forecast` per ``key``), anche se il parsing si era fermato
+    all'orizzonte.
+
+    Il payload è riletto per intero al più una volta finché non cambia; se ``items``
+    non viene dalla cache (o è già completo) è ritornato così com'è.
+    """
+    cached = _forecast_cache.get(key)
+    if cached is None or cached.items is not items or cached.until is None:
+        return items
+    if cached.full_items is None:
+        cached.full_items = parse_forecast(cached.content)
+    return cached.full_items
+
+
+class CircuitOpenError(Exception):
+    """AllertaLOM non viene interrogato: il circuit breaker è aperto."""
+
+
+class CircuitBreaker:
+    """Sospende le richieste ad AllertaLOM quando il portale non risponde.
+
+    Dopo ``threshold`` richieste fallite di fila il circuito si *apre*: per
+    ``backoff`` secondi nessuna richiesta parte. Scaduta la pausa il circuito è
+    *semi-aperto*: una sola richiesta di prova; se riesce il circuito si chiude,
+    altrimenti si riapre con pausa doppia (fino a ``max_backoff``).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        backoff: float = BREAKER_BACKOFF,
+        max_backoff: float = BREAKER_MAX_BACKOFF,
+    ):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+
+    def allow(self) -> bool:
+        """Se si può fare una richiesta; chi riceve ``True`` a circuito semi-aperto
+        esegue la richiesta di prova."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self.retry_at:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("AllertaLOM reachable again, circuit closed")
+        self.reset()
+
+    def record_failure(self) -> None:
+        if self.state == self.OPEN:
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            delay = min(self.backoff * 2**self.trips, self.max_backoff)
+            self.trips += 1
+            self.state = self.OPEN
+            self.retry_at = time.monotonic() + delay
+            logger.error(
+                "AllertaLOM unreachable after %s failures, pausing requests for %ss",
+                self.failures,
+                delay,
+            )
+
+
+breaker = CircuitBreaker()
+
+
+async def fetch_forecasts(
+    requests: list[tuple[int, str]],
+    timeout: float | None = None,
+    horizon_hours: int | None = None,
+) -> dict[tuple[int, str], list[ForecastItem] | Exception]:
+    """Scarica in parallelo le previsioni per più coppie ``(categoria, comune)``.
+
+    Ogni richiesta ha un proprio ``timeout`` complessivo (default ``REQUEST_TIMEOUT``);
+    l'errore di una categoria (timeout compreso) viene restituito come eccezione
+    senza interrompere le altre. ``horizon_hours`` è passato a :func:`fetch_forecast`.
+
+    Le richieste passano dal :data:`breaker`: a circuito aperto ogni coppia riceve un
+    :class:`CircuitOpenError`; a circuito semi-aperto la prima richiesta fa da prova
+    e le altre partono solo se riesce.
+    """
+    timeout = REQUEST_TIMEOUT if timeout is None else timeout
+
+    async def fetch(categoria: int, cd_istat_comune: str):
+        return await asyncio.wait_for(
+            fetch_forecast(categoria, cd_istat_comune, horizon_hours), timeout
+        )
+
+    async def fetch_all(batch: list[tuple[int, str]]) -> None:
+        batch_results = await asyncio.gather(
+            *(fetch(*request) for request in batch), return_exceptions=True
+        )
+        for request, result in zip(batch, batch_results):
+            results[request] = result
+            if isinstance(result, Exception):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+    results: dict[tuple[int, str], list[ForecastItem] | Exception] = {}
+    pending = list(requests)
+    if pending and breaker.allow():
+        if breaker.state == CircuitBreaker.HALF_OPEN:
+            probe = pending.pop(0)
+            try:
+                await fetch_all([probe])
+            finally:
+                if breaker.state == CircuitBreaker.HALF_OPEN:
+                    # Probe cancelled before completing: count it as a failure.
+                    breaker.record_failure()
+        if breaker.state == CircuitBreaker.CLOSED:
+            await fetch_all(pending)
+
+    for request in requests:
+        results.setdefault(request, CircuitOpenError())
+    return results
+
+
+def poll_interval(
+    base: float,
+    max_level: int | None,
+    storm_factor: float,
+    calm_factor: float,
+) -> float:
+    """Intervallo fino al prossimo controllo, adattato alla situazione.
+
+    Con un'allerta in corso (``max_level`` almeno giallo) l'intervallo ``base`` si
+    accorcia di ``storm_factor`` per seguire l'evoluzione da vicino; con tutto verde
+    si allunga di ``calm_factor``. Senza dati (``None``: errori o nessuna previsione)
+    resta ``base``.
+    """
+    if max_level is None:
+        return base
+    if max_level >= 1:
+        return max(base * storm_factor, MIN_POLL_INTERVAL)
+    return base * calm_factor
+
+
+class ZoneMap:
+    """Zona omogenea di ogni comune monitorato, per categoria.
+
+    La previsione è la stessa per tutti i comuni della stessa zona omogenea, quindi
+    basta una richiesta per zona. La zona di un comune si impara dalla prima risposta
+    (o dallo stato salvato in ``AllertaMeteoStato``); finché è sconosciuta il comune
+    viene interrogato da solo. Le zone dipendono dalla categoria (es. le zone degli
+    incendi boschivi non coincidono con quelle idrogeologiche).
+    """
+
+    def __init__(self):
+        # (categoria, comune) -> codice zona; None = da (ri)scoprire con una richiesta.
+        self._zones: dict[tuple[int, str], str | None] = {}
+
+    def clear(self) -> None:
+        self._zones.clear()
+
+    def knows(self, categoria: int, cd_istat_comune: str) -> bool:
+        return (categoria, cd_istat_comune) in self._zones
+
+    def seed(self, categoria: int, cd_istat_comune: str, codice_zona: str) -> None:
+        """Usa una zona già nota (es. dal database) se non ne abbiamo una più recente."""
+        if codice_zona:
+            self._zones.setdefault((categoria, cd_istat_comune), codice_zona)
+
+    def plan(self, categoria: int, comuni: list[str]) -> dict[str, list[str]]:
+        """Raggruppa i comuni per zona: ``{comune da interrogare: comuni serviti}``."""
+        by_zone: dict[str, list[str]] = {}
+        plan: dict[str, list[str]] = {}
+        for comune in comuni:
+            zona = self._zones.get((categoria, comune))
+            if zona is None:
+                plan[comune] = [comune]
+            else:
+                by_zone.setdefault(zona, []).append(comune)
+        for served in by_zone.values():
+            plan[served[0]] = served
+        return plan
+
+    def learn(
+        self, categoria: int, queried: str, served: list[str], codice_zona: str
+    ) -> list[str]:
+        """Registra la zona restituita per ``queried`` e ritorna i comuni coperti.
+
+        Se la zona non è quella attesa (la mappa delle zone è cambiata) gli altri
+        comuni del gruppo non sono più affidabili: tornano sconosciuti e verranno
+        interrogati singolarmente al prossimo controllo.
+        """
+        expected = self._zones.get((categoria, queried))
+        self._zones[(categoria, queried)] = codice_zona or None
+        if expected is not None and expected != codice_zona:
+            for comune in served:
+                if comune != queried:
+                    self._zones[(categoria, comune)] = None
+            return [queried]
+        return served
+
+
+zone_map = ZoneMap()
 
 
 def current_alert(
-    items: list[dict], now: datetime, horizon_hours: int, min_level: int = 1
+    items: list[ForecastItem], now: datetime, horizon_hours: int, min_level: int = 1
 ) -> dict | None:
     """Livello di allerta "in corso" nella finestra [now-1h, now+horizon_hours].
 
@@ -110,56 +519,159 @@ def current_alert(
     window_start = now - timedelta(hours=1)
     window_end = now + timedelta(hours=horizon_hours)
     relevant = [
-        i
-        for i in items
-        if i["cd_livello"] >= 0 and window_start <= i["dt"] <= window_end
+        i for i in items if i.cd_livello >= 0 and window_start <= i.dt <= window_end
     ]
     if not relevant:
         return None
 
-    top = max(relevant, key=lambda i: i["cd_livello"])
+    top = max(relevant, key=lambda i: i.cd_livello)
 
     elevated = sorted(
-        (i for i in relevant if i["cd_livello"] >= min_level),
-        key=lambda i: i["dt"],
+        (i for i in relevant if i.cd_livello >= min_level),
+        key=lambda i: i.dt,
     )
     segments: list[dict] = []
     for item in elevated:
         prev = segments[-1] if segments else None
-        if (
-            prev
-            and prev["cd_livello"] == item["cd_livello"]
-            and prev["end"] == item["dt"]
-        ):
-            prev["end"] = item["dt"] + timedelta(hours=1)
+        if prev and prev["cd_livello"] == item.cd_livello and prev["end"] == item.dt:
+            prev["end"] = item.dt + timedelta(hours=1)
         else:
             segments.append(
                 {
-                    "cd_livello": item["cd_livello"],
-                    "livello": item["livello"],
-                    "start": item["dt"],
-                    "end": item["dt"] + timedelta(hours=1),
+                    "cd_livello": item.cd_livello,
+                    "livello": item.livello,
+                    "start": item.dt,
+                    "end": item.dt + timedelta(hours=1),
                 }
             )
 
     return {
-        "cd_livello": top["cd_livello"],
-        "livello": top["livello"],
-        "nome_zona": top["nome_zona"],
-        "codice_zona": top["codice_zona"],
+        "cd_livello": top.cd_livello,
+        "livello": top.livello,
+        "nome_zona": top.nome_zona,
+        "codice_zona": top.codice_zona,
         "start": segments[0]["start"] if segments else None,
         "end": segments[-1]["end"] if segments else None,
         "segments": segments,
     }
 
 
+def _alert_validity(
+    items: list[ForecastItem], now: datetime, horizon_hours: int
+) -> tuple[datetime, datetime]:
+    """Intervallo in cui la finestra di :func:`current_alert` contiene gli stessi item.
+
+    La finestra ``[now-1h, now+horizon]`` scorre col tempo: il risultato cambia solo
+    quando un item vi entra (``dt - horizon``) o ne esce (``dt + 1h``). Un confine
+    che coincide con ``now`` chiude l'intervallo, per prudenza.
+    """
+    horizon = timedelta(hours=horizon_hours)
+    valid_from = datetime.min.replace(tzinfo=UTC)
+    valid_until = datetime.max.replace(tzinfo=UTC)
+    for item in items:
+        for boundary in (item.dt - horizon, item.dt + timedelta(hours=1)):
+            if boundary >= now:
+                valid_until = min(valid_until, boundary)
+            else:
+                valid_from = max(valid_from, boundary)
+    return valid_from, valid_until
+
+
+def cached_alert(
+    key: tuple[int, str],
+    items: list[ForecastItem],
+    now: datetime,
+    horizon_hours: int,
+    min_level: int = 1,
+) -> dict | None:
+    """Come :func:`current_alert`, ma riusa il risultato se nulla è cambiato.
+
+    Il risultato precedente per ``key`` è valido se ``items`` è la stessa lista (cioè
+    la previsione non è cambiata, vedi :func:`fetch_forecast`), i parametri coincidono
+    e la finestra temporale contiene ancora gli stessi item.
+    """
+    params = (horizon_hours, min_level)
+    cached = _alert_cache.get(key)
+    if (
+        cached is not None
+        and cached.items is items
+        and cached.params == params
+        and cached.valid_from <= now < cached.valid_until
+    ):
+        cache_stats.alert_hits += 1
+        return cached.alert
+
+    cache_stats.alert_misses += 1
+    alert = current_alert(items, now, horizon_hours, min_level)
+    valid_from, valid_until = _alert_validity(items, now, horizon_hours)
+    _alert_cache[key] = _CachedAlert(items, params, valid_from, valid_until, alert)
+    return alert
+
+
+def encode_levels(items: list[ForecastItem]) -> tuple[datetime, str] | None:
+    """Codifica compatta dei livelli orari di una previsione, per l'archivio.
+
+    Ritorna ``(prima ora, codifica)`` o ``None`` se non ci sono item. La codifica è
+    una lista separata da virgole: un numero con segno è la variazione di livello
+    rispetto all'ora precedente (il livello "prima" della prima ora è 0), un numero
+    senza segno è quante ore consecutive il livello resta invariato. Le ore mancanti
+    valgono -1 (nessuna previsione). Es. 6 ore verdi, 4 gialle, poi 2 arancioni:
+    ``"6,+1,3,+1,1"``.
+    """
+    if not items:
+        return None
+    hour = timedelta(hours=1)
+    start = min(item.dt for item in items)
+    end = max(item.dt for item in items)
+    levels = [-1] * (int((end - start) / hour) + 1)
+    for item in items:
+        levels[int((item.dt - start) / hour)] = item.cd_livello
+
+    tokens = []
+    previous, run = 0, 0
+    for level in levels:
+        if level == previous:
+            run += 1
+            continue
+        if run:
+            tokens.append(str(run))
+            run = 0
+        tokens.append(f"{level - previous:+d}")
+        previous = level
+    if run:
+        tokens.append(str(run))
+    return start, ",".join(tokens)
+
+
+def decode_levels(start: datetime, encoded: str) -> list[tuple[datetime, int]]:
+    """Inverso di :func:`encode_levels`: lista di ``(ora, livello)``."""
+    hour = timedelta(hours=1)
+    levels = []
+    level = 0
+    for token in encoded.split(","):
+        if token[0] in "+-":
+            level += int(token)
+            count = 1
+        else:
+            count = int(token)
+        for _ in range(count):
+            levels.append((start + len(levels) * hour, level))
+    return levels
+
+
 def build_message(
-    categoria: int, alert: dict, old_level: int, new_level: int, cd_istat_comune: str
+    categoria: int,
+    alert: dict,
+    old_level: int,
+    new_level: int,
+    comuni: list[str],
 ) -> str:
     """Costruisce il messaggio Telegram (Markdown) per una variazione di allerta.
 
     Il testo di intestazione dipende dalla direzione del cambiamento:
-    nuova allerta, aggravamento, miglioramento o rientro.
+    nuova allerta, aggravamento, miglioramento o rientro. ``comuni`` sono i
+    codici ISTAT interessati: con più comuni nella stessa zona il messaggio li
+    elenca e collega la pagina AllertaLOM di ciascuno.
     """
     nome = category_name(categoria)
     livello_nome, livello_emoji = LEVEL_INFO.get(
@@ -192,6 +704,8 @@ def build_message(
         if codice_zona:
             zona_txt += f" ({codice_zona})"
         lines.append(zona_txt)
+    if len(comuni) > 1:
+        lines.append(f"🏘️ Comuni: {', '.join(comuni)}")
 
     if new_level > 0:
         if len(segments) > 1:
@@ -216,7 +730,11 @@ def build_message(
             lines.append("🕒 Valida per le prossime 24 ore.")
 
     lines.append("")
-    lines.append(
-        f"🔗 [Dettagli su AllertaLOM]({portal_url(categoria, cd_istat_comune)})"
-    )
+    if len(comuni) == 1:
+        lines.append(f"🔗 [Dettagli su AllertaLOM]({portal_url(categoria, comuni[0])})")
+    else:
+        links = " · ".join(
+            f"[{comune}]({portal_url(categoria, comune)})" for comune in comuni
+        )
+        lines.append(f"🔗 Dettagli su AllertaLOM per comune: {links}")
     return "\n".join(lines)
@@ -1,9 +1,12 @@
+import asyncio
 import logging
+import time
 from collections import defaultdict
 from datetime import datetime, time as dt_time, timedelta
 from enum import Enum, auto
 from zoneinfo import ZoneInfo
 
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from telegram import (
     BotCommand,
@@ -26,17 +29,29 @@ from telegram.ext import (
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
-
-from tg_bot import allertalom
-from .models import AllertaMeteoStato, LoginToken, TelegramUser, WebLoginRequest
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery, Sum
+
+from tg_bot import allertalom, deadlines, outbound, outbox, tasks
+from tg_bot.identity import get_identity
+from tg_bot.updates import OrderedUpdateProcessor
+from tg_bot.outbound import Priority
+from .models import (
+    AllertaMeteoSnapshot,
+    AllertaMeteoStato,
+    LoginToken,
+    TelegramUser,
+    WebLoginRequest,
+)
 from servizio.models import (
     ChecklistItem,
+    RiepilogoOre,
     ScheduledTask,
     Servizio,
     ServizioType,
     Timbratura,
     VolontarioServizioMap,
+    mese_di,
 )
 from volontario.models import Volontario
 
@@ -300,23 +315,21 @@ async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def get_linked_volontario(update: Update) -> Volontario | None:
     """Helper to get linked volontario or send error message."""
-    user = update.effective_user
-    try:
-        tg_user = await TelegramUser.objects.aget(telegram_id=user.id)
-    except TelegramUser.DoesNotExist:
+    identity = await get_identity(update.effective_user.id)
+    if not identity.registered:
         await update.message.reply_text(
             "❌ Non sei ancora registrato.\nUsa /start per associare il tuo account."
         )
         return None
 
-    if not tg_user.is_linked:
+    if not identity.is_linked:
         await update.message.reply_text(
             "❌ Il tuo account Telegram non è ancora associato.\n"
             "Usa /start per completare l'associazione."
         )
         return None
 
-    return await Volontario.objects.aget(pk=tg_user.volontario_id)
+    return identity.volontario
 
 
 async def clock_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -325,19 +338,6 @@ async def clock_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not volontario:
         return
 
-    # Check if already clocked in
-    open_entry = await Timbratura.objects.filter(
-        fkvolontario=volontario,
-        clock_out__isnull=True,
-    ).afirst()
-
-    if open_entry:
-        await update.message.reply_text(
-            f"⚠️ Hai già un'entrata aperta dalle {timezone.localtime(open_entry.clock_in):%H:%M del %d/%m/%Y}.\n\n"
-            f"Usa /uscita per registrare l'uscita prima di una nuova entrata."
-        )
-        return
-
     # Check if there is an active Servizio right now
     now = timezone.now()
     active_servizio = (
@@ -350,10 +350,15 @@ async def clock_in(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
     # Create new time entry, linked to the active servizio if any
-    entry = await Timbratura.objects.acreate(
-        fkvolontario=volontario,
-        fkservizio=active_servizio,
+    entry, created = await Timbratura.objects.aclock_in(
+        volontario, fkservizio=active_servizio
     )
+    if not created:
+        await update.message.reply_text(
+            f"⚠️ Hai già un'entrata aperta dalle {timezone.localtime(entry.clock_in):%H:%M del %d/%m/%Y}.\n\n"
+            f"Usa /uscita per registrare l'uscita prima di una nuova entrata."
+        )
+        return
 
     clock_out_keyboard = InlineKeyboardMarkup(
         [[InlineKeyboardButton("🔴 Registra uscita", callback_data="clock_out")]]
@@ -409,6 +414,10 @@ async def clock_out(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+def _format_minutes(total_minutes: int) -> str:
+    return f"{total_minutes // 60}h {total_minutes % 60}m"
+
+
 async def hours_summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show hours summary for current month."""
     volontario = await get_linked_volontario(update)
@@ -416,35 +425,31 @@ async def hours_summary(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     now = timezone.now()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month = mese_di(now)
 
-    # Get completed entries for this month
-    entries = Timbratura.objects.filter(
+    # Completed hours come pre-aggregated from the monthly rollup.
+    totals = await RiepilogoOre.objects.filter(
         fkvolontario=volontario,
-        clock_in__gte=month_start,
-        clock_out__isnull=False,
+        mese__gte=month.replace(month=1),
+        mese__lte=month,
+    ).aaggregate(
+        month_minutes=Sum("minuti", filter=Q(mese=month), default=0),
+        month_sessions=Sum("sessioni", filter=Q(mese=month), default=0),
+        year_minutes=Sum("minuti", default=0),
     )
 
-    total_minutes = 0
-    entry_count = 0
-    async for entry in entries:
-        total_minutes += entry.duration or 0
-        entry_count += 1
-
     # Check for open entry
     open_entry = await Timbratura.objects.filter(
         fkvolontario=volontario,
         clock_out__isnull=True,
     ).afirst()
 
-    hours = int(total_minutes // 60)
-    minutes = int(total_minutes % 60)
-
     month_name = timezone.localtime(now).strftime("%B %Y")
     message = (
         f"📊 Riepilogo ore - {month_name}\n\n"
-        f"Totale: {hours}h {minutes}m\n"
-        f"Sessioni completate: {entry_count}"
+        f"Totale: {_format_minutes(totals['month_minutes'])}\n"
+        f"Sessioni completate: {totals['month_sessions']}\n"
+        f"Da inizio anno: {_format_minutes(totals['year_minutes'])}"
     )
 
     if open_entry:
@@ -862,22 +867,20 @@ async def handle_clock_in_callback(
     servizio_pkid = data.split(":", 1)[1]
 
     # Get linked volontario
-    user_id = query.from_user.id
-    try:
-        tg_user = await TelegramUser.objects.aget(telegram_id=user_id)
-    except TelegramUser.DoesNotExist:
+    identity = await get_identity(query.from_user.id)
+    if not identity.registered:
         await query.edit_message_text(
             "❌ Non sei registrato. Usa /start per associare il tuo account."
         )
         return
 
-    if not tg_user.is_linked:
+    if not identity.is_linked:
         await query.edit_message_text(
             "❌ Il tuo account non è associato. Usa /start per completare l'associazione."
         )
         return
 
-    volontario = await Volontario.objects.aget(pk=tg_user.volontario_id)
+    volontario = identity.volontario
 
     # Get the servizio
     try:
@@ -886,25 +889,15 @@ async def handle_clock_in_callback(
         await query.edit_message_text("❌ Servizio non trovato.")
         return
 
-    # Check if already clocked in (for any servizio)
-    open_entry = await Timbratura.objects.filter(
-        fkvolontario=volontario,
-        clock_out__isnull=True,
-    ).afirst()
-
-    if open_entry:
+    # Create new time entry linked to the servizio, unless one is already open
+    entry, created = await Timbratura.objects.aclock_in(volontario, fkservizio=servizio)
+    if not created:
         await query.edit_message_text(
-            f"⚠️ Hai già un'entrata aperta dalle {timezone.localtime(open_entry.clock_in):%H:%M del %d/%m/%Y}.\n\n"
+            f"⚠️ Hai già un'entrata aperta dalle {timezone.localtime(entry.clock_in):%H:%M del %d/%m/%Y}.\n\n"
             f"Usa /uscita per registrare l'uscita prima di una nuova entrata."
         )
         return
 
-    # Create new time entry linked to the servizio
-    entry = await Timbratura.objects.acreate(
-        fkvolontario=volontario,
-        fkservizio=servizio,
-    )
-
     clock_out_keyboard = InlineKeyboardMarkup(
         [[InlineKeyboardButton("🔴 Registra uscita", callback_data="clock_out")]]
     )
@@ -922,16 +915,14 @@ async def handle_clock_out_callback(
     """Handle clock-out button press."""
     query = update.callback_query
 
-    user_id = query.from_user.id
-    try:
-        tg_user = await TelegramUser.objects.aget(telegram_id=user_id)
-    except TelegramUser.DoesNotExist:
+    identity = await get_identity(query.from_user.id)
+    if not identity.registered:
         await query.answer("Non sei registrato. Usa /start.", show_alert=True)
         return
-    if not tg_user.is_linked:
+    if not identity.is_linked:
         await query.answer("Account non associato. Usa /start.", show_alert=True)
         return
-    volontario = await Volontario.objects.aget(pk=tg_user.volontario_id)
+    volontario = identity.volontario
 
     open_entry = await Timbratura.objects.filter(
         fkvolontario=volontario,
@@ -959,16 +950,7 @@ async def handle_clock_out_callback(
 
 async def close_expired_polls(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Close polls that have reached their poll_close_date or are starting within 12 hours."""
-    now = timezone.now()
-    cutoff = now + timedelta(hours=12)
-
-    # Find servizi with open polls that either:
-    # 1. Have a poll_close_date that has passed, or
-    # 2. Start within 12 hours
-    servizi_to_close = Servizio.objects.filter(
-        poll_message_id__isnull=False,
-        poll_closed=False,
-    ).filter(Q(poll_close_date__lte=now) | Q(data_ora__lte=cutoff))
+    servizi_to_close = deadlines.due_poll_closures(timezone.now())
 
     chat_id = getattr(settings, "TELEGRAM_SURVEY_CHAT_ID", None)
     if not chat_id:
@@ -978,7 +960,10 @@ async def close_expired_polls(context: ContextTypes.DEFAULT_TYPE) -> None:
         if not servizio.poll_message_id:
             continue
         try:
-            await context.bot.stop_poll(
+            await outbound.call(
+                context.bot,
+                "stop_poll",
+                Priority.REMINDER,
                 chat_id=chat_id,
                 message_id=servizio.poll_message_id,
             )
@@ -989,137 +974,157 @@ async def close_expired_polls(context: ContextTypes.DEFAULT_TYPE) -> None:
         await servizio.asave(update_fields=["poll_closed"])
 
 
+class _QueryCounter:
+    """``connection.execute_wrapper`` counting the statements actually run."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
 async def send_servizio_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check for upcoming servizi and send reminders to volunteers."""
-    now = timezone.now()
-    reminder_window_start = now + timedelta(minutes=25)
-    reminder_window_end = now + timedelta(minutes=31)
-
-    # Find servizi starting in ~10 minutes that haven't been notified yet
-    upcoming_servizi = Servizio.objects.filter(
-        data_ora__gte=reminder_window_start,
-        data_ora__lte=reminder_window_end,
-        notification_sent=False,
+    """Check for upcoming servizi and queue reminders to volunteers.
+
+    Participants and their Telegram IDs for every due servizio are resolved with a
+    single joined query, so the number of queries per run does not grow with the
+    number of volunteers. Reminders are written to the outbox in the same
+    transaction that marks the servizi as notified.
+    """
+    started = time.monotonic()
+    queries = _QueryCounter()
+    # Installed from the thread the async ORM runs its queries in: each thread has
+    # its own connection.
+    await sync_to_async(lambda: connection.execute_wrappers.append(queries))()
+    try:
+        n_servizi, n_messages = await _send_servizio_reminders(timezone.now())
+    finally:
+        await sync_to_async(lambda: connection.execute_wrappers.remove(queries))()
+    if n_servizi:
+        logger.info(
+            f"Servizio reminders: {n_servizi} servizi, "
+            f"{n_messages} messages queued, {queries.count} queries, "
+            f"{time.monotonic() - started:.2f}s"
+        )
+
+
+async def _send_servizio_reminders(now) -> tuple[int, int]:
+    """Body of :func:`send_servizio_reminders`; returns (servizi, messages queued)."""
+    # Servizi starting within the reminder lead time that haven't been notified yet
+    upcoming_servizi = {
+        servizio.pkid: servizio
+        async for servizio in deadlines.due_servizio_reminders(now)
+    }
+    if not upcoming_servizi:
+        return 0, 0
+
+    # Everyone who didn't answer "no" and has a Telegram account, in one query.
+    participants = (
+        VolontarioServizioMap.objects.filter(
+            fkservizio__in=upcoming_servizi.keys(),
+            fkvolontario__telegram_user__isnull=False,
+        )
+        .exclude(risposta=VolontarioServizioMap.Risposta.NO)
+        .select_related("fkvolontario__telegram_user")
     )
 
-    async for servizio in upcoming_servizi:
-        # Get all volunteers associated with this servizio (those who responded)
-
-        participants = servizio.volontarioserviziomap_set.exclude(
-            risposta=VolontarioServizioMap.Risposta.NO,
-        ).select_related("fkvolontario")
-
-        async for answer in participants:
-            volontario = answer.fkvolontario
-            # Get the telegram user for this volontario
-            try:
-                tg_user = await TelegramUser.objects.aget(volontario=volontario)
-            except TelegramUser.DoesNotExist:
-                logger.debug(f"No telegram user for volontario {volontario.pkid}")
-                continue
-
-            # Send personal reminder with inline button
-            risposta_text = (
-                answer.get_risposta_display() if answer.risposta else "non data"
-            )
-            keyboard = InlineKeyboardMarkup(
+    messages = []
+    async for answer in participants:
+        servizio = upcoming_servizi[answer.fkservizio_id]
+        telegram_id = answer.fkvolontario.telegram_user.telegram_id
+        risposta_text = answer.get_risposta_display() if answer.risposta else "non data"
+        keyboard = InlineKeyboardMarkup(
+            [
                 [
-                    [
-                        InlineKeyboardButton(
-                            "✅ Registra entrata",
-                            callback_data=f"clock_in:{servizio.pkid}",
-                        )
-                    ]
+                    InlineKeyboardButton(
+                        "✅ Registra entrata",
+                        callback_data=f"clock_in:{servizio.pkid}",
+                    )
                 ]
+            ]
+        )
+        end_line = ""
+        if servizio.data_ora_fine:
+            end_line = f"🏁 Fine: {timezone.localtime(servizio.data_ora_fine):%d/%m/%Y %H:%M}\n"
+        minutes = max(1, round((servizio.data_ora - now).total_seconds() / 60))
+        messages.append(
+            outbox.build_message(
+                f"servizio-reminder:{servizio.pkid}:{telegram_id}",
+                telegram_id,
+                (
+                    f"⏰ Promemoria!\n\n"
+                    f'Il servizio "{servizio.nome}" inizia tra {minutes} minuti.\n'
+                    f"📅 Inizio: {timezone.localtime(servizio.data_ora):%d/%m/%Y %H:%M}\n"
+                    f"{end_line}"
+                    f"\nLa tua risposta: {risposta_text}"
+                ),
+                reply_markup=keyboard,
             )
-            end_line = ""
-            if servizio.data_ora_fine:
-                end_line = f"🏁 Fine: {timezone.localtime(servizio.data_ora_fine):%d/%m/%Y %H:%M}\n"
-            try:
-                await context.bot.send_message(
-                    chat_id=tg_user.telegram_id,
-                    text=(
-                        f"⏰ Promemoria!\n\n"
-                        f'Il servizio "{servizio.nome}" inizia tra 30 minuti.\n'
-                        f"📅 Inizio: {timezone.localtime(servizio.data_ora):%d/%m/%Y %H:%M}\n"
-                        f"{end_line}"
-                        f"\nLa tua risposta: {risposta_text}"
-                    ),
-                    reply_markup=keyboard,
-                )
-                logger.info(
-                    f"Sent reminder to {volontario.nome} for servizio {servizio.nome}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send reminder to {tg_user.telegram_id}: {e}")
+        )
 
-        # Mark servizio as notified
-        servizio.notification_sent = True
-        await servizio.asave(update_fields=["notification_sent"])
-        logger.info(f"Marked servizio {servizio.pkid} as notified")
+    await outbox.aenqueue(
+        messages,
+        Servizio.objects.filter(pkid__in=upcoming_servizi.keys()),
+        notification_sent=True,
+    )
+
+    return len(upcoming_servizi), len(messages)
 
 
 async def send_clock_out_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send clock-out reminders to volunteers still clocked in when a servizio ends."""
+    """Queue clock-out reminders to volunteers still clocked in when a servizio ends."""
     now = timezone.now()
-    window_start = now - timedelta(seconds=65)
-
-    # Find servizi whose end time just passed and haven't had the reminder sent yet
-    ended_servizi = Servizio.objects.filter(
-        data_ora_fine__isnull=False,
-        data_ora_fine__gte=window_start,
-        data_ora_fine__lte=now,
-        end_reminder_sent=False,
-    )
 
-    async for servizio in ended_servizi:
-        # Find volunteers still clocked in for this servizio
-        open_entries = Timbratura.objects.filter(
-            fkservizio=servizio,
-            clock_out__isnull=True,
-        ).select_related("fkvolontario")
-
-        async for entry in open_entries:
-            volontario = entry.fkvolontario
-            try:
-                tg_user = await TelegramUser.objects.aget(volontario=volontario)
-            except TelegramUser.DoesNotExist:
-                logger.debug(f"No telegram user for volontario {volontario.pkid}")
-                continue
-
-            keyboard = InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            "🔴 Registra uscita", callback_data="clock_out"
-                        )
-                    ]
-                ]
+    # Servizi whose end time passed and haven't had the reminder sent yet
+    ended_servizi = {
+        servizio.pkid: servizio
+        async for servizio in deadlines.due_clock_out_reminders(now)
+    }
+    if not ended_servizi:
+        return
+
+    # Volunteers still clocked in for these servizi
+    open_entries = Timbratura.objects.filter(
+        fkservizio__in=ended_servizi.keys(),
+        clock_out__isnull=True,
+        fkvolontario__telegram_user__isnull=False,
+    ).select_related("fkvolontario__telegram_user")
+
+    keyboard = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("🔴 Registra uscita", callback_data="clock_out")]]
+    )
+    messages = []
+    async for entry in open_entries:
+        servizio = ended_servizi[entry.fkservizio_id]
+        telegram_id = entry.fkvolontario.telegram_user.telegram_id
+        messages.append(
+            outbox.build_message(
+                f"clock-out-reminder:{servizio.pkid}:{telegram_id}",
+                telegram_id,
+                (
+                    f'⏰ Il servizio "{servizio.nome}" è terminato.\n\n'
+                    f"Ricordati di registrare l'uscita!"
+                ),
+                reply_markup=keyboard,
             )
-            try:
-                await context.bot.send_message(
-                    chat_id=tg_user.telegram_id,
-                    text=(
-                        f'⏰ Il servizio "{servizio.nome}" è terminato.\n\n'
-                        f"Ricordati di registrare l'uscita!"
-                    ),
-                    reply_markup=keyboard,
-                )
-                logger.info(
-                    f"Sent clock-out reminder to {volontario.nome} for servizio {servizio.nome}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to send clock-out reminder to {tg_user.telegram_id}: {e}"
-                )
+        )
 
-        servizio.end_reminder_sent = True
-        await servizio.asave(update_fields=["end_reminder_sent"])
-        logger.info(f"Marked servizio {servizio.pkid} end_reminder_sent")
+    await outbox.aenqueue(
+        messages,
+        Servizio.objects.filter(pkid__in=ended_servizi.keys()),
+        end_reminder_sent=True,
+    )
+    logger.info(
+        f"Queued {len(messages)} clock-out reminders for {len(ended_servizi)} servizi"
+    )
 
 
 async def send_equipment_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send equipment reminders to accepted volunteers the day before at 8 PM."""
+    """Queue equipment reminders to accepted volunteers the day before at 8 PM."""
+    from magazzino.models import RequisitoServizioType
+
     now = timezone.now()
     # Find servizi happening tomorrow (between tomorrow midnight and day end)
     tomorrow_start = (now + timedelta(days=1)).replace(
@@ -1133,54 +1138,45 @@ async def send_equipment_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
         type__isnull=False,  # Only servizi with a type have equipment requirements
     ).select_related("type")
 
+    messages = []
     async for servizio in tomorrow_servizi:
         # Get required equipment for this servizio type
-        from magazzino.models import RequisitoServizioType
-
         requisiti = RequisitoServizioType.objects.filter(
             servizio_type=servizio.type
         ).select_related("tipo_dotazione")
         requisiti_list = [req async for req in requisiti]
 
-        # Get all volunteers who said YES to this servizio
+        # Build message with or without equipment list
+        message = (
+            f"Promemoria!\n\n"
+            f'Domani hai il servizio "{servizio.nome}":\n'
+            f"📅 {timezone.localtime(servizio.data_ora):%d/%m/%Y %H:%M}\n"
+        )
+        if requisiti_list:
+            equipment_lines = ["\nRicorda di portare:"]
+            for req in requisiti_list:
+                equipment_lines.append(f"  • {req.tipo_dotazione.nome}")
+            message += "\n".join(equipment_lines)
+
+        # All volunteers who said YES to this servizio and have a Telegram account
         accepted = VolontarioServizioMap.objects.filter(
             fkservizio=servizio,
             risposta=VolontarioServizioMap.Risposta.SI,
-        ).select_related("fkvolontario")
+            fkvolontario__telegram_user__isnull=False,
+        ).select_related("fkvolontario__telegram_user")
 
         async for answer in accepted:
-            volontario = answer.fkvolontario
-            try:
-                tg_user = await TelegramUser.objects.aget(volontario=volontario)
-            except TelegramUser.DoesNotExist:
-                logger.debug(f"No telegram user for volontario {volontario.nome}")
-                continue
-
-            # Build message with or without equipment list
-            message = (
-                f"Promemoria!\n\n"
-                f'Domani hai il servizio "{servizio.nome}":\n'
-                f"📅 {timezone.localtime(servizio.data_ora):%d/%m/%Y %H:%M}\n"
+            telegram_id = answer.fkvolontario.telegram_user.telegram_id
+            messages.append(
+                outbox.build_message(
+                    f"equipment-reminder:{servizio.pkid}:{telegram_id}",
+                    telegram_id,
+                    message,
+                )
             )
 
-            if requisiti_list:
-                equipment_lines = ["\nRicorda di portare:"]
-                for req in requisiti_list:
-                    equipment_lines.append(f"  • {req.tipo_dotazione.nome}")
-                message += "\n".join(equipment_lines)
-
-            try:
-                await context.bot.send_message(
-                    chat_id=tg_user.telegram_id,
-                    text=message,
-                )
-                logger.info(
-                    f"Sent equipment reminder to {volontario.nome} for servizio {servizio.nome}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to send equipment reminder to {tg_user.telegram_id}: {e}"
-                )
+    await outbox.aenqueue(messages)
+    logger.info(f"Queued {len(messages)} equipment reminders")
 
 
 async def agenda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1471,7 +1467,9 @@ async def _handle_task_completion(bot, task: ScheduledTask) -> None:
     )
     async for tg_user in staff_tg_users:
         try:
-            await bot.send_message(
+            await outbound.send_message(
+                bot,
+                Priority.SUMMARY,
                 chat_id=tg_user.telegram_id,
                 text=(
                     f"Attivita completata!\n\n"
@@ -1485,64 +1483,52 @@ async def _handle_task_completion(bot, task: ScheduledTask) -> None:
 
 
 async def send_scheduled_task_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Send reminders 48h before ScheduledTask deadline."""
-    now = timezone.now()
-    window_start = now + timedelta(hours=47, minutes=55)
-    window_end = now + timedelta(hours=48, minutes=5)
-
-    tasks = ScheduledTask.objects.filter(
-        deadline__gte=window_start,
-        deadline__lte=window_end,
-        notification_sent=False,
-        completed=False,
-    )
-
-    async for task in tasks:
-        async for volontario in task.volontari.all():
-            try:
-                tg_user = await TelegramUser.objects.aget(volontario=volontario)
-            except TelegramUser.DoesNotExist:
-                continue
-
-            # Build a plain-text preview of checklist items
-            checklist_lines = []
-            async for item in ChecklistItem.objects.filter(
-                scheduled_task=task
-            ).order_by("ordine"):
-                checklist_lines.append(f"- {item.descrizione}")
-            checklist_text = "\n".join(checklist_lines)
-
-            keyboard = InlineKeyboardMarkup(
+    """Queue reminders 48h before ScheduledTask deadline."""
+    async for task in deadlines.due_task_reminders(timezone.now()):
+        # Build a plain-text preview of checklist items
+        checklist_lines = []
+        async for item in ChecklistItem.objects.filter(scheduled_task=task).order_by(
+            "ordine"
+        ):
+            checklist_lines.append(f"- {item.descrizione}")
+        checklist_text = "\n".join(checklist_lines)
+
+        keyboard = InlineKeyboardMarkup(
+            [
                 [
-                    [
-                        InlineKeyboardButton(
-                            "Inizia Timbratura",
-                            callback_data=f"task_start:{task.pkid}",
-                        )
-                    ]
+                    InlineKeyboardButton(
+                        "Inizia Timbratura",
+                        callback_data=f"task_start:{task.pkid}",
+                    )
                 ]
-            )
-
-            try:
-                await context.bot.send_message(
-                    chat_id=tg_user.telegram_id,
-                    text=(
-                        f"Attivita programmata in scadenza!\n\n"
-                        f"{task.nome}\n"
-                        f"Scadenza: {timezone.localtime(task.deadline):%d/%m/%Y %H:%M}\n\n"
-                        f"Checklist:\n{checklist_text}\n\n"
-                        f"Premi il pulsante per registrare la tua entrata."
-                    ),
-                    reply_markup=keyboard,
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to send task reminder to {tg_user.telegram_id}: {e}"
-                )
+            ]
+        )
+        text = (
+            f"Attivita programmata in scadenza!\n\n"
+            f"{task.nome}\n"
+            f"Scadenza: {timezone.localtime(task.deadline):%d/%m/%Y %H:%M}\n\n"
+            f"Checklist:\n{checklist_text}\n\n"
+            f"Premi il pulsante per registrare la tua entrata."
+        )
 
-        task.notification_sent = True
-        await task.asave(update_fields=["notification_sent"])
-        logger.info(f"Sent reminders for scheduled task {task.pkid} ({task.nome})")
+        messages = [
+            outbox.build_message(
+                f"task-reminder:{task.pkid}:{telegram_id}",
+                telegram_id,
+                text,
+                reply_markup=keyboard,
+            )
+            async for telegram_id in TelegramUser.objects.filter(
+                volontario__scheduled_tasks=task
+            ).values_list("telegram_id", flat=True)
+        ]
+
+        await outbox.aenqueue(
+            messages,
+            ScheduledTask.objects.filter(pkid=task.pkid),
+            notification_sent=True,
+        )
+        logger.info(f"Queued reminders for scheduled task {task.pkid} ({task.nome})")
 
 
 async def handle_task_start_callback(
@@ -1555,16 +1541,14 @@ async def handle_task_start_callback(
     task_pkid = query.data.split(":", 1)[1]
 
     # Resolve volontario
-    user_id = query.from_user.id
-    try:
-        tg_user = await TelegramUser.objects.aget(telegram_id=user_id)
-    except TelegramUser.DoesNotExist:
+    identity = await get_identity(query.from_user.id)
+    if not identity.registered:
         await query.answer("Non sei registrato. Usa /start.", show_alert=True)
         return
-    if not tg_user.is_linked:
+    if not identity.is_linked:
         await query.answer("Account non associato. Usa /start.", show_alert=True)
         return
-    volontario = await Volontario.objects.aget(pk=tg_user.volontario_id)
+    volontario = identity.volontario
 
     # Get task
     try:
@@ -1589,23 +1573,18 @@ async def handle_task_start_callback(
         )
         return
 
-    # Check for open timbratura
-    open_entry = await Timbratura.objects.filter(
-        fkvolontario=volontario, clock_out__isnull=True
-    ).afirst()
-    if open_entry:
+    # Create timbratura linked to scheduled task, unless one is already open
+    entry, created = await Timbratura.objects.aclock_in(
+        volontario, fkscheduled_task=task
+    )
+    if not created:
         await query.answer(
-            f"Hai gia un'entrata aperta dalle {timezone.localtime(open_entry.clock_in):%H:%M del %d/%m/%Y}.\n"
+            f"Hai gia un'entrata aperta dalle {timezone.localtime(entry.clock_in):%H:%M del %d/%m/%Y}.\n"
             f"Usa /uscita prima di iniziare.",
             show_alert=True,
         )
         return
 
-    # Create timbratura linked to scheduled task
-    entry = await Timbratura.objects.acreate(
-        fkvolontario=volontario, fkscheduled_task=task
-    )
-
     await query.answer()
 
     # Delete the reminder message with the inline button
@@ -1636,14 +1615,10 @@ async def handle_checklist_toggle_callback(
     item_pkid = query.data.split(":", 1)[1]
 
     # Resolve volontario
-    user_id = query.from_user.id
-    try:
-        tg_user = await TelegramUser.objects.aget(telegram_id=user_id)
-    except TelegramUser.DoesNotExist:
+    identity = await get_identity(query.from_user.id)
+    if not identity.is_linked:
         return
-    if not tg_user.is_linked:
-        return
-    volontario = await Volontario.objects.aget(pk=tg_user.volontario_id)
+    volontario = identity.volontario
 
     # Get checklist item
     try:
@@ -1694,8 +1669,21 @@ async def handle_checklist_toggle_callback(
         await _handle_task_completion(context.bot, task)
 
 
+async def start_deadline_scheduler(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Arm the deadline scheduler driving the reminder jobs."""
+    await deadlines.start(
+        context.job_queue,
+        [
+            send_servizio_reminders,
+            send_clock_out_reminders,
+            send_scheduled_task_reminders,
+        ],
+    )
+
+
 async def post_init(application: Application) -> None:
-    """Register bot commands in the Telegram menu."""
+    """Register bot commands and start the outbound queue."""
+    await outbound.start(application.bot)
     commands = [
         BotCommand("start", "Avvia il bot"),
         BotCommand("help", "Mostra i comandi disponibili"),
@@ -1711,6 +1699,12 @@ async def post_init(application: Application) -> None:
     logger.info("Bot commands registered")
 
 
+async def post_shutdown(application: Application) -> None:
+    """Stop the outbound queue and close the shared HTTP clients."""
+    await outbound.stop()
+    await allertalom.close_client()
+
+
 async def send_weekly_summary(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a summary of all tasks scheduled for the current week to the main topic."""
     chat_id = settings.TELEGRAM_SURVEY_CHAT_ID
@@ -1766,7 +1760,9 @@ async def send_weekly_summary(context: ContextTypes.DEFAULT_TYPE) -> None:
     text = "\n".join(lines)
 
     try:
-        await context.bot.send_message(
+        await outbound.send_message(
+            context.bot,
+            Priority.SUMMARY,
             chat_id=chat_id,
             text=text,
             parse_mode="Markdown",
@@ -1779,83 +1775,263 @@ async def send_weekly_summary(context: ContextTypes.DEFAULT_TYPE) -> None:
 async def check_allerte(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Controlla AllertaLOM e avvisa il gruppo quando un'allerta cambia livello.
 
-    Le categorie da controllare in questa esecuzione arrivano da ``context.job.data``.
-    Per evitare notifiche duplicate confrontiamo il livello corrente con l'ultimo
-    memorizzato in ``AllertaMeteoStato`` e pubblichiamo un messaggio solo se cambia.
+    Le categorie da controllare in questa esecuzione arrivano da ``context.job.data``;
+    i comuni da ``ALLERTALOM_COMUNI_ISTAT``. Per ogni categoria i comuni della stessa
+    zona omogenea condividono una sola richiesta (vedi :class:`allertalom.ZoneMap`) e
+    tutte le richieste partono in parallelo sul client HTTP condiviso. Per evitare
+    notifiche duplicate confrontiamo il livello corrente con l'ultimo memorizzato in
+    ``AllertaMeteoStato`` e pubblichiamo un messaggio per zona solo se cambia.
+
+    Se ``context.job.data`` contiene ``interval`` il job si ripianifica da solo: più
+    spesso se c'è un'allerta in corso, più di rado se è tutto verde (vedi
+    :func:`allertalom.poll_interval`).
     """
+    data = context.job.data
+    max_level = None
+    try:
+        max_level = await _check_allerte(context, data["categories"])
+    finally:
+        if "interval" in data:
+            delay = allertalom.poll_interval(
+                data["interval"],
+                max_level,
+                settings.ALLERTALOM_STORM_FACTOR,
+                settings.ALLERTALOM_CALM_FACTOR,
+            )
+            context.job_queue.run_once(check_allerte, when=delay, data=data)
+
+
+async def _check_allerte(
+    context: ContextTypes.DEFAULT_TYPE, categories: list[int]
+) -> int | None:
+    """Un controllo di :func:`check_allerte`; ritorna il livello massimo trovato, o
+    ``None`` se qualche richiesta è fallita o non ci sono dati."""
     chat_id = settings.TELEGRAM_SURVEY_CHAT_ID
     if not chat_id:
         logger.warning("TELEGRAM_SURVEY_CHAT_ID not configured, skipping allerta check")
-        return
+        return None
 
-    categories = context.job.data["categories"]
-    comune = settings.ALLERTALOM_COMUNE_ISTAT
-    min_level = settings.ALLERTALOM_MIN_LEVEL
+    comuni = settings.ALLERTALOM_COMUNI_ISTAT or [settings.ALLERTALOM_COMUNE_ISTAT]
+    zone_map = allertalom.zone_map
 
-    for categoria in categories:
-        try:
-            items = await allertalom.fetch_forecast(categoria, comune)
-        except Exception as e:
-            logger.error("AllertaLOM fetch failed for category %s: %s", categoria, e)
+    # Zones learned in a previous run of the bot, for comuni not seen yet.
+    unknown = [
+        (categoria, comune)
+        for categoria in categories
+        for comune in comuni
+        if not zone_map.knows(categoria, comune)
+    ]
+    if unknown:
+        async for categoria, comune, codice_zona in AllertaMeteoStato.objects.filter(
+            cd_tipologia_gis__in=categories, cd_istat_comune__in=comuni
+        ).values_list("cd_tipologia_gis", "cd_istat_comune", "codice_zona"):
+            zone_map.seed(categoria, comune, codice_zona)
+
+    plans = {categoria: zone_map.plan(categoria, comuni) for categoria in categories}
+    requests = [
+        (categoria, comune) for categoria, plan in plans.items() for comune in plan
+    ]
+    forecasts = await allertalom.fetch_forecasts(
+        requests, horizon_hours=settings.ALLERTALOM_HORIZON_HOURS
+    )
+    await _archive_forecasts(forecasts)
+
+    # (categoria, zona) -> (alert, comuni): comuni queried separately because their
+    # zone was unknown still get a single message per zone.
+    zones: dict[tuple[int, str], tuple[dict, list[str]]] = {}
+    failed = False
+    for (categoria, queried), items in forecasts.items():
+        if isinstance(items, allertalom.CircuitOpenError):
+            # Already reported once by the breaker when it opened.
+            failed = True
+            continue
+        if isinstance(items, Exception):
+            failed = True
+            logger.error(
+                "AllertaLOM fetch failed for category %s, comune %s: %r",
+                categoria,
+                queried,
+                items,
+            )
             continue
 
-        alert = allertalom.current_alert(
-            items, timezone.now(), settings.ALLERTALOM_HORIZON_HOURS, min_level
+        alert = allertalom.cached_alert(
+            (categoria, queried),
+            items,
+            timezone.now(),
+            settings.ALLERTALOM_HORIZON_HOURS,
+            settings.ALLERTALOM_MIN_LEVEL,
         )
         if alert is None:
             logger.debug("No AllertaLOM data for category %s", categoria)
             continue
 
-        new_level = alert["cd_livello"]
-        state, created = await AllertaMeteoStato.objects.aget_or_create(
-            cd_istat_comune=comune,
+        served = zone_map.learn(
+            categoria, queried, plans[categoria][queried], alert["codice_zona"]
+        )
+        key = (categoria, alert["codice_zona"] or queried)
+        if key in zones:
+            zones[key][1].extend(served)
+        else:
+            zones[key] = (alert, list(served))
+
+    for (categoria, _), (alert, comuni_zona) in zones.items():
+        await _update_allerta_zone(context, chat_id, categoria, comuni_zona, alert)
+
+    stats = allertalom.cache_stats
+    logger.debug(
+        "AllertaLOM cache: HTTP %s hit/%s miss, alert %s hit/%s miss",
+        stats.http_hits,
+        stats.http_misses,
+        stats.alert_hits,
+        stats.alert_misses,
+    )
+
+    if failed or not zones:
+        return None
+    return max(alert["cd_livello"] for alert, _ in zones.values())
+
+
+async def _latest_snapshots(keys) -> dict[tuple[int, str], tuple[datetime, str]]:
+    """``(starts_at, levels)`` of the latest archived snapshot of each zone in ``keys``."""
+    latest = AllertaMeteoSnapshot.objects.filter(
+        cd_tipologia_gis=OuterRef("cd_tipologia_gis"),
+        codice_zona=OuterRef("codice_zona"),
+    ).order_by("-fetched_at", "-pk")
+    rows = AllertaMeteoSnapshot.objects.filter(
+        cd_tipologia_gis__in={categoria for categoria, _ in keys},
+        codice_zona__in={codice_zona for _, codice_zona in keys},
+        pk=Subquery(latest.values("pk")[:1]),
+    ).values_list("cd_tipologia_gis", "codice_zona", "starts_at", "levels")
+    return {
+        (categoria, codice_zona): (starts_at, levels)
+        async for categoria, codice_zona, starts_at, levels in rows
+    }
+
+
+async def _archive_forecasts(forecasts: dict) -> None:
+    """Append the fetched forecasts to the archive, one row per zone.
+
+    The whole forecast is archived, not just the part parsed up to the alert
+    horizon. A zone whose forecast is unchanged since its latest stored snapshot is
+    skipped.
+    """
+    now = timezone.now()
+    encoded: dict[tuple[int, str], tuple] = {}
+    for request, items in forecasts.items():
+        if isinstance(items, Exception) or not items:
+            continue
+        key = (request[0], items[0].codice_zona)
+        if key not in encoded:
+            full = allertalom.full_forecast(request, items)
+            encoded[key] = (full[0], allertalom.encode_levels(full))
+    if not encoded:
+        return
+
+    latest = await _latest_snapshots(encoded)
+    snapshots = [
+        AllertaMeteoSnapshot(
             cd_tipologia_gis=categoria,
-            defaults={
-                "cd_livello": new_level,
-                "livello": alert["livello"],
-                "nome_zona": alert["nome_zona"],
-                "codice_zona": alert["codice_zona"],
-            },
+            codice_zona=codice_zona,
+            nome_zona=item.nome_zona,
+            fetched_at=now,
+            starts_at=levels[0],
+            levels=levels[1],
         )
+        for (categoria, codice_zona), (item, levels) in encoded.items()
+        if latest.get((categoria, codice_zona)) != levels
+    ]
+    if snapshots:
+        await AllertaMeteoSnapshot.objects.abulk_create(snapshots)
+
+
+async def purge_allerta_archive(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Delete archived forecasts older than ``ALLERTALOM_ARCHIVE_DAYS``."""
+    cutoff = timezone.now() - timedelta(days=settings.ALLERTALOM_ARCHIVE_DAYS)
+    deleted, _ = await AllertaMeteoSnapshot.objects.filter(
+        fetched_at__lt=cutoff
+    ).adelete()
+    if deleted:
+        logger.info(f"Purged {deleted} archived AllertaLOM forecasts")
+
+
+async def _update_allerta_zone(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id,
+    categoria: int,
+    comuni: list[str],
+    alert: dict,
+) -> None:
+    """Aggiorna lo stato dei comuni di una zona e notifica una volta per variazione."""
+    min_level = settings.ALLERTALOM_MIN_LEVEL
+    new_level = alert["cd_livello"]
+    fields = {
+        "cd_livello": new_level,
+        "livello": alert["livello"],
+        "nome_zona": alert["nome_zona"],
+        "codice_zona": alert["codice_zona"],
+    }
 
-        old_level = 0 if created else state.cd_livello
+    states = {
+        state.cd_istat_comune: state
+        async for state in AllertaMeteoStato.objects.filter(
+            cd_tipologia_gis=categoria, cd_istat_comune__in=comuni
+        )
+    }
 
-        if created:
-            should_notify = new_level >= min_level
-        else:
-            should_notify = new_level != old_level and (
-                new_level >= min_level or old_level >= min_level
+    # Comuni to notify grouped by their previous level: normally the whole zone
+    # shares it, so this is a single message.
+    to_notify: dict[int, list[str]] = defaultdict(list)
+    new_states = []
+    refreshed = []
+    for comune in comuni:
+        state = states.get(comune)
+        if state is None:
+            new_states.append(
+                AllertaMeteoStato(
+                    cd_istat_comune=comune, cd_tipologia_gis=categoria, **fields
+                )
             )
+            if new_level >= min_level:
+                to_notify[0].append(comune)
+            continue
 
-        if not should_notify:
+        old_level = state.cd_livello
+        if new_level != old_level and (
+            new_level >= min_level or old_level >= min_level
+        ):
+            to_notify[old_level].append(comune)
+        elif any(getattr(state, field) != value for field, value in fields.items()):
             # Keep the stored zone/level fresh even when we don't notify.
-            if not created and (
-                state.cd_livello != new_level
-                or state.nome_zona != alert["nome_zona"]
-                or state.codice_zona != alert["codice_zona"]
-            ):
-                state.cd_livello = new_level
-                state.livello = alert["livello"]
-                state.nome_zona = alert["nome_zona"]
-                state.codice_zona = alert["codice_zona"]
-                await state.asave()
-            continue
+            refreshed.append(state)
+
+    if new_states:
+        await AllertaMeteoStato.objects.abulk_create(new_states, ignore_conflicts=True)
+    if refreshed:
+        await AllertaMeteoStato.objects.filter(
+            pk__in=[state.pk for state in refreshed]
+        ).aupdate(**fields, notified_at=timezone.now())
 
+    for old_level, notified in to_notify.items():
         message = allertalom.build_message(
-            categoria, alert, old_level, new_level, comune
+            categoria, alert, old_level, new_level, notified
         )
         try:
-            await context.bot.send_message(
+            await outbound.send_message(
+                context.bot,
+                Priority.ALERT,
                 chat_id=chat_id,
                 message_thread_id=settings.ALLERTALOM_THREAD_ID,
                 text=message,
                 parse_mode="Markdown",
             )
             logger.info(
-                "Sent AllertaLOM alert for category %s (%s -> %s)",
+                "Sent AllertaLOM alert for category %s, zone %s (%s -> %s, %s comuni)",
                 categoria,
+                alert["codice_zona"],
                 old_level,
                 new_level,
+                len(notified),
             )
         except Exception as e:
             logger.error(
@@ -1863,31 +2039,55 @@ async def check_allerte(context: ContextTypes.DEFAULT_TYPE) -> None:
             )
             continue
 
-        state.cd_livello = new_level
-        state.livello = alert["livello"]
-        state.nome_zona = alert["nome_zona"]
-        state.codice_zona = alert["codice_zona"]
-        await state.asave()
+        await AllertaMeteoStato.objects.filter(
+            cd_tipologia_gis=categoria, cd_istat_comune__in=notified
+        ).aupdate(**fields, notified_at=timezone.now())
+
 
+def create_application(
+    jobs: bool = True, handlers: bool = True, concurrent_updates: int = 1
+) -> Application:
+    """Create and configure the bot application.
 
-def create_application() -> Application:
-    """Create and configure the bot application."""
+    ``jobs`` schedules the periodic jobs and ``handlers`` registers the update
+    handlers, so that in webhook mode the web workers only handle updates and a
+    single ``runbot --jobs-only`` process runs the jobs. Up to
+    ``concurrent_updates`` updates from different users are processed at once;
+    each user's updates stay in order.
+    """
     if not settings.TELEGRAM_BOT_TOKEN:
         raise ValueError("TELEGRAM_BOT_TOKEN non configurato in settings.py")
 
     application = (
         Application.builder()
         .token(settings.TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(OrderedUpdateProcessor(concurrent_updates))
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
-    # Schedule jobs
-    job_queue = application.job_queue
-    job_queue.run_repeating(send_servizio_reminders, interval=60, first=10)
+    if jobs:
+        _schedule_jobs(application.job_queue)
+    if handlers:
+        _add_handlers(application)
+    return application
+
+
+def _schedule_jobs(job_queue) -> None:
+    # Servizio, clock-out and scheduled task reminders are driven by the deadline
+    # scheduler, armed as soon as the job queue starts.
+    job_queue.run_once(start_deadline_scheduler, when=0)
+    job_queue.run_repeating(outbox.drain_outbox, interval=5, first=5)
+    job_queue.run_daily(outbox.purge_outbox, time=dt_time(3, 0, 0))
+    job_queue.run_repeating(
+        tasks.run_background_tasks,
+        interval=tasks.POLL_INTERVAL,
+        first=tasks.POLL_INTERVAL,
+    )
+    job_queue.run_daily(tasks.purge_background_tasks, time=dt_time(3, 5, 0))
+    job_queue.run_daily(purge_allerta_archive, time=dt_time(3, 10, 0))
     job_queue.run_repeating(close_expired_polls, interval=300, first=15)
-    job_queue.run_repeating(send_scheduled_task_reminders, interval=60, first=20)
-    job_queue.run_repeating(send_clock_out_reminders, interval=60, first=30)
     job_queue.run_daily(send_equipment_reminders, time=dt_time(20, 0, 0))
     job_queue.run_daily(
         send_weekly_summary,
@@ -1895,21 +2095,22 @@ def create_application() -> Application:
         days=(1,),
     )
 
-    # AllertaLOM: one repeating job per distinct polling interval, each checking
-    # the categories configured for that interval.
+    # AllertaLOM: one job per distinct polling interval, each checking the
+    # categories configured for that interval and rescheduling itself.
     allerta_by_interval: dict[int, list[int]] = defaultdict(list)
     for categoria, interval in settings.ALLERTALOM_MONITOR.items():
         allerta_by_interval[interval].append(categoria)
     for offset, (interval, categories) in enumerate(
         sorted(allerta_by_interval.items())
     ):
-        job_queue.run_repeating(
+        job_queue.run_once(
             check_allerte,
-            interval=interval,
-            first=40 + offset * 5,
-            data={"categories": categories},
+            when=40 + offset * 5,
+            data={"categories": categories, "interval": interval},
         )
 
+
+def _add_handlers(application: Application) -> None:
     # Conversation handler for /start and association flow
     start_conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
@@ -2005,10 +2206,49 @@ def create_application() -> Application:
     # Locked topic enforcement (group=-1 so it runs before all other handlers)
     application.add_handler(MessageHandler(filters.ALL, enforce_locked_topic), group=-1)
 
-    return application
 
+async def start_application(application: Application) -> None:
+    """Start ``application`` the way ``run_polling`` would, without fetching updates."""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
 
-def run_bot() -> None:
-    """Run the bot in polling mode."""
-    application = create_application()
+
+async def stop_application(application: Application) -> None:
+    """Counterpart of :func:`start_application`."""
+    if application.running:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+async def _run_jobs_forever(application: Application) -> None:
+    await start_application(application)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_application(application)
+
+
+def run_bot(jobs_only: bool = False) -> None:
+    """Run the bot in polling mode, or only its scheduled jobs.
+
+    ``jobs_only`` is for webhook deployments, where updates reach the ASGI app
+    (see :mod:`tg_bot.webhook`) and exactly one process runs the jobs.
+    """
+    if jobs_only:
+        application = create_application(handlers=False)
+        try:
+            asyncio.run(_run_jobs_forever(application))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    application = create_application(
+        concurrent_updates=settings.TELEGRAM_CONCURRENT_UPDATES
+    )
     application.run_polling(allowed_updates=Update.ALL_TYPES)
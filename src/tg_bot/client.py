@@ -0,0 +1,155 @@
+"""Process-wide Telegram client for synchronous Django code (signals, views, admin).
+
+Creating a ``telegram.Bot`` per call means a fresh connection pool, a TLS handshake
+and a ``getMe`` round trip every time, plus ``asyncio.run`` spinning up a new event
+loop. Instead, each worker process lazily starts one event loop in a daemon thread
+with one initialised ``Bot`` whose HTTP connections are kept alive; callers submit
+coroutines to it with :func:`run`.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from collections.abc import Awaitable, Callable
+
+from django.conf import settings
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a Telegram call submitted from sync code.
+DEFAULT_TIMEOUT = 30
+# Seconds to wait for a whole batch submitted with run_many().
+BATCH_TIMEOUT = 120
+CONNECTION_POOL_SIZE = 8
+
+
+class BotClient:
+    """One initialised ``Bot`` bound to an event loop running in a daemon thread."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._bot: Bot | None = None
+
+    def _ensure_started(self) -> None:
+        # Compare the PID so a client inherited through fork() (e.g. gunicorn
+        # --preload) is rebuilt in the child instead of reusing the parent's thread.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="telegram-client", daemon=True
+            )
+            thread.start()
+            try:
+                bot = Bot(
+                    token=self.token,
+                    request=HTTPXRequest(connection_pool_size=CONNECTION_POOL_SIZE),
+                )
+                future = asyncio.run_coroutine_threadsafe(bot.initialize(), loop)
+                try:
+                    future.result(DEFAULT_TIMEOUT)
+                except BaseException:
+                    future.cancel()
+                    raise
+            except BaseException:
+                # Don't leak a loop thread per failed attempt: the next call retries.
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(DEFAULT_TIMEOUT)
+                loop.close()
+                raise
+            self._loop, self._bot, self._pid = loop, bot, os.getpid()
+            logger.debug(f"Telegram client started in process {self._pid}")
+
+    def run[T](
+        self, fn: Callable[[Bot], Awaitable[T]], timeout: float = DEFAULT_TIMEOUT
+    ) -> T:
+        """Run ``fn(bot)`` on the client's loop and wait for its result."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(fn(self._bot), self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def run_many[T](
+        self,
+        fns: list[Callable[[Bot], Awaitable[T]]],
+        timeout: float = BATCH_TIMEOUT,
+    ) -> list[T | Exception]:
+        """Run every ``fn(bot)`` concurrently, one result per ``fn`` in order.
+
+        At most ``CONNECTION_POOL_SIZE`` calls are in flight at once. A call that
+        fails is returned as its exception instead of aborting the batch.
+        """
+
+        async def _gather():
+            semaphore = asyncio.Semaphore(CONNECTION_POOL_SIZE)
+
+            async def _call(fn):
+                async with semaphore:
+                    return await fn(self._bot)
+
+            return await asyncio.gather(
+                *(_call(fn) for fn in fns), return_exceptions=True
+            )
+
+        if not fns:
+            return []
+        return self.run(lambda bot: _gather(), timeout)
+
+    def close(self) -> None:
+        if self._pid != os.getpid() or self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._bot.shutdown(), self._loop).result(
+                DEFAULT_TIMEOUT
+            )
+        except Exception as e:
+            logger.debug(f"Error shutting down Telegram client: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._pid = self._loop = self._bot = None
+
+
+_client: BotClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BotClient:
+    """The shared client for ``settings.TELEGRAM_BOT_TOKEN``."""
+    global _client
+    token = settings.TELEGRAM_BOT_TOKEN
+    with _client_lock:
+        if _client is None or _client.token != token:
+            if _client is not None:
+                _client.close()
+            _client = BotClient(token)
+    return _client
+
+
+def run[T](fn: Callable[[Bot], Awaitable[T]], timeout: float = DEFAULT_TIMEOUT) -> T:
+    """Run ``fn(bot)`` with the shared bot, e.g. ``run(lambda bot: bot.get_me())``."""
+    return get_client().run(fn, timeout)
+
+
+def run_many[T](
+    fns: list[Callable[[Bot], Awaitable[T]]], timeout: float = BATCH_TIMEOUT
+) -> list[T | Exception]:
+    """Run ``fn(bot)`` for every ``fn`` concurrently with the shared bot."""
+    return get_client().run_many(fns, timeout)
+
+
+@atexit.register
+def _close_client() -> None:
+    if _client is not None:
+        _client.close()
@@ -0,0 +1,217 @@
+"""Deadline-driven scheduling of the bot's reminder jobs.
+
+Instead of polling the database every minute, :class:`DeadlineScheduler` computes
+when the next reminder is due from ``Servizio.data_ora`` / ``data_ora_fine`` and
+``ScheduledTask.deadline``, sleeps until then, runs the reminder jobs and re-arms
+itself. Saves of those models re-arm it (see :mod:`tg_bot.signals`): immediately in
+the bot process, and through a background task when the save happens elsewhere (e.g.
+the admin in a web worker), which the bot runs within ``tasks.POLL_INTERVAL``. Any
+change missed anyway is picked up at the latest after ``RESYNC_INTERVAL``.
+
+The "due" querysets select everything whose reminder moment has passed and is not
+yet flagged as sent, so reminders missed while the bot was down are caught up when
+it comes back (as long as the servizio/task is still ahead, or for clock-out
+reminders within ``CLOCK_OUT_CATCH_UP``).
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from telegram.ext import ContextTypes, JobQueue
+
+from servizio.models import ScheduledTask, Servizio
+
+from . import tasks
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# How long before its start a servizio reminder is sent.
+SERVIZIO_REMINDER_LEAD = timedelta(minutes=30)
+# How long before its deadline a scheduled task reminder is sent.
+TASK_REMINDER_LEAD = timedelta(hours=48)
+# Clock-out reminders missed during downtime are only caught up within this window.
+CLOCK_OUT_CATCH_UP = timedelta(hours=12)
+# Open polls are closed this long before their servizio starts.
+POLL_CLOSE_LEAD = timedelta(hours=12)
+# Upper bound on how long the scheduler sleeps without re-reading the database.
+RESYNC_INTERVAL = timedelta(minutes=5)
+# Minimum pause after a run, so a job that keeps failing cannot spin.
+MIN_INTERVAL = timedelta(seconds=10)
+
+JOB_NAME = "deadline-scheduler"
+
+
+def due_servizio_reminders(now: datetime):
+    """Servizi not yet started whose reminder moment has been reached."""
+    return Servizio.objects.filter(
+        data_ora__gt=now,
+        data_ora__lte=now + SERVIZIO_REMINDER_LEAD,
+        notification_sent=False,
+    )
+
+
+def due_clock_out_reminders(now: datetime):
+    """Servizi that ended recently and haven't had their clock-out reminder."""
+    return Servizio.objects.filter(
+        data_ora_fine__gte=now - CLOCK_OUT_CATCH_UP,
+        data_ora_fine__lte=now,
+        end_reminder_sent=False,
+    )
+
+
+def due_task_reminders(now: datetime):
+    """Open scheduled tasks whose reminder moment has been reached."""
+    return ScheduledTask.objects.filter(
+        deadline__gt=now,
+        deadline__lte=now + TASK_REMINDER_LEAD,
+        notification_sent=False,
+        completed=False,
+    )
+
+
+def due_poll_closures(now: datetime):
+    """Servizi with an open poll past its close date or starting soon."""
+    return Servizio.objects.filter(
+        poll_message_id__isnull=False,
+        poll_closed=False,
+    ).filter(Q(poll_close_date__lte=now) | Q(data_ora__lte=now + POLL_CLOSE_LEAD))
+
+
+def next_deadline(now: datetime) -> datetime | None:
+    """Earliest moment any reminder becomes due, or ``None`` if nothing is pending.
+
+    The result may be in the past when reminders are already due.
+    """
+    candidates = []
+
+    first_start = Servizio.objects.filter(
+        data_ora__gt=now, notification_sent=False
+    ).aggregate(first=Min("data_ora"))["first"]
+    if first_start:
+        candidates.append(first_start - SERVIZIO_REMINDER_LEAD)
+
+    first_end = Servizio.objects.filter(
+        data_ora_fine__gte=now - CLOCK_OUT_CATCH_UP, end_reminder_sent=False
+    ).aggregate(first=Min("data_ora_fine"))["first"]
+    if first_end:
+        candidates.append(first_end)
+
+    first_deadline = ScheduledTask.objects.filter(
+        deadline__gt=now, notification_sent=False, completed=False
+    ).aggregate(first=Min("deadline"))["first"]
+    if first_deadline:
+        candidates.append(first_deadline - TASK_REMINDER_LEAD)
+
+    return min(candidates, default=None)
+
+
+class DeadlineScheduler:
+    """Runs ``jobs`` whenever the next reminder deadline is reached."""
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        jobs: list[Callable[[ContextTypes.DEFAULT_TYPE], Awaitable[None]]],
+    ):
+        self.job_queue = job_queue
+        self.jobs = jobs
+        self._lock = asyncio.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Re-arm tasks started from other threads; the loop only keeps weak refs.
+        self._rearm_tasks: set[asyncio.Task] = set()
+
+    async def arm(self, not_before: datetime | None = None) -> datetime:
+        """(Re)schedule the single wake-up job at the next deadline."""
+        self._loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = timezone.now()
+            due = await sync_to_async(next_deadline)(now)
+            when = now + RESYNC_INTERVAL
+            if due is not None:
+                when = max(now, min(due, when))
+            if not_before is not None:
+                when = max(when, not_before)
+
+            for job in self.job_queue.get_jobs_by_name(JOB_NAME):
+                job.schedule_removal()
+            self.job_queue.run_once(self._fire, when=when, name=JOB_NAME)
+            logger.debug(f"Deadline scheduler armed for {when:%d/%m/%Y %H:%M:%S}")
+            return when
+
+    async def _fire(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        try:
+            for job in self.jobs:
+                try:
+                    await job(context)
+                except Exception as e:
+                    logger.error(f"Deadline job {job.__name__} failed: {e}")
+        finally:
+            await self.arm(not_before=timezone.now() + MIN_INTERVAL)
+
+    def rearm_threadsafe(self) -> None:
+        """Re-arm from any thread (e.g. a post_save handler run by the ORM)."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._start_rearm)
+
+    def _start_rearm(self) -> None:
+        task = self._loop.create_task(self.arm())
+        self._rearm_tasks.add(task)
+        task.add_done_callback(self._rearm_done)
+
+    def _rearm_done(self, task: asyncio.Task) -> None:
+        self._rearm_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Deadline scheduler re-arm failed: {task.exception()!r}")
+
+
+_scheduler: DeadlineScheduler | None = None
+
+
+async def start(job_queue: JobQueue, jobs) -> DeadlineScheduler:
+    """Create the process-wide scheduler and arm it (called from post_init)."""
+    global _scheduler
+    _scheduler = DeadlineScheduler(job_queue, jobs)
+    await _scheduler.arm()
+    return _scheduler
+
+
+def rearm() -> None:
+    """Re-arm the scheduler, also when it runs in another process.
+
+    In the bot process the scheduler is re-armed directly. Elsewhere a
+    :func:`rearm_now` background task is queued once the transaction commits; the
+    bot's task runner executes it. One pending task is enough for any number of
+    saves.
+    """
+    if _scheduler is not None:
+        _scheduler.rearm_threadsafe()
+    else:
+        transaction.on_commit(_queue_rearm)
+
+
+def _queue_rearm() -> None:
+    name = f"{rearm_now.__module__}.{rearm_now.__qualname__}"
+    pending = BackgroundTask.objects.filter(
+        name=name, status=BackgroundTask.Status.PENDING
+    )
+    if not pending.exists():
+        tasks.enqueue(rearm_now)
+
+
+def rearm_now() -> None:
+    """Background task: re-arm the scheduler running in this process.
+
+    Fails (and is retried) when run by a process without a scheduler, e.g. a
+    standalone ``runtasks``, so that the bot's own runner gets to execute it.
+    """
+    if _scheduler is None:
+        raise RuntimeError("No deadline scheduler in this process")
+    _scheduler.rearm_threadsafe()
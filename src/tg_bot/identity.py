@@ -0,0 +1,160 @@
+"""In-process cache of which Volontario a Telegram user is linked to.
+
+Nearly every interaction starts by resolving the sender's ``TelegramUser`` and its
+``Volontario``. :func:`get_identity` answers from a bounded LRU cache whose entries
+expire after ``TELEGRAM_IDENTITY_CACHE_TTL`` seconds, and loads both rows with one
+query on a miss. Saving or deleting a ``TelegramUser`` or a ``Volontario`` drops the
+affected entry (see ``tg_bot.signals``); changes made by another process are picked
+up when the entry expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import NamedTuple
+
+from django.conf import settings
+
+from volontario.models import Volontario
+
+from .models import TelegramUser
+
+
+class Identity(NamedTuple):
+    registered: bool
+    volontario: Volontario | None
+
+    @property
+    def is_linked(self) -> bool:
+        return self.volontario is not None
+
+
+UNREGISTERED = Identity(registered=False, volontario=None)
+
+
+@dataclass
+class IdentityStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evicted: int = 0
+    invalidated: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class IdentityCache:
+    """LRU cache of ``telegram_id -> Identity`` with a time-to-live per entry.
+
+    Used from the bot's event loop and from the threads running ORM signals, so
+    every access holds a lock.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = IdentityStats()
+        self._entries: OrderedDict[int, tuple[float, Identity]] = OrderedDict()
+        # Volontario pk -> telegram_id, to invalidate on Volontario changes.
+        self._by_volontario: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation: a lookup that raced with one is not stored.
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, telegram_id: int) -> Identity | None:
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            expires, identity = entry
+            if expires <= self.clock():
+                self._remove(telegram_id)
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(telegram_id)
+            self.stats.hits += 1
+            return identity
+
+    def put(
+        self, telegram_id: int, identity: Identity, generation: int | None = None
+    ) -> None:
+        """Store ``identity``, unless an invalidation happened since ``generation``."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(telegram_id)
+            self._entries[telegram_id] = (self.clock() + self.ttl, identity)
+            if identity.volontario is not None:
+                self._by_volontario[identity.volontario.pk] = telegram_id
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.stats.evicted += 1
+
+    def invalidate(self, telegram_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            if self._remove(telegram_id):
+                self.stats.invalidated += 1
+
+    def invalidate_volontario(self, volontario_pk) -> None:
+        with self._lock:
+            self.generation += 1
+            telegram_id = self._by_volontario.get(volontario_pk)
+            if telegram_id is not None and self._remove(telegram_id):
+                self.stats.invalidated += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_volontario.clear()
+            self.stats = IdentityStats()
+
+    def _remove(self, telegram_id: int) -> bool:
+        entry = self._entries.pop(telegram_id, None)
+        if entry is None:
+            return False
+        volontario = entry[1].volontario
+        if volontario is not None:
+            self._by_volontario.pop(volontario.pk, None)
+        return True
+
+
+cache = IdentityCache(
+    maxsize=settings.TELEGRAM_IDENTITY_CACHE_SIZE,
+    ttl=settings.TELEGRAM_IDENTITY_CACHE_TTL,
+)
+
+
+async def get_identity(telegram_id: int) -> Identity:
+    """Whether ``telegram_id`` is registered, and the Volontario it is linked to."""
+    identity = cache.get(telegram_id)
+    if identity is not None:
+        return identity
+
+    generation = cache.generation
+    tg_user = (
+        await TelegramUser.objects.select_related("volontario")
+        .filter(telegram_id=telegram_id)
+        .afirst()
+    )
+    if tg_user is None:
+        identity = UNREGISTERED
+    else:
+        identity = Identity(registered=True, volontario=tg_user.volontario)
+    cache.put(telegram_id, identity, generation)
+    return identity
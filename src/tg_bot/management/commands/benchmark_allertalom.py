@@ -0,0 +1,112 @@
+import timeit
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tg_bot import allertalom
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / "testdata"
+
+
+def parse_forecast_tree(xml_text: str) -> list[allertalom.ForecastItem]:
+    """Il parser precedente (albero completo + ``findtext``), come riferimento."""
+    root = ElementTree.fromstring(xml_text)
+    items = []
+    for item in root.findall("item"):
+        dt_raw = item.findtext("dtPrevisione")
+        cd_raw = item.findtext("cdLivello")
+        if dt_raw is None or cd_raw is None:
+            continue
+        try:
+            dt = datetime.fromtimestamp(int(dt_raw) / 1000, tz=UTC)
+            cd_livello = int(cd_raw)
+        except (ValueError, TypeError):
+            continue
+        items.append(
+            allertalom.ForecastItem(
+                dt=dt,
+                cd_livello=cd_livello,
+                livello=item.findtext("livello", "") or "",
+                nome_zona=item.findtext("nomeZonaOmogenea", "") or "",
+                codice_zona=item.findtext("codiceZonaOmogenea", "") or "",
+            )
+        )
+    return items
+
+
+def _candidates(xml_text: str, now: datetime, horizon: int) -> dict:
+    """Le varianti da confrontare: parsing seguito dal calcolo dell'allerta."""
+    xml_bytes = xml_text.encode()
+    until = now + timedelta(hours=horizon) + allertalom.PARSE_MARGIN
+    return {
+        "albero": lambda: allertalom.current_alert(
+            parse_forecast_tree(xml_text), now, horizon
+        ),
+        "streaming": lambda: allertalom.current_alert(
+            allertalom.parse_forecast(xml_bytes), now, horizon
+        ),
+        "streaming + orizzonte": lambda: allertalom.current_alert(
+            allertalom.parse_forecast(xml_bytes, until), now, horizon
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta il parser AllertaLOM ad albero con quello in streaming "
+        "(parsing + calcolo dell'allerta) su risposte registrate"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "fixtures",
+            nargs="*",
+            type=Path,
+            help=f"File XML da usare (default: {FIXTURES_DIR}/allertalom_*.xml)",
+        )
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=1000,
+            help="Esecuzioni per misura (default 1000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Misure ripetute, si tiene la migliore (default 5)",
+        )
+        parser.add_argument(
+            "--horizon",
+            type=int,
+            default=settings.ALLERTALOM_HORIZON_HOURS,
+            help="Orizzonte in ore (default ALLERTALOM_HORIZON_HOURS)",
+        )
+
+    def handle(self, *args, **options):
+        fixtures = options["fixtures"] or sorted(FIXTURES_DIR.glob("allertalom_*.xml"))
+        horizon = options["horizon"]
+
+        for path in fixtures:
+            xml_text = path.read_text()
+            items = allertalom.parse_forecast(xml_text)
+            # Le risposte registrate hanno date fisse: "adesso" è la prima previsione.
+            now = items[0].dt if items else datetime.now(UTC)
+            candidates = _candidates(xml_text, now, horizon)
+
+            self.stdout.write(f"{path.name} ({len(items)} previsioni)")
+            baseline = None
+            for name, fn in candidates.items():
+                best = min(
+                    timeit.repeat(
+                        fn, number=options["number"], repeat=options["repeat"]
+                    )
+                )
+                per_call = best / options["number"] * 1e6
+                baseline = baseline or per_call
+                self.stdout.write(
+                    f"  {name:<22} {per_call:9.1f} µs  ({baseline / per_call:.2f}x)"
+                )
@@ -6,6 +6,21 @@ from tg_bot.bot import run_bot
 class Command(BaseCommand):
     help = "Avvia il bot Telegram in modalità polling"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jobs-only",
+            action="store_true",
+            help=(
+                "Esegue solo le attività pianificate, senza ricevere aggiornamenti "
+                "(modalità webhook: gli aggiornamenti arrivano all'app ASGI)"
+            ),
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Avvio del bot Telegram..."))
-        run_bot()
+        if options["jobs_only"]:
+            self.stdout.write(
+                self.style.SUCCESS("Avvio delle attività pianificate del bot...")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("Avvio del bot Telegram..."))
+        run_bot(jobs_only=options["jobs_only"])
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tg_bot import tasks
+
+
+class Command(BaseCommand):
+    help = "Esegue le attività in background in coda (invio sondaggi, login web, ...)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Esegue le attività in scadenza una sola volta ed esce",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            executed = tasks.run_pending()
+            self.stdout.write(self.style.SUCCESS(f"Eseguite {executed} attività"))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Avvio dell'esecutore di attività..."))
+        interval = tasks.POLL_INTERVAL.total_seconds()
+        try:
+            while True:
+                if not tasks.run_pending():
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,35 @@
+# Generated by Django 6.1.2 on 2026-10-18 10:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0004_allertameteostato'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dedupe_key', models.CharField(max_length=200, unique=True)),
+                ('chat_id', models.BigIntegerField()),
+                ('payload', models.JSONField(default=dict)),
+                ('priority', models.PositiveSmallIntegerField(default=1)),
+                ('status', models.CharField(choices=[('pending', 'In attesa'), ('sent', 'Inviato'), ('failed', 'Fallito')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Messaggio in uscita',
+                'verbose_name_plural': 'Messaggi in uscita',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx')],
+            },
+        ),
+    ]
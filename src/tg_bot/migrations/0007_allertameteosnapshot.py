@@ -0,0 +1,31 @@
+# Generated by Django 6.1.2 on 2026-10-18 10:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tg_bot', '0006_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllertaMeteoSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cd_tipologia_gis', models.IntegerField()),
+                ('codice_zona', models.CharField(blank=True, max_length=32)),
+                ('nome_zona', models.CharField(blank=True, max_length=128)),
+                ('fetched_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('starts_at', models.DateTimeField()),
+                ('levels', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Archivio previsione meteo',
+                'verbose_name_plural': 'Archivio previsioni meteo',
+                'indexes': [models.Index(fields=['cd_tipologia_gis', 'codice_zona', 'fetched_at'], name='allerta_snapshot_zone_idx')],
+            },
+        ),
+    ]
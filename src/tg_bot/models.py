@@ -2,6 +2,7 @@ import secrets
 from datetime import timedelta
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 
@@ -154,3 +155,119 @@ class AllertaMeteoStato(models.Model):
 
     def __str__(self) -> str:
         return f"Comune {self.cd_istat_comune} / tipologia {self.cd_tipologia_gis}: {self.livello or self.cd_livello}"
+
+
+class AllertaMeteoSnapshot(models.Model):
+    """Previsione AllertaLOM scaricata per una zona omogenea, archiviata per analisi.
+
+    I livelli orari a partire da ``starts_at`` sono salvati in ``levels`` codificati a
+    differenze (vedi :func:`tg_bot.allertalom.encode_levels`): una riga per previsione
+    invece di una per ora. Le previsioni identiche alla precedente non vengono
+    ripetute; quelle più vecchie di ``ALLERTALOM_ARCHIVE_DAYS`` vengono cancellate.
+    """
+
+    cd_tipologia_gis = models.IntegerField()
+    codice_zona = models.CharField(max_length=32, blank=True)
+    nome_zona = models.CharField(max_length=128, blank=True)
+    fetched_at = models.DateTimeField(default=timezone.now, db_index=True)
+    starts_at = models.DateTimeField()
+    levels = models.TextField()
+
+    class Meta:
+        verbose_name = "Archivio previsione meteo"
+        verbose_name_plural = "Archivio previsioni meteo"
+        indexes = [
+            models.Index(
+                fields=["cd_tipologia_gis", "codice_zona", "fetched_at"],
+                name="allerta_snapshot_zone_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Zona {self.codice_zona} / tipologia {self.cd_tipologia_gis} @ {self.fetched_at:%d/%m/%Y %H:%M}"
+
+
+class OutboxMessage(models.Model):
+    """A Telegram message waiting to be delivered by the bot's outbox drainer.
+
+    Jobs write rows here in the same transaction that marks their work as done, so a
+    crash or restart of the bot never loses or duplicates a notification: pending rows
+    are picked up again on the next drain, and ``dedupe_key`` makes enqueuing the same
+    notification twice a no-op.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "In attesa"
+        SENT = "sent", "Inviato"
+        FAILED = "failed", "Fallito"
+
+    dedupe_key = models.CharField(max_length=200, unique=True)
+    chat_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict)
+    priority = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Set by the drain run delivering the row, which also pushes next_attempt_at
+    # forward by the claim lease so no other drainer picks it up meanwhile.
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Messaggio in uscita"
+        verbose_name_plural = "Messaggi in uscita"
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="outbox_status_due_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.dedupe_key} → {self.chat_id} ({self.get_status_display()})"
+
+
+class BackgroundTask(models.Model):
+    """A deferred call executed by the background task runner.
+
+    Request handlers and signals enqueue rows here instead of calling slow external
+    services inline; the runner (``runbot`` or ``runtasks``) imports ``name`` and calls
+    it with ``kwargs``, retrying failures with back-off.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "In attesa"
+        RUNNING = "running", "In esecuzione"
+        DONE = "done", "Completato"
+        FAILED = "failed", "Fallito"
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Attività in background"
+        verbose_name_plural = "Attività in background"
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="bgtask_status_due_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.get_status_display()})"
@@ -0,0 +1,268 @@
+"""Rate-limited outbound queue for messages sent by the bot's scheduled jobs.
+
+Telegram enforces roughly 30 messages/second overall, one message/second per private
+chat and 20 messages/minute per group. Jobs that fan out notifications submit their
+calls here instead of calling the bot directly: a single worker releases them in
+priority order (alerts, then reminders, then summaries) through token buckets and
+transparently retries calls rejected with ``RetryAfter``.
+
+When no queue is running (tests, Django-side code) calls go straight to the bot.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from enum import IntEnum
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram flood limits (messages per second) and allowed bursts.
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 3
+
+# How many times a call rejected with RetryAfter is re-queued before giving up.
+MAX_RETRIES = 5
+
+
+class Priority(IntEnum):
+    """Delivery lanes; lower values are released first."""
+
+    ALERT = 0
+    REMINDER = 1
+    SUMMARY = 2
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens/second, holding at most ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds to wait before a token is available (0 if one is available now)."""
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        """Block the bucket until ``until`` (e.g. after a RetryAfter)."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0
+
+
+def is_group_chat(chat_id) -> bool:
+    """Group and supergroup chat IDs are negative; private chats are positive."""
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        # @channelusername
+        return True
+
+
+@dataclass
+class _Call:
+    method: str
+    kwargs: dict
+    priority: Priority
+    future: asyncio.Future
+    not_before: float = 0.0
+    attempts: int = 0
+    chat_id: object = field(init=False)
+
+    def __post_init__(self):
+        self.chat_id = self.kwargs.get("chat_id")
+
+
+class OutboundQueue:
+    """Releases bot API calls in priority order without exceeding Telegram limits."""
+
+    def __init__(
+        self,
+        bot,
+        global_rate: float = GLOBAL_RATE,
+        private_rate: float = PRIVATE_CHAT_RATE,
+        group_rate: float = GROUP_CHAT_RATE,
+    ):
+        self.bot = bot
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._private_rate = private_rate
+        self._group_rate = group_rate
+        self._chats: dict[object, TokenBucket] = {}
+        self._lanes: dict[Priority, deque[_Call]] = {p: deque() for p in Priority}
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker and cancel calls still waiting in the queue."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        for lane in self._lanes.values():
+            while lane:
+                lane.popleft().future.cancel()
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def submit(
+        self, method: str, priority: Priority = Priority.REMINDER, **kwargs
+    ) -> asyncio.Future:
+        """Queue ``bot.<method>(**kwargs)``; the future resolves with its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(_Call(method, kwargs, priority, future))
+        self._wakeup.set()
+        return future
+
+    async def call(self, method: str, priority: Priority = Priority.REMINDER, **kwargs):
+        return await self.submit(method, priority, **kwargs)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(self._group_rate, capacity=GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(self._private_rate)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _next_ready(self, now: float) -> tuple[_Call | None, float | None]:
+        """Pick the first releasable call, or return how long until one may be.
+
+        Lanes are scanned in priority order. A call blocked by its chat's bucket does
+        not hold back calls for other chats, but later calls for the same chat wait
+        behind it so per-chat ordering is preserved.
+        """
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return None, global_delay
+
+        wait = None
+        blocked_chats = set()
+        for priority in Priority:
+            for queued in self._lanes[priority]:
+                if queued.chat_id in blocked_chats:
+                    continue
+                delay = max(
+                    queued.not_before - now,
+                    self._chat_bucket(queued.chat_id).delay(now),
+                )
+                if delay <= 0:
+                    self._lanes[priority].remove(queued)
+                    return queued, None
+                blocked_chats.add(queued.chat_id)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            queued, wait = self._next_ready(now)
+            if queued is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except TimeoutError:
+                    pass
+                continue
+
+            self._global.consume(now)
+            self._chat_bucket(queued.chat_id).consume(now)
+            task = asyncio.create_task(self._deliver(queued))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, queued: _Call) -> None:
+        if queued.future.cancelled():
+            return
+        try:
+            result = await getattr(self.bot, queued.method)(**queued.kwargs)
+        except RetryAfter as e:
+            queued.attempts += 1
+            if queued.attempts > MAX_RETRIES:
+                if not queued.future.done():
+                    queued.future.set_exception(e)
+                return
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            resume_at = time.monotonic() + retry_after
+            logger.warning(
+                f"Flood limit hit on {queued.method} to {queued.chat_id}, "
+                f"retrying in {retry_after}s (attempt {queued.attempts})"
+            )
+            queued.not_before = resume_at
+            self._chat_bucket(queued.chat_id).pause(resume_at)
+            # Re-queue at the head of its lane so it keeps its place.
+            self._lanes[queued.priority].appendleft(queued)
+            self._wakeup.set()
+        except Exception as e:
+            if not queued.future.done():
+                queued.future.set_exception(e)
+        else:
+            if not queued.future.done():
+                queued.future.set_result(result)
+
+
+_queue: OutboundQueue | None = None
+
+
+async def start(bot) -> OutboundQueue:
+    """Start the process-wide queue for ``bot`` (called from the bot's post_init)."""
+    global _queue
+    if _queue is None:
+        _queue = OutboundQueue(bot)
+        _queue.start()
+    return _queue
+
+
+async def stop() -> None:
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
+
+
+async def call(bot, method: str, priority: Priority = Priority.REMINDER, **kwargs):
+    """Run ``bot.<method>(**kwargs)`` through the queue if one is running for ``bot``."""
+    if _queue is not None and _queue.bot is bot:
+        return await _queue.call(method, priority, **kwargs)
+    return await getattr(bot, method)(**kwargs)
+
+
+async def send_message(bot, priority: Priority = Priority.REMINDER, **kwargs):
+    """Queue a ``send_message`` call. Raises if delivery ultimately fails."""
+    return await call(bot, "send_message", priority, **kwargs)
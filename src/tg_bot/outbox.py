@@ -0,0 +1,199 @@
+"""Durable outbox for notifications sent by the bot's scheduled jobs.
+
+Jobs build :class:`~tg_bot.models.OutboxMessage` rows with :func:`build_message` and
+store them with :func:`enqueue`, which also flips the job's "sent" flag in the same
+transaction. :func:`drain_outbox` runs periodically in the bot process and delivers
+due rows through the outbound queue, retrying transient failures with exponential
+back-off.
+
+Each drain run first claims its rows (``claim_token`` plus a lease on
+``next_attempt_at``), so two drainers never send the same row, and marks every row
+sent as soon as Telegram accepts it. After a crash only the rows in flight at that
+moment are sent again, once their lease expires: delivery is at-least-once.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from uuid import UUID, uuid4
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import ContextTypes
+
+from tg_bot import outbound
+from tg_bot.outbound import Priority
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Rows delivered per drain run and how many of them are in flight at once.
+DRAIN_BATCH_SIZE = 200
+DRAIN_CONCURRENCY = 10
+# How long claimed rows are reserved for the drain run that claimed them.
+CLAIM_LEASE = timedelta(minutes=10)
+
+# Retry policy for transient failures.
+MAX_ATTEMPTS = 8
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+
+# Delivered rows are kept this long so their dedupe keys keep working.
+RETENTION = timedelta(days=30)
+
+
+def build_message(
+    dedupe_key: str,
+    chat_id: int,
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    priority: Priority = Priority.REMINDER,
+    **kwargs,
+) -> OutboxMessage:
+    """Build an unsaved outbox row for a ``send_message`` call."""
+    payload = {"text": text, **kwargs}
+    if reply_markup is not None:
+        payload["reply_markup"] = reply_markup.to_dict()
+    return OutboxMessage(
+        dedupe_key=dedupe_key,
+        chat_id=chat_id,
+        payload=payload,
+        priority=priority,
+    )
+
+
+def enqueue(messages: list[OutboxMessage], flag_queryset=None, **flag_updates) -> None:
+    """Store ``messages`` and apply ``flag_queryset.update(**flag_updates)`` atomically.
+
+    Messages whose ``dedupe_key`` already exists are silently skipped.
+    """
+    with transaction.atomic():
+        OutboxMessage.objects.bulk_create(messages, ignore_conflicts=True)
+        if flag_queryset is not None:
+            flag_queryset.update(**flag_updates)
+
+
+aenqueue = sync_to_async(enqueue)
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+async def _deliver(bot, message: OutboxMessage) -> Exception | None:
+    """Send one outbox row. Returns the exception on failure, ``None`` on success."""
+    kwargs = dict(message.payload)
+    if "reply_markup" in kwargs:
+        kwargs["reply_markup"] = InlineKeyboardMarkup.de_json(
+            kwargs["reply_markup"], bot
+        )
+    try:
+        await outbound.send_message(
+            bot, Priority(message.priority), chat_id=message.chat_id, **kwargs
+        )
+    except Exception as e:
+        return e
+    return None
+
+
+async def _claim(now) -> tuple[list[OutboxMessage], UUID]:
+    """Reserve up to DRAIN_BATCH_SIZE due rows for this run and return them."""
+    token = uuid4()
+    due = OutboxMessage.objects.filter(
+        status=OutboxMessage.Status.PENDING, next_attempt_at__lte=now
+    )
+    ids = [
+        pk
+        async for pk in due.order_by("priority", "created_at").values_list(
+            "pk", flat=True
+        )[:DRAIN_BATCH_SIZE]
+    ]
+    if not ids:
+        return [], token
+    # Conditional on the row still being due: a concurrent drainer that claimed it
+    # first has already moved next_attempt_at past now.
+    await due.filter(pk__in=ids).aupdate(
+        claim_token=token, next_attempt_at=now + CLAIM_LEASE
+    )
+    claimed = [
+        message
+        async for message in OutboxMessage.objects.filter(
+            claim_token=token, status=OutboxMessage.Status.PENDING
+        ).order_by("priority", "created_at")
+    ]
+    return claimed, token
+
+
+async def _record(message: OutboxMessage, token: UUID, error: Exception | None) -> bool:
+    """Persist the outcome of one delivery. Returns whether it was sent."""
+    mine = OutboxMessage.objects.filter(
+        pk=message.pk, claim_token=token, status=OutboxMessage.Status.PENDING
+    )
+    if error is None:
+        await mine.aupdate(status=OutboxMessage.Status.SENT, sent_at=timezone.now())
+        return True
+
+    message.attempts += 1
+    # Blocked bot / invalid chat will never succeed: give up straight away.
+    permanent = isinstance(error, (Forbidden, BadRequest))
+    if permanent or message.attempts >= MAX_ATTEMPTS:
+        status = OutboxMessage.Status.FAILED
+        next_attempt_at = message.next_attempt_at
+        logger.error(
+            f"Giving up on outbox message {message.dedupe_key} "
+            f"after {message.attempts} attempts: {error}"
+        )
+    else:
+        status = OutboxMessage.Status.PENDING
+        next_attempt_at = timezone.now() + _retry_delay(message.attempts)
+        logger.warning(
+            f"Outbox message {message.dedupe_key} failed "
+            f"(attempt {message.attempts}), retrying later: {error}"
+        )
+    await mine.aupdate(
+        attempts=message.attempts,
+        last_error=str(error),
+        status=status,
+        next_attempt_at=next_attempt_at,
+    )
+    return False
+
+
+async def drain_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Deliver due outbox rows, most urgent first."""
+    started = time.monotonic()
+    due, token = await _claim(timezone.now())
+    if not due:
+        return
+
+    semaphore = asyncio.Semaphore(DRAIN_CONCURRENCY)
+
+    async def _bounded(message: OutboxMessage) -> bool:
+        async with semaphore:
+            error = await _deliver(context.bot, message)
+            # Recorded right away, so a crash later in the batch does not resend it.
+            return await _record(message, token, error)
+
+    results = await asyncio.gather(*(_bounded(m) for m in due))
+
+    sent = sum(results)
+    logger.info(
+        f"Outbox drained: {sent} sent, {len(results) - sent} failed, "
+        f"{time.monotonic() - started:.2f}s"
+    )
+
+
+async def purge_outbox(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Delete delivered or abandoned rows older than the retention period."""
+    deleted, _ = (
+        await OutboxMessage.objects.exclude(status=OutboxMessage.Status.PENDING)
+        .filter(created_at__lt=timezone.now() - RETENTION)
+        .adelete()
+    )
+    if deleted:
+        logger.info(f"Purged {deleted} old outbox messages")
@@ -0,0 +1,35 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from servizio.models import ScheduledTask, Servizio
+from volontario.models import Volontario
+
+from . import deadlines, identity
+from .models import TelegramUser
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Servizio)
+@receiver(post_save, sender=ScheduledTask)
+def rearm_deadline_scheduler(sender, instance, **kwargs):
+    """A new or edited servizio/task may move the next reminder deadline."""
+    deadlines.rearm()
+
+
+@receiver(post_save, sender=TelegramUser)
+@receiver(post_delete, sender=TelegramUser)
+def invalidate_identity(sender, instance, **kwargs):
+    """Drop the cached identity; again on commit, in case it was re-read meanwhile."""
+    identity.cache.invalidate(instance.telegram_id)
+    transaction.on_commit(lambda: identity.cache.invalidate(instance.telegram_id))
+
+
+@receiver(post_save, sender=Volontario)
+@receiver(post_delete, sender=Volontario)
+def invalidate_volontario_identity(sender, instance, **kwargs):
+    identity.cache.invalidate_volontario(instance.pk)
+    transaction.on_commit(lambda: identity.cache.invalidate_volontario(instance.pk))
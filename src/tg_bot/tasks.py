@@ -0,0 +1,147 @@
+"""Database-backed background task runner.
+
+Code on the request/save path calls :func:`enqueue` with a module-level function and
+JSON-serialisable keyword arguments; the call is stored as a
+:class:`~tg_bot.models.BackgroundTask` row (in the caller's transaction, so it only
+exists if the save commits) and returns immediately. :func:`run_pending` executes due
+tasks; it runs every few seconds inside ``runbot`` and can also be run on its own with
+the ``runtasks`` management command.
+
+Tasks are claimed with a conditional UPDATE, so several runners can share the table
+without executing a task twice. Failures are retried with exponential back-off; errors
+Telegram reports as permanent (blocked bot, deleted message) are not retried.
+"""
+
+import logging
+from collections.abc import Callable
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from telegram.error import BadRequest, Forbidden
+from telegram.ext import ContextTypes
+
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# How often runners look for due tasks, and how many they take per pass.
+POLL_INTERVAL = timedelta(seconds=2)
+BATCH_SIZE = 50
+
+# Retry policy for failed tasks.
+MAX_ATTEMPTS = 5
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+
+# Tasks left "running" this long were orphaned by a crashed runner and are re-queued.
+STALE_AFTER = timedelta(minutes=10)
+
+# Finished rows are kept this long for inspection in the admin.
+RETENTION = timedelta(days=7)
+
+PERMANENT_ERRORS = (Forbidden, BadRequest)
+
+
+def enqueue(func: Callable, **kwargs) -> BackgroundTask:
+    """Schedule ``func(**kwargs)`` to run in the background."""
+    return BackgroundTask.objects.create(
+        name=f"{func.__module__}.{func.__qualname__}", kwargs=kwargs
+    )
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def _claim(task: BackgroundTask) -> bool:
+    """Atomically move ``task`` from pending to running; False if another runner won."""
+    now = timezone.now()
+    claimed = BackgroundTask.objects.filter(
+        pk=task.pk, status=BackgroundTask.Status.PENDING
+    ).update(status=BackgroundTask.Status.RUNNING, started_at=now)
+    task.status, task.started_at = BackgroundTask.Status.RUNNING, now
+    return claimed == 1
+
+
+def run_task(task: BackgroundTask) -> bool:
+    """Execute one claimed task and record its outcome. Returns True on success."""
+    try:
+        import_string(task.name)(**task.kwargs)
+    except Exception as e:
+        task.attempts += 1
+        task.last_error = str(e)
+        if isinstance(e, PERMANENT_ERRORS) or task.attempts >= MAX_ATTEMPTS:
+            task.status = BackgroundTask.Status.FAILED
+            task.finished_at = timezone.now()
+            logger.error(
+                f"Background task {task.name} (id={task.pk}) failed "
+                f"after {task.attempts} attempts: {e}"
+            )
+        else:
+            task.status = BackgroundTask.Status.PENDING
+            task.next_attempt_at = timezone.now() + _retry_delay(task.attempts)
+            logger.warning(
+                f"Background task {task.name} (id={task.pk}) failed "
+                f"(attempt {task.attempts}), retrying later: {e}"
+            )
+        task.save(
+            update_fields=[
+                "attempts",
+                "last_error",
+                "status",
+                "next_attempt_at",
+                "finished_at",
+            ]
+        )
+        return False
+
+    task.status = BackgroundTask.Status.DONE
+    task.finished_at = timezone.now()
+    task.save(update_fields=["status", "finished_at"])
+    return True
+
+
+def run_pending(limit: int = BATCH_SIZE) -> int:
+    """Run due tasks, oldest first. Returns how many were executed."""
+    now = timezone.now()
+    BackgroundTask.objects.filter(
+        status=BackgroundTask.Status.RUNNING, started_at__lt=now - STALE_AFTER
+    ).update(status=BackgroundTask.Status.PENDING)
+
+    due = BackgroundTask.objects.filter(
+        status=BackgroundTask.Status.PENDING, next_attempt_at__lte=now
+    ).order_by("next_attempt_at", "pk")[:limit]
+
+    executed = 0
+    for task in due:
+        if _claim(task):
+            run_task(task)
+            executed += 1
+    return executed
+
+
+def purge_finished() -> int:
+    """Delete finished tasks older than the retention period."""
+    deleted, _ = (
+        BackgroundTask.objects.filter(
+            status__in=[BackgroundTask.Status.DONE, BackgroundTask.Status.FAILED]
+        )
+        .filter(created_at__lt=timezone.now() - RETENTION)
+        .delete()
+    )
+    return deleted
+
+
+async def run_background_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Bot job running due background tasks."""
+    # Not thread-sensitive: tasks block on network calls and must not stall the
+    # thread the bot's handlers use for their ORM queries.
+    await sync_to_async(run_pending, thread_sensitive=False)()
+
+
+async def purge_background_tasks(context: ContextTypes.DEFAULT_TYPE) -> None:
+    deleted = await sync_to_async(purge_finished)()
+    if deleted:
+        logger.info(f"Purged {deleted} old background tasks")
@@ -1,16 +1,62 @@
+import asyncio
+import json
+import tempfile
+import threading
 from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from django.test import TestCase, override_settings
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
+from telegram import Update
 from telegram.constants import ChatMemberStatus
-
-from tg_bot import allertalom, bot
-from tg_bot.models import AllertaMeteoStato, TelegramUser
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from telegram.ext import Application, CommandHandler
+from telegram.request import BaseRequest
+
+from servizio.models import (
+    RiepilogoOre,
+    ScheduledTask,
+    Servizio,
+    Timbratura,
+    VolontarioServizioMap,
+)
+from tg_bot import (
+    allertalom,
+    bot,
+    client,
+    deadlines,
+    identity,
+    outbound,
+    outbox,
+    tasks,
+    webhook,
+)
+from tg_bot.management.commands.benchmark_allertalom import parse_forecast_tree
+from tg_bot.models import (
+    AllertaMeteoSnapshot,
+    AllertaMeteoStato,
+    BackgroundTask,
+    OutboxMessage,
+    TelegramUser,
+    WebLoginRequest,
+)
+from tg_bot.updates import OrderedUpdateProcessor
 from volontario.models import Volontario
 
 # A syntactically valid codice fiscale (Rossi Mario, 01/01/1990, Roma).
 VALID_CF = "RSSMRA90A01H501W"
+# More valid codici fiscali for tests needing several volunteers.
+OTHER_CFS = ["BNCLGU85M10F205B", "VRDGPP80A01L219M", "NREFNC92C41A794K"]
 
 
 def _make_context(member_status=None, get_member_raises=False):
@@ -144,14 +190,14 @@ SAMPLE_XML = """<List>
 
 
 def _item(level, dt, livello="", zona="Nodo Idraulico di Milano", codice="IM-09"):
-    """Build a single forecast item dict as produced by parse_forecast()."""
-    return {
-        "dt": dt,
-        "cd_livello": level,
-        "livello": livello or f"Codice {level}",
-        "nome_zona": zona,
-        "codice_zona": codice,
-    }
+    """Build a single forecast item as produced by parse_forecast()."""
+    return allertalom.ForecastItem(
+        dt=dt,
+        cd_livello=level,
+        livello=livello or f"Codice {level}",
+        nome_zona=zona,
+        codice_zona=codice,
+    )
 
 
 def _alert(level, livello="", start=None, end=None, segments=None):
@@ -181,29 +227,259 @@ def _alert(level, livello="", start=None, end=None, segments=None):
     }
 
 
+class HoursSummaryTests(TestCase):
+    """/ore reads the monthly rollup instead of the volunteer's timbrature."""
+
+    def setUp(self):
+        identity.cache.clear()
+        self.volontario = Volontario.objects.create(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+        TelegramUser.objects.create(telegram_id=123, volontario=self.volontario)
+        self.now = timezone.make_aware(datetime(2026, 3, 20, 12))
+        for month, minutes in ((3, 90), (3, 30), (1, 60)):
+            clock_in = timezone.make_aware(datetime(2026, month, 10, 8))
+            Timbratura.objects.create(
+                fkvolontario=self.volontario,
+                clock_in=clock_in,
+                clock_out=clock_in + timedelta(minutes=minutes),
+            )
+        # Last year's hours stay out of the year-to-date total.
+        RiepilogoOre.objects.create(
+            fkvolontario=self.volontario,
+            mese=datetime(2025, 12, 1).date(),
+            minuti=600,
+            sessioni=3,
+        )
+
+    def _update(self):
+        update = MagicMock()
+        update.effective_user.id = 123
+        update.message.reply_text = AsyncMock()
+        return update
+
+    async def test_summary_from_rollup(self):
+        update = self._update()
+
+        with patch("tg_bot.bot.timezone.now", return_value=self.now):
+            await bot.hours_summary(update, MagicMock())
+
+        text = update.message.reply_text.call_args.args[0]
+        self.assertIn("Totale: 2h 0m", text)
+        self.assertIn("Sessioni completate: 2", text)
+        self.assertIn("Da inizio anno: 3h 0m", text)
+        self.assertNotIn("Entrata in corso", text)
+
+    def test_query_count_does_not_depend_on_entries(self):
+        for day in range(11, 21):
+            clock_in = timezone.make_aware(datetime(2026, 3, day, 8))
+            Timbratura.objects.create(
+                fkvolontario=self.volontario,
+                clock_in=clock_in,
+                clock_out=clock_in + timedelta(minutes=10),
+            )
+        update = self._update()
+
+        # The identity lookup, the rollup aggregate and the open entry.
+        with (
+            patch("tg_bot.bot.timezone.now", return_value=self.now),
+            self.assertNumQueries(3),
+        ):
+            async_to_sync(bot.hours_summary)(update, MagicMock())
+
+        text = update.message.reply_text.call_args.args[0]
+        self.assertIn("Totale: 3h 40m", text)
+        self.assertIn("Sessioni completate: 12", text)
+
+
+class ClockInTests(TestCase):
+    """Clock-in relies on the single-open-entry constraint, not a prior lookup."""
+
+    def setUp(self):
+        identity.cache.clear()
+        self.volontario = Volontario.objects.create(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+        TelegramUser.objects.create(telegram_id=123, volontario=self.volontario)
+
+    def _update(self):
+        update = MagicMock()
+        update.effective_user.id = 123
+        update.message.reply_text = AsyncMock()
+        return update
+
+    async def test_clock_in_twice_keeps_one_open_entry(self):
+        first, second = self._update(), self._update()
+
+        await bot.clock_in(first, MagicMock())
+        await bot.clock_in(second, MagicMock())
+
+        self.assertIn("Entrata registrata", first.message.reply_text.call_args.args[0])
+        self.assertIn(
+            "Hai già un'entrata aperta", second.message.reply_text.call_args.args[0]
+        )
+        self.assertEqual(
+            await Timbratura.objects.filter(clock_out__isnull=True).acount(), 1
+        )
+
+
+class IdentityCacheTests(TestCase):
+    """Telegram user -> Volontario resolution is cached and invalidated on writes."""
+
+    def setUp(self):
+        identity.cache.clear()
+        self.volontario = Volontario.objects.create(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+        self.tg_user = TelegramUser.objects.create(
+            telegram_id=123, volontario=self.volontario
+        )
+
+    def _resolve(self, telegram_id=123):
+        return async_to_sync(identity.get_identity)(telegram_id)
+
+    def test_second_lookup_hits_the_cache(self):
+        with self.assertNumQueries(1):
+            first = self._resolve()
+        with self.assertNumQueries(0):
+            second = self._resolve()
+
+        self.assertEqual(first.volontario.nome, "Mario")
+        self.assertIs(second.volontario, first.volontario)
+        self.assertEqual(identity.cache.stats.hits, 1)
+        self.assertEqual(identity.cache.stats.hit_rate, 0.5)
+
+    def test_unregistered_and_unlinked(self):
+        TelegramUser.objects.create(telegram_id=456)
+
+        self.assertEqual(self._resolve(999), identity.UNREGISTERED)
+        unlinked = self._resolve(456)
+        self.assertTrue(unlinked.registered)
+        self.assertFalse(unlinked.is_linked)
+
+    def test_registration_invalidates_negative_entry(self):
+        self.assertFalse(self._resolve(456).registered)
+
+        TelegramUser.objects.create(telegram_id=456, volontario=None)
+
+        self.assertTrue(self._resolve(456).registered)
+
+    def test_telegram_user_changes_invalidate(self):
+        self._resolve()
+
+        self.tg_user.volontario = None
+        self.tg_user.save()
+        self.assertFalse(self._resolve().is_linked)
+
+        self.tg_user.delete()
+        self.assertFalse(self._resolve().registered)
+
+    def test_volontario_changes_invalidate(self):
+        self._resolve()
+
+        self.volontario.nome = "Marco"
+        self.volontario.save()
+
+        self.assertEqual(self._resolve().volontario.nome, "Marco")
+        self.assertEqual(identity.cache.stats.invalidated, 1)
+
+        self.volontario.delete()
+        self.assertEqual(self._resolve(), identity.UNREGISTERED)
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = identity.IdentityCache(maxsize=10, ttl=60, clock=lambda: now[0])
+        cache.put(1, identity.UNREGISTERED)
+
+        now[0] = 59
+        self.assertEqual(cache.get(1), identity.UNREGISTERED)
+        now[0] = 60
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats.expired, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = identity.IdentityCache(maxsize=2, ttl=60)
+        cache.put(1, identity.UNREGISTERED)
+        cache.put(2, identity.UNREGISTERED)
+        cache.get(1)
+
+        cache.put(3, identity.UNREGISTERED)
+
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(1))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats.evicted, 1)
+
+    def test_lookup_racing_an_invalidation_is_not_stored(self):
+        cache = identity.IdentityCache(maxsize=10, ttl=60)
+        generation = cache.generation
+        cache.invalidate(1)
+
+        cache.put(1, identity.UNREGISTERED, generation)
+
+        self.assertIsNone(cache.get(1))
+
+
 class ParseForecastTests(TestCase):
     """Tests for allertalom.parse_forecast()."""
 
     def test_parses_all_items(self):
         items = allertalom.parse_forecast(SAMPLE_XML)
         self.assertEqual(len(items), 3)
-        self.assertEqual(items[0]["cd_livello"], 0)
-        self.assertEqual(items[1]["livello"], "Codice GIALLO")
-        self.assertEqual(items[2]["cd_livello"], -1)
-        self.assertEqual(items[0]["nome_zona"], "Nodo Idraulico di Milano")
-        self.assertEqual(items[0]["codice_zona"], "IM-09")
+        self.assertEqual(items[0].cd_livello, 0)
+        self.assertEqual(items[1].livello, "Codice GIALLO")
+        self.assertEqual(items[2].cd_livello, -1)
+        self.assertEqual(items[0].nome_zona, "Nodo Idraulico di Milano")
+        self.assertEqual(items[0].codice_zona, "IM-09")
 
     def test_dt_is_timezone_aware(self):
         items = allertalom.parse_forecast(SAMPLE_XML)
-        self.assertIsNotNone(items[0]["dt"].tzinfo)
+        self.assertIsNotNone(items[0].dt.tzinfo)
         # Items are hourly: consecutive dt differ by one hour.
-        self.assertEqual(items[1]["dt"] - items[0]["dt"], timedelta(hours=1))
+        self.assertEqual(items[1].dt - items[0].dt, timedelta(hours=1))
 
     def test_ignores_unparsable_items(self):
         xml = "<List><item><cdLivello>1</cdLivello></item></List>"  # no dtPrevisione
         self.assertEqual(allertalom.parse_forecast(xml), [])
 
 
+class IterForecastTests(TestCase):
+    """Tests for the streaming allertalom.iter_forecast() parser."""
+
+    FIXTURE = Path(__file__).parent / "testdata" / "allertalom_temporali.xml"
+
+    def test_matches_tree_parser_on_fixture(self):
+        xml = self.FIXTURE.read_text()
+
+        self.assertEqual(allertalom.parse_forecast(xml), parse_forecast_tree(xml))
+
+    def test_stops_after_first_item_past_until(self):
+        items = allertalom.parse_forecast(SAMPLE_XML)
+
+        truncated = allertalom.parse_forecast(SAMPLE_XML, until=items[0].dt)
+
+        # The first item past ``until`` is kept to mark where the data ends.
+        self.assertEqual(truncated, items[:2])
+
+    def test_does_not_read_past_until(self):
+        xml = SAMPLE_XML.replace("</List>", "<item><broken></List>")
+        until = allertalom.parse_forecast(SAMPLE_XML)[0].dt
+
+        with patch.object(allertalom, "PARSE_CHUNK_SIZE", 64):
+            items = allertalom.parse_forecast(xml, until=until)
+
+        self.assertEqual(len(items), 2)
+
+    def test_benchmark_command_runs(self):
+        out = StringIO()
+
+        call_command(
+            "benchmark_allertalom", self.FIXTURE, number=1, repeat=1, stdout=out
+        )
+
+        self.assertIn("streaming + orizzonte", out.getvalue())
+
+
 class CurrentAlertTests(TestCase):
     """Tests for allertalom.current_alert()."""
 
@@ -293,26 +569,26 @@ class BuildMessageTests(TestCase):
     """Tests for allertalom.build_message() wording per transition."""
 
     def test_new_alert(self):
-        alert = _item(1, timezone.now(), "Codice GIALLO")
-        msg = allertalom.build_message(7, alert, 0, 1, "108055")
+        alert = _alert(1, "Codice GIALLO")
+        msg = allertalom.build_message(7, alert, 0, 1, ["108055"])
         self.assertIn("Nuova allerta", msg)
         self.assertIn("Temporali", msg)
         self.assertIn("GIALLO", msg)
 
     def test_escalation(self):
-        alert = _item(2, timezone.now(), "Codice ARANCIONE")
-        msg = allertalom.build_message(7, alert, 1, 2, "108055")
+        alert = _alert(2, "Codice ARANCIONE")
+        msg = allertalom.build_message(7, alert, 1, 2, ["108055"])
         self.assertIn("peggioramento", msg)
         self.assertIn("ARANCIONE", msg)
 
     def test_improvement(self):
-        alert = _item(1, timezone.now(), "Codice GIALLO")
-        msg = allertalom.build_message(7, alert, 2, 1, "108055")
+        alert = _alert(1, "Codice GIALLO")
+        msg = allertalom.build_message(7, alert, 2, 1, ["108055"])
         self.assertIn("miglioramento", msg)
 
     def test_rientro(self):
-        alert = _item(0, timezone.now(), "Codice VERDE")
-        msg = allertalom.build_message(9, alert, 1, 0, "108055")
+        alert = _alert(0, "Codice VERDE")
+        msg = allertalom.build_message(9, alert, 1, 0, ["108055"])
         self.assertIn("Rientro", msg)
         self.assertIn("VERDE", msg)
         self.assertIn("Rischio idrogeologico", msg)
@@ -321,13 +597,13 @@ class BuildMessageTests(TestCase):
         start = timezone.make_aware(datetime(2026, 7, 16, 15, 0))
         end = timezone.make_aware(datetime(2026, 7, 16, 21, 0))
         alert = _alert(1, "Codice GIALLO", start=start, end=end)
-        msg = allertalom.build_message(7, alert, 0, 1, "108055")
+        msg = allertalom.build_message(7, alert, 0, 1, ["108055"])
         self.assertIn("16/07 ore 15:00", msg)
         self.assertIn("16/07 ore 21:00", msg)
 
     def test_falls_back_when_no_period(self):
         alert = _alert(1, "Codice GIALLO")  # start/end None
-        msg = allertalom.build_message(7, alert, 0, 1, "108055")
+        msg = allertalom.build_message(7, alert, 0, 1, ["108055"])
         self.assertIn("prossime 24 ore", msg)
 
     def test_shows_severity_timeline_with_multiple_segments(self):
@@ -353,7 +629,7 @@ class BuildMessageTests(TestCase):
             },
         ]
         alert = _alert(2, "Codice ARANCIONE", segments=segments)
-        msg = allertalom.build_message(7, alert, 0, 2, "108055")
+        msg = allertalom.build_message(7, alert, 0, 2, ["108055"])
         self.assertIn("Evoluzione prevista", msg)
         self.assertIn("Livello massimo", msg)
         self.assertIn("Arancione", msg)
@@ -362,13 +638,15 @@ class BuildMessageTests(TestCase):
         self.assertIn("16/07 20:00", msg)  # arancione segment end (15:00 + 5h)
 
 
-def _job_context(categories):
+def _job_context(categories, interval=None):
     """Fake context for check_allerte with a job carrying the category list."""
     context = MagicMock()
     context.bot = MagicMock()
     context.bot.send_message = AsyncMock()
     context.job = MagicMock()
     context.job.data = {"categories": categories}
+    if interval is not None:
+        context.job.data["interval"] = interval
     return context
 
 
@@ -382,6 +660,10 @@ def _job_context(categories):
 class CheckAllerteTests(TestCase):
     """Tests for the check_allerte scheduled job."""
 
+    def setUp(self):
+        allertalom.zone_map.clear()
+        allertalom.breaker.reset()
+
     async def _run(self, items):
         context = _job_context([7])
         with patch.object(allertalom, "fetch_forecast", AsyncMock(return_value=items)):
@@ -466,3 +748,1434 @@ class CheckAllerteTests(TestCase):
                 await bot.check_allerte(context)
             mock_fetch.assert_not_called()
         context.bot.send_message.assert_not_called()
+
+    async def _rescheduled_after(self, **fetch):
+        context = _job_context([7], interval=600)
+        with patch.object(allertalom, "fetch_forecast", AsyncMock(**fetch)):
+            await bot.check_allerte(context)
+        context.job_queue.run_once.assert_called_once()
+        call = context.job_queue.run_once.call_args
+        self.assertIs(call.args[0], bot.check_allerte)
+        self.assertEqual(call.kwargs["data"], {"categories": [7], "interval": 600})
+        return call.kwargs["when"]
+
+    @override_settings(ALLERTALOM_STORM_FACTOR=0.5, ALLERTALOM_CALM_FACTOR=2)
+    async def test_polls_faster_during_alert(self):
+        items = [_item(1, timezone.now(), "Codice GIALLO")]
+
+        self.assertEqual(await self._rescheduled_after(return_value=items), 300)
+
+    @override_settings(ALLERTALOM_STORM_FACTOR=0.5, ALLERTALOM_CALM_FACTOR=2)
+    async def test_polls_slower_when_all_green(self):
+        items = [_item(0, timezone.now(), "Codice VERDE")]
+
+        self.assertEqual(await self._rescheduled_after(return_value=items), 1200)
+
+    @override_settings(ALLERTALOM_STORM_FACTOR=0.5, ALLERTALOM_CALM_FACTOR=2)
+    async def test_keeps_base_interval_on_errors(self):
+        when = await self._rescheduled_after(side_effect=Exception("boom"))
+
+        self.assertEqual(when, 600)
+
+    async def test_open_circuit_skips_requests(self):
+        for _ in range(allertalom.breaker.threshold):
+            allertalom.breaker.record_failure()
+        context = _job_context([7, 9])
+
+        with (
+            patch.object(allertalom, "fetch_forecast", AsyncMock()) as mock_fetch,
+            self.assertNoLogs("tg_bot.bot", level="ERROR"),
+        ):
+            await bot.check_allerte(context)
+
+        mock_fetch.assert_not_called()
+        context.bot.send_message.assert_not_called()
+
+    async def test_categories_are_fetched_concurrently(self):
+        now = timezone.now()
+        in_flight = 0
+        peak = 0
+
+        async def fetch(categoria, comune, horizon_hours):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return [_item(1, now, "Codice GIALLO")]
+
+        context = _job_context([7, 9, 10])
+        with patch.object(allertalom, "fetch_forecast", side_effect=fetch):
+            await bot.check_allerte(context)
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(context.bot.send_message.call_count, 3)
+
+    async def test_slow_category_times_out_without_blocking_others(self):
+        now = timezone.now()
+
+        async def fetch(categoria, comune, horizon_hours):
+            if categoria == 9:
+                await asyncio.sleep(10)
+            return [_item(1, now, "Codice GIALLO")]
+
+        context = _job_context([7, 9])
+        with (
+            patch.object(allertalom, "fetch_forecast", side_effect=fetch),
+            patch.object(allertalom, "REQUEST_TIMEOUT", 0.05),
+        ):
+            await bot.check_allerte(context)
+
+        context.bot.send_message.assert_called_once()
+        self.assertFalse(
+            await AllertaMeteoStato.objects.filter(cd_tipologia_gis=9).aexists()
+        )
+
+
+@override_settings(
+    TELEGRAM_SURVEY_CHAT_ID="-1001234567890",
+    ALLERTALOM_THREAD_ID=None,
+    ALLERTALOM_COMUNI_ISTAT=["108055", "015146", "097042"],
+    ALLERTALOM_MIN_LEVEL=1,
+    ALLERTALOM_HORIZON_HOURS=24,
+)
+class CheckAllerteMultiComuneTests(TestCase):
+    """check_allerte with several comuni sharing zone omogenee."""
+
+    ZONES = {"108055": "IM-09", "015146": "IM-09", "097042": "IM-05"}
+
+    def setUp(self):
+        allertalom.zone_map.clear()
+        allertalom.breaker.reset()
+        self.now = timezone.now()
+        self.level = 1
+
+    async def _fetch(self, categoria, comune, horizon_hours):
+        return [_item(self.level, self.now, codice=self.ZONES[comune])]
+
+    async def _run(self):
+        context = _job_context([7])
+        with patch.object(
+            allertalom, "fetch_forecast", side_effect=self._fetch
+        ) as fetch:
+            await bot.check_allerte(context)
+        return context, fetch
+
+    async def test_first_run_learns_zones_then_fetches_once_per_zone(self):
+        context, fetch = await self._run()
+        # Zones are unknown at first: one request per comune.
+        self.assertEqual(fetch.await_count, 3)
+        # One message per zone.
+        self.assertEqual(context.bot.send_message.await_count, 2)
+        self.assertEqual(
+            await AllertaMeteoStato.objects.filter(cd_livello=1).acount(), 3
+        )
+
+        self.level = 2
+        context, fetch = await self._run()
+        self.assertEqual(fetch.await_count, 2)
+        self.assertEqual(context.bot.send_message.await_count, 2)
+        self.assertEqual(
+            await AllertaMeteoStato.objects.filter(cd_livello=2).acount(), 3
+        )
+
+    async def test_zone_message_lists_every_comune(self):
+        context, _ = await self._run()
+
+        texts = {c.kwargs["text"] for c in context.bot.send_message.await_args_list}
+        shared = next(t for t in texts if "IM-09" in t)
+        self.assertIn("Comuni: 108055, 015146", shared)
+        self.assertIn("cdIstatComune=108055", shared)
+        self.assertIn("cdIstatComune=015146", shared)
+        single = next(t for t in texts if "IM-05" in t)
+        self.assertNotIn("Comuni:", single)
+        self.assertIn("cdIstatComune=097042", single)
+
+    async def test_archives_one_snapshot_per_zone_when_forecast_changes(self):
+        await self._run()
+        self.assertEqual(
+            sorted(
+                [
+                    z
+                    async for z in AllertaMeteoSnapshot.objects.values_list(
+                        "codice_zona", flat=True
+                    )
+                ]
+            ),
+            ["IM-05", "IM-09"],
+        )
+
+        await self._run()
+        self.assertEqual(await AllertaMeteoSnapshot.objects.acount(), 2)
+
+        self.level = 2
+        await self._run()
+        self.assertEqual(await AllertaMeteoSnapshot.objects.acount(), 4)
+
+    async def test_zones_are_seeded_from_stored_state(self):
+        for comune, zona in self.ZONES.items():
+            await AllertaMeteoStato.objects.acreate(
+                cd_istat_comune=comune,
+                cd_tipologia_gis=7,
+                codice_zona=zona,
+                cd_livello=1,
+            )
+
+        context, fetch = await self._run()
+
+        self.assertEqual(fetch.await_count, 2)
+        context.bot.send_message.assert_not_called()
+
+    async def test_zone_change_makes_grouped_comuni_refetch(self):
+        await self._run()
+        self.ZONES = {**self.ZONES, "108055": "IM-10"}
+
+        _, fetch = await self._run()
+        _, fetch_again = await self._run()
+
+        self.assertEqual(fetch.await_count, 2)
+        # 015146 lost its group and is queried on its own again.
+        self.assertEqual(fetch_again.await_count, 3)
+
+
+class AllertaLomCacheTests(TestCase):
+    """Conditional requests and parse/alert caching in allertalom."""
+
+    def setUp(self):
+        allertalom.clear_cache()
+        self.requests = []
+        self.responses = []
+
+    def _handler(self, request):
+        self.requests.append(request)
+        return self.responses.pop(0)
+
+    async def _fetch(self, horizon_hours=None):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+        with (
+            patch.object(allertalom, "get_client", return_value=client),
+            patch.object(
+                allertalom, "parse_forecast", wraps=allertalom.parse_forecast
+            ) as parse,
+        ):
+            items = await allertalom.fetch_forecast(7, "108055", horizon_hours)
+        await client.aclose()
+        return items, parse
+
+    async def test_not_modified_reuses_parsed_items(self):
+        self.responses = [
+            httpx.Response(200, text=SAMPLE_XML, headers={"ETag": '"v1"'}),
+            httpx.Response(304),
+        ]
+
+        first, parse = await self._fetch()
+        parse.assert_called_once()
+        second, parse = await self._fetch()
+
+        parse.assert_not_called()
+        self.assertIs(second, first)
+        self.assertEqual(self.requests[1].headers["If-None-Match"], '"v1"')
+        self.assertEqual(allertalom.cache_stats.http_hits, 1)
+        self.assertEqual(allertalom.cache_stats.http_misses, 1)
+
+    async def test_identical_body_without_validators_skips_parsing(self):
+        self.responses = [
+            httpx.Response(200, text=SAMPLE_XML),
+            httpx.Response(200, text=SAMPLE_XML),
+        ]
+
+        first, _ = await self._fetch()
+        second, parse = await self._fetch()
+
+        parse.assert_not_called()
+        self.assertIs(second, first)
+        self.assertNotIn("If-None-Match", self.requests[1].headers)
+
+    async def test_changed_body_is_parsed(self):
+        self.responses = [
+            httpx.Response(200, text=SAMPLE_XML),
+            httpx.Response(200, text=SAMPLE_XML.replace("GIALLO", "ARANCIONE")),
+        ]
+
+        first, _ = await self._fetch()
+        second, parse = await self._fetch()
+
+        parse.assert_called_once()
+        self.assertIsNot(second, first)
+        self.assertEqual(allertalom.cache_stats.http_misses, 2)
+
+    async def test_reparses_when_cached_items_do_not_cover_horizon(self):
+        self.responses = [
+            httpx.Response(200, text=SAMPLE_XML, headers={"ETag": '"v1"'}),
+            httpx.Response(304),
+            httpx.Response(304),
+        ]
+
+        first, _ = await self._fetch(horizon_hours=24)
+        second, parse = await self._fetch(horizon_hours=24)
+        parse.assert_not_called()
+        self.assertIs(second, first)
+
+        third, parse = await self._fetch(horizon_hours=48)
+        parse.assert_called_once()
+        self.assertEqual(third, first)
+        self.assertEqual(allertalom.cache_stats.http_hits, 2)
+
+    def test_alert_reused_while_window_unchanged(self):
+        now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        items = [_item(1, now + timedelta(hours=h), "Codice GIALLO") for h in range(3)]
+
+        with patch.object(
+            allertalom, "current_alert", wraps=allertalom.current_alert
+        ) as compute:
+            first = allertalom.cached_alert((7, "108055"), items, now, 24)
+            again = allertalom.cached_alert(
+                (7, "108055"), items, now + timedelta(minutes=10), 24
+            )
+            self.assertEqual(compute.call_count, 1)
+            self.assertIs(again, first)
+
+            # The first item leaves the window one hour after its bucket ends.
+            allertalom.cached_alert(
+                (7, "108055"), items, now + timedelta(hours=1, minutes=1), 24
+            )
+            # A new forecast list is always recomputed.
+            allertalom.cached_alert((7, "108055"), list(items), now, 24)
+            self.assertEqual(compute.call_count, 3)
+
+        self.assertEqual(allertalom.cache_stats.alert_hits, 1)
+        self.assertEqual(allertalom.cache_stats.alert_misses, 3)
+
+
+class CircuitBreakerTests(TestCase):
+    """Tests for allertalom.CircuitBreaker and its use in fetch_forecasts."""
+
+    def setUp(self):
+        self.clock = 1000.0
+        patcher = patch.object(allertalom.time, "monotonic", lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = allertalom.CircuitBreaker(threshold=2, backoff=60)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, allertalom.CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_probe_backs_off_exponentially(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        self.clock += 60
+        self.assertTrue(self.breaker.allow())
+        # Only one probe while half-open.
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_failure()
+
+        self.clock += 60
+        self.assertFalse(self.breaker.allow())
+        self.clock += 60
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, allertalom.CircuitBreaker.CLOSED)
+
+    async def test_fetch_forecasts_probes_with_a_single_request(self):
+        requests = [(7, "108055"), (9, "108055"), (10, "108055")]
+        with patch.object(allertalom, "breaker", self.breaker):
+            with patch.object(
+                allertalom, "fetch_forecast", AsyncMock(side_effect=Exception("down"))
+            ) as fetch:
+                await allertalom.fetch_forecasts(requests)
+            self.assertEqual(fetch.await_count, 3)
+
+            with patch.object(allertalom, "fetch_forecast", AsyncMock()) as fetch:
+                results = await allertalom.fetch_forecasts(requests)
+            fetch.assert_not_called()
+            self.assertIsInstance(results[(7, "108055")], allertalom.CircuitOpenError)
+
+            self.clock += 60
+            with patch.object(
+                allertalom, "fetch_forecast", AsyncMock(side_effect=Exception("down"))
+            ) as fetch:
+                results = await allertalom.fetch_forecasts(requests)
+            self.assertEqual(fetch.await_count, 1)
+            self.assertIsInstance(results[(9, "108055")], allertalom.CircuitOpenError)
+
+            self.clock += 120
+            with patch.object(
+                allertalom, "fetch_forecast", AsyncMock(return_value=[])
+            ) as fetch:
+                results = await allertalom.fetch_forecasts(requests)
+            self.assertEqual(fetch.await_count, 3)
+            self.assertEqual(results[(10, "108055")], [])
+
+
+class AllertaArchiveTests(TestCase):
+    """Compact forecast archive: encoding, retention and admin timeline."""
+
+    def setUp(self):
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    def _items(self, levels):
+        return [
+            _item(level, self.start + timedelta(hours=h))
+            for h, level in enumerate(levels)
+            if level is not None
+        ]
+
+    def test_encode_levels_is_delta_run_length(self):
+        items = self._items([0] * 6 + [1] * 4 + [2] * 2)
+
+        self.assertEqual(allertalom.encode_levels(items), (self.start, "6,+1,3,+1,1"))
+
+    def test_decode_round_trip_fills_missing_hours(self):
+        levels = [1, 1, None, 3, 0, -1, -1]
+        start, encoded = allertalom.encode_levels(self._items(levels))
+
+        decoded = allertalom.decode_levels(start, encoded)
+
+        self.assertEqual([level for _, level in decoded], [1, 1, -1, 3, 0, -1, -1])
+        self.assertEqual(decoded[-1][0], self.start + timedelta(hours=6))
+
+    def test_encode_levels_empty(self):
+        self.assertIsNone(allertalom.encode_levels([]))
+
+    def _xml(self, levels):
+        items = "".join(
+            "<item><nomeZonaOmogenea>Nodo Idraulico di Milano</nomeZonaOmogenea>"
+            "<codiceZonaOmogenea>IM-09</codiceZonaOmogenea>"
+            f"<dtPrevisione>{int(item.dt.timestamp() * 1000)}</dtPrevisione>"
+            f"<cdLivello>{item.cd_livello}</cdLivello><livello>x</livello></item>"
+            for item in self._items(levels)
+        )
+        return f"<List>{items}</List>"
+
+    async def test_archives_forecast_past_the_parse_horizon(self):
+        allertalom.clear_cache()
+        self.addCleanup(allertalom.clear_cache)
+        levels = [0] * 24 + [2] * 24
+        client = httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, text=self._xml(levels))
+            )
+        )
+        with patch.object(allertalom, "get_client", return_value=client):
+            items = await allertalom.fetch_forecast(7, "108055", horizon_hours=1)
+        await client.aclose()
+        self.assertLess(len(items), len(levels))
+
+        await bot._archive_forecasts({(7, "108055"): items})
+
+        snapshot = await AllertaMeteoSnapshot.objects.aget()
+        self.assertEqual(snapshot.levels, "24,+2,23")
+
+    async def test_unchanged_forecast_is_not_archived_again(self):
+        items = self._items([1, 1, 2])
+        starts_at, levels = allertalom.encode_levels(items)
+        await AllertaMeteoSnapshot.objects.acreate(
+            cd_tipologia_gis=7,
+            codice_zona="IM-09",
+            fetched_at=timezone.now() - timedelta(hours=1),
+            starts_at=starts_at,
+            levels=levels,
+        )
+
+        await bot._archive_forecasts({(7, "108055"): items})
+        self.assertEqual(await AllertaMeteoSnapshot.objects.acount(), 1)
+
+        await bot._archive_forecasts({(7, "108055"): self._items([1, 2, 2])})
+        self.assertEqual(await AllertaMeteoSnapshot.objects.acount(), 2)
+
+    async def test_purge_deletes_old_snapshots(self):
+        old = await AllertaMeteoSnapshot.objects.acreate(
+            cd_tipologia_gis=7,
+            codice_zona="IM-09",
+            fetched_at=timezone.now() - timedelta(days=400),
+            starts_at=self.start,
+            levels="24",
+        )
+        recent = await AllertaMeteoSnapshot.objects.acreate(
+            cd_tipologia_gis=7, codice_zona="IM-09", starts_at=self.start, levels="24"
+        )
+
+        with override_settings(ALLERTALOM_ARCHIVE_DAYS=365):
+            await bot.purge_allerta_archive(MagicMock())
+
+        self.assertFalse(await AllertaMeteoSnapshot.objects.filter(pk=old.pk).aexists())
+        self.assertTrue(
+            await AllertaMeteoSnapshot.objects.filter(pk=recent.pk).aexists()
+        )
+
+    def test_admin_timeline_renders_selected_zone(self):
+        user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(user)
+        for codice_zona, encoded in [("IM-09", "2,+2,1"), ("IM-05", "+1,2")]:
+            AllertaMeteoSnapshot.objects.create(
+                cd_tipologia_gis=7,
+                codice_zona=codice_zona,
+                starts_at=self.start,
+                levels=encoded,
+            )
+        url = reverse("admin:tg_bot_allertameteosnapshot_timeline")
+
+        response = self.client.get(url, {"zona": "7|IM-09", "giorni": "3"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["zona"], "IM-09")
+        self.assertEqual(len(response.context["hours"]), 4)
+        [(_, cells)] = response.context["rows"]
+        self.assertEqual([emoji for _, emoji in cells], ["🟢", "🟢", "🟠", "🟠"])
+        changelist = self.client.get(
+            reverse("admin:tg_bot_allertameteosnapshot_changelist")
+        )
+        self.assertContains(changelist, url)
+
+
+class AllertaLomClientTests(TestCase):
+    async def test_client_is_shared_within_a_loop(self):
+        first = allertalom.get_client()
+        try:
+            self.assertIs(allertalom.get_client(), first)
+        finally:
+            await allertalom.close_client()
+        self.assertTrue(first.is_closed)
+
+
+class SendServizioRemindersTests(TestCase):
+    """Tests for the batched send_servizio_reminders job."""
+
+    def setUp(self):
+        self.servizio = Servizio.objects.create(
+            nome="Presidio",
+            data_ora=timezone.now() + timedelta(minutes=28),
+            send_message=False,
+        )
+        risposte = [
+            VolontarioServizioMap.Risposta.SI,
+            None,
+            VolontarioServizioMap.Risposta.NO,
+        ]
+        for i, (cf, risposta) in enumerate(zip([VALID_CF, *OTHER_CFS], risposte)):
+            volontario = Volontario.objects.create(
+                codice_fiscale=cf, nome=f"Nome{i}", cognome="Test"
+            )
+            TelegramUser.objects.create(telegram_id=1000 + i, volontario=volontario)
+            VolontarioServizioMap.objects.create(
+                fkvolontario=volontario, fkservizio=self.servizio, risposta=risposta
+            )
+        # A participant without a Telegram account is skipped.
+        volontario = Volontario.objects.create(
+            codice_fiscale=OTHER_CFS[2], nome="Senza", cognome="Telegram"
+        )
+        VolontarioServizioMap.objects.create(
+            fkvolontario=volontario,
+            fkservizio=self.servizio,
+            risposta=VolontarioServizioMap.Risposta.SI,
+        )
+
+    async def test_queues_and_delivers_to_participants_except_no(self):
+        context = _make_context()
+        await bot.send_servizio_reminders(context)
+
+        # Nothing is sent inline: reminders are written to the outbox...
+        context.bot.send_message.assert_not_called()
+        self.assertEqual(await OutboxMessage.objects.acount(), 2)
+        await self.servizio.arefresh_from_db()
+        self.assertTrue(self.servizio.notification_sent)
+
+        # ...and delivered by the drainer.
+        await outbox.drain_outbox(context)
+        chat_ids = sorted(
+            c.kwargs["chat_id"] for c in context.bot.send_message.call_args_list
+        )
+        self.assertEqual(chat_ids, [1000, 1001])
+        self.assertEqual(
+            await OutboxMessage.objects.filter(
+                status=OutboxMessage.Status.SENT
+            ).acount(),
+            2,
+        )
+
+    def test_query_count_independent_of_participants(self):
+        context = _make_context()
+        # servizi lookup + joined participants lookup, then outbox insert and flag
+        # update inside one savepoint.
+        with (
+            self.assertNumQueries(6),
+            self.assertLogs("tg_bot.bot", "INFO") as logs,
+        ):
+            async_to_sync(bot.send_servizio_reminders)(context)
+        # The logged count is measured, not assumed.
+        self.assertIn("2 messages queued, 6 queries", logs.output[-1])
+
+    async def test_rerun_does_not_duplicate(self):
+        context = _make_context()
+        await bot.send_servizio_reminders(context)
+        # Simulate a crash before the flag was persisted: the job runs again.
+        await Servizio.objects.filter(pk=self.servizio.pk).aupdate(
+            notification_sent=False
+        )
+        await bot.send_servizio_reminders(context)
+
+        self.assertEqual(await OutboxMessage.objects.acount(), 2)
+
+    async def test_failed_send_is_retried_later(self):
+        context = _make_context()
+        context.bot.send_message = AsyncMock(side_effect=Exception("timeout"))
+        await bot.send_servizio_reminders(context)
+        await outbox.drain_outbox(context)
+
+        self.assertEqual(context.bot.send_message.call_count, 2)
+        pending = [m async for m in OutboxMessage.objects.all()]
+        self.assertTrue(all(m.status == OutboxMessage.Status.PENDING for m in pending))
+        self.assertTrue(all(m.attempts == 1 for m in pending))
+        self.assertTrue(all(m.next_attempt_at > timezone.now() for m in pending))
+
+        # Not due yet: a second drain does not resend.
+        await outbox.drain_outbox(context)
+        self.assertEqual(context.bot.send_message.call_count, 2)
+
+    async def test_blocked_user_is_not_retried(self):
+        context = _make_context()
+        context.bot.send_message = AsyncMock(side_effect=Forbidden("bot was blocked"))
+        await bot.send_servizio_reminders(context)
+        await outbox.drain_outbox(context)
+
+        self.assertEqual(
+            await OutboxMessage.objects.filter(
+                status=OutboxMessage.Status.FAILED
+            ).acount(),
+            2,
+        )
+
+    async def test_crash_mid_batch_only_resends_rows_in_flight(self):
+        context = _make_context()
+        await bot.send_servizio_reminders(context)
+        calls = []
+
+        async def deliver(bot_, message):
+            calls.append(message.chat_id)
+            if len(calls) == 2:
+                # The run dies while sending the second row.
+                raise RuntimeError("crash")
+
+        with (
+            patch.object(outbox, "DRAIN_CONCURRENCY", 1),
+            patch.object(outbox, "_deliver", deliver),
+            self.assertRaises(RuntimeError),
+        ):
+            await outbox.drain_outbox(context)
+
+        sent = await OutboxMessage.objects.aget(chat_id=calls[0])
+        in_flight = await OutboxMessage.objects.aget(chat_id=calls[1])
+        self.assertEqual(sent.status, OutboxMessage.Status.SENT)
+        self.assertEqual(in_flight.status, OutboxMessage.Status.PENDING)
+
+        # The next run resends nothing until the in-flight row's lease expires...
+        await outbox.drain_outbox(context)
+        context.bot.send_message.assert_not_called()
+        # ...and then only that row.
+        with patch(
+            "tg_bot.outbox.timezone.now",
+            return_value=timezone.now() + outbox.CLAIM_LEASE,
+        ):
+            await outbox.drain_outbox(context)
+        self.assertEqual(
+            [c.kwargs["chat_id"] for c in context.bot.send_message.call_args_list],
+            [calls[1]],
+        )
+
+    async def test_concurrent_drainers_do_not_share_rows(self):
+        context = _make_context()
+        await bot.send_servizio_reminders(context)
+        now = timezone.now()
+
+        first, _ = await outbox._claim(now)
+        second, _ = await outbox._claim(now)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+
+    async def test_reply_markup_survives_round_trip(self):
+        context = _make_context()
+        await bot.send_servizio_reminders(context)
+        await outbox.drain_outbox(context)
+
+        markup = context.bot.send_message.call_args.kwargs["reply_markup"]
+        self.assertEqual(
+            markup.inline_keyboard[0][0].callback_data,
+            f"clock_in:{self.servizio.pkid}",
+        )
+
+
+class OutboundQueueTests(TestCase):
+    """Tests for the rate-limited outbound message queue."""
+
+    async def test_releases_by_priority(self):
+        fake_bot = MagicMock()
+        fake_bot.send_message = AsyncMock()
+        queue = outbound.OutboundQueue(fake_bot)
+        futures = [
+            queue.submit(
+                "send_message", outbound.Priority.SUMMARY, chat_id=1, text="s"
+            ),
+            queue.submit(
+                "send_message", outbound.Priority.REMINDER, chat_id=2, text="r"
+            ),
+            queue.submit("send_message", outbound.Priority.ALERT, chat_id=3, text="a"),
+        ]
+        queue.start()
+        await asyncio.gather(*futures)
+        await queue.stop()
+
+        texts = [c.kwargs["text"] for c in fake_bot.send_message.call_args_list]
+        self.assertEqual(texts, ["a", "r", "s"])
+
+    async def test_retry_after_is_retried(self):
+        fake_bot = MagicMock()
+        fake_bot.send_message = AsyncMock(side_effect=[RetryAfter(0), "sent"])
+        queue = outbound.OutboundQueue(fake_bot)
+        queue.start()
+        result = await queue.call("send_message", chat_id=1, text="x")
+        await queue.stop()
+
+        self.assertEqual(result, "sent")
+        self.assertEqual(fake_bot.send_message.call_count, 2)
+
+    async def test_other_errors_propagate_to_caller(self):
+        fake_bot = MagicMock()
+        fake_bot.send_message = AsyncMock(side_effect=RuntimeError("blocked"))
+        queue = outbound.OutboundQueue(fake_bot)
+        queue.start()
+        with self.assertRaises(RuntimeError):
+            await queue.call("send_message", chat_id=1, text="x")
+        await queue.stop()
+
+    def test_token_bucket_throttles(self):
+        bucket = outbound.TokenBucket(rate=1.0)
+        now = bucket.updated
+        self.assertEqual(bucket.delay(now), 0)
+        bucket.consume(now)
+        self.assertAlmostEqual(bucket.delay(now), 1.0)
+        self.assertEqual(bucket.delay(now + 1.0), 0)
+
+    def test_group_chats_use_group_rate(self):
+        queue = outbound.OutboundQueue(MagicMock())
+        self.assertEqual(queue._chat_bucket(-1001234).rate, outbound.GROUP_CHAT_RATE)
+        self.assertEqual(queue._chat_bucket(1234).rate, outbound.PRIVATE_CHAT_RATE)
+
+    async def test_without_running_queue_sends_directly(self):
+        fake_bot = MagicMock()
+        fake_bot.send_message = AsyncMock(return_value="sent")
+        result = await outbound.send_message(fake_bot, chat_id=1, text="x")
+
+        self.assertEqual(result, "sent")
+        fake_bot.send_message.assert_called_once_with(chat_id=1, text="x")
+
+
+@skipUnlessDBFeature("supports_partial_indexes")
+class DeadlineQueryPlanTests(TestCase):
+    """EXPLAIN each reminder job's query, so a change that loses its index fails."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        if connection.vendor == "postgresql":
+            # The test tables are tiny: make PostgreSQL show the index it would use.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+            return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+
+    def test_due_querysets_use_their_index(self):
+        jobs = {
+            "servizio_reminder_idx": deadlines.due_servizio_reminders,
+            "servizio_end_reminder_idx": deadlines.due_clock_out_reminders,
+            "task_reminder_idx": deadlines.due_task_reminders,
+            "servizio_open_poll_idx": deadlines.due_poll_closures,
+        }
+        for index, due in jobs.items():
+            with self.subTest(job=due.__name__):
+                self.assertIn(index, due(self.now).explain())
+
+    def test_next_deadline_uses_the_same_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            deadlines.next_deadline(self.now)
+
+        plans = [self._plan(query["sql"]) for query in queries.captured_queries]
+        for plan, index in zip(
+            plans,
+            ["servizio_reminder_idx", "servizio_end_reminder_idx", "task_reminder_idx"],
+            strict=True,
+        ):
+            with self.subTest(index=index):
+                self.assertIn(index, plan)
+
+
+class DeadlineSchedulerTests(TestCase):
+    """Tests for the deadline-driven reminder scheduling."""
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_next_deadline_none_when_nothing_pending(self):
+        self.assertIsNone(deadlines.next_deadline(self.now))
+
+    def test_next_deadline_is_earliest_reminder(self):
+        Servizio.objects.create(
+            nome="Domani", data_ora=self.now + timedelta(days=1), send_message=False
+        )
+        Servizio.objects.create(
+            nome="Fra due ore",
+            data_ora=self.now + timedelta(hours=2),
+            data_ora_fine=self.now + timedelta(hours=5),
+            send_message=False,
+        )
+        ScheduledTask.objects.create(
+            nome="Controllo", deadline=self.now + timedelta(hours=50)
+        )
+
+        self.assertEqual(
+            deadlines.next_deadline(self.now),
+            self.now + timedelta(minutes=90),
+        )
+
+    def test_notified_servizi_are_ignored(self):
+        Servizio.objects.create(
+            nome="Già notificato",
+            data_ora=self.now + timedelta(hours=2),
+            send_message=False,
+            notification_sent=True,
+        )
+        self.assertIsNone(deadlines.next_deadline(self.now))
+
+    async def test_missed_servizio_reminder_is_caught_up(self):
+        # Starts in 10 minutes: its reminder moment (-30 min) passed while down.
+        await Servizio.objects.acreate(
+            nome="Recupero",
+            data_ora=self.now + timedelta(minutes=10),
+            send_message=False,
+        )
+        await bot.send_servizio_reminders(_make_context())
+
+        self.assertFalse(
+            await Servizio.objects.filter(notification_sent=False).aexists()
+        )
+
+    async def test_missed_clock_out_reminder_is_caught_up(self):
+        volontario = await Volontario.objects.acreate(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+        await TelegramUser.objects.acreate(telegram_id=123, volontario=volontario)
+        servizio = await Servizio.objects.acreate(
+            nome="Finito",
+            data_ora=self.now - timedelta(hours=4),
+            data_ora_fine=self.now - timedelta(hours=2),
+            send_message=False,
+        )
+        await Timbratura.objects.acreate(fkvolontario=volontario, fkservizio=servizio)
+
+        await bot.send_clock_out_reminders(_make_context())
+
+        message = await OutboxMessage.objects.aget()
+        self.assertEqual(message.chat_id, 123)
+        await servizio.arefresh_from_db()
+        self.assertTrue(servizio.end_reminder_sent)
+
+    async def test_arm_schedules_single_wake_up(self):
+        await Servizio.objects.acreate(
+            nome="Fra poco",
+            data_ora=self.now + timedelta(minutes=32),
+            send_message=False,
+        )
+        job_queue = MagicMock()
+        old_job = MagicMock()
+        job_queue.get_jobs_by_name.return_value = [old_job]
+        scheduler = deadlines.DeadlineScheduler(job_queue, [])
+
+        when = await scheduler.arm()
+
+        old_job.schedule_removal.assert_called_once()
+        job_queue.run_once.assert_called_once()
+        self.assertEqual(job_queue.run_once.call_args.kwargs["when"], when)
+        self.assertAlmostEqual(
+            when.timestamp(),
+            (self.now + timedelta(minutes=2)).timestamp(),
+            delta=5,
+        )
+
+    async def test_arm_caps_sleep_at_resync_interval(self):
+        job_queue = MagicMock()
+        job_queue.get_jobs_by_name.return_value = []
+        scheduler = deadlines.DeadlineScheduler(job_queue, [])
+
+        when = await scheduler.arm()
+
+        self.assertLessEqual(when, timezone.now() + deadlines.RESYNC_INTERVAL)
+
+    def test_save_rearms_running_scheduler(self):
+        with patch.object(deadlines, "_scheduler") as scheduler:
+            Servizio.objects.create(
+                nome="Nuovo", data_ora=self.now + timedelta(days=1), send_message=False
+            )
+        scheduler.rearm_threadsafe.assert_called()
+
+    def test_save_outside_the_bot_queues_a_rearm_task(self):
+        self.assertIsNone(deadlines._scheduler)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(2):
+                Servizio.objects.create(
+                    nome=f"Nuovo {i}",
+                    data_ora=self.now + timedelta(days=1),
+                    send_message=False,
+                )
+        # One pending task covers any number of saves.
+        task = BackgroundTask.objects.get()
+        self.assertEqual(task.name, "tg_bot.deadlines.rearm_now")
+
+        # The bot process runs it and re-arms its scheduler.
+        with patch.object(deadlines, "_scheduler") as scheduler:
+            self.assertEqual(tasks.run_pending(), 1)
+        scheduler.rearm_threadsafe.assert_called_once()
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.DONE)
+
+    def test_rearm_task_is_retried_where_no_scheduler_runs(self):
+        tasks.enqueue(deadlines.rearm_now)
+
+        tasks.run_pending()
+
+        task = BackgroundTask.objects.get()
+        self.assertEqual(task.status, BackgroundTask.Status.PENDING)
+        self.assertEqual(task.attempts, 1)
+
+    async def test_rearm_threadsafe_keeps_task_and_logs_failure(self):
+        scheduler = deadlines.DeadlineScheduler(MagicMock(), [])
+        scheduler._loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+
+        async def failing_arm():
+            done.set()
+            raise RuntimeError("db down")
+
+        with (
+            patch.object(scheduler, "arm", failing_arm),
+            self.assertLogs("tg_bot.deadlines", "ERROR") as logs,
+        ):
+            scheduler.rearm_threadsafe()
+            await asyncio.sleep(0)
+            self.assertEqual(len(scheduler._rearm_tasks), 1)
+            await done.wait()
+            await asyncio.sleep(0)
+
+        self.assertEqual(scheduler._rearm_tasks, set())
+        self.assertIn("db down", logs.output[0])
+
+
+class BotClientTests(TestCase):
+    def _fake_bot(self):
+        fake = MagicMock()
+        fake.initialize = AsyncMock()
+        fake.shutdown = AsyncMock()
+        fake.send_message = AsyncMock(return_value="sent")
+        return fake
+
+    def test_reuses_one_initialised_bot(self):
+        fake = self._fake_bot()
+        bot_client = client.BotClient("token")
+        with patch.object(client, "Bot", return_value=fake) as bot_cls:
+            first = bot_client.run(lambda b: b.send_message(chat_id=1, text="a"))
+            bot_client.run(lambda b: b.send_message(chat_id=2, text="b"))
+        bot_client.close()
+
+        self.assertEqual(first, "sent")
+        bot_cls.assert_called_once()
+        fake.initialize.assert_awaited_once()
+        self.assertEqual(fake.send_message.await_count, 2)
+        fake.shutdown.assert_awaited_once()
+
+    def test_restarts_after_fork(self):
+        bot_client = client.BotClient("token")
+        with patch.object(
+            client, "Bot", side_effect=[self._fake_bot(), self._fake_bot()]
+        ) as bot_cls:
+            bot_client.run(lambda b: b.send_message(chat_id=1, text="a"))
+            # Simulate running in a forked child.
+            bot_client._pid = -1
+            bot_client.run(lambda b: b.send_message(chat_id=1, text="a"))
+        bot_client.close()
+
+        self.assertEqual(bot_cls.call_count, 2)
+
+    def test_failed_start_stops_its_loop(self):
+        broken = self._fake_bot()
+        broken.initialize.side_effect = NetworkError("down")
+        bot_client = client.BotClient("token")
+        threads = threading.active_count()
+        with patch.object(client, "Bot", side_effect=[broken, self._fake_bot()]):
+            with self.assertRaises(NetworkError):
+                bot_client.run(lambda b: b.send_message(chat_id=1, text="a"))
+            self.assertEqual(threading.active_count(), threads)
+
+            result = bot_client.run(lambda b: b.send_message(chat_id=1, text="a"))
+        bot_client.close()
+
+        self.assertEqual(result, "sent")
+
+    def test_timeout_cancels_the_call(self):
+        cancelled = threading.Event()
+
+        async def hang(bot):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        bot_client = client.BotClient("token")
+        with (
+            patch.object(client, "Bot", return_value=self._fake_bot()),
+            self.assertRaises(TimeoutError),
+        ):
+            bot_client.run(hang, timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+        bot_client.close()
+
+
+TASK_CALLS = []
+
+
+def record_task_call(**kwargs):
+    TASK_CALLS.append(kwargs)
+
+
+def failing_task(error):
+    raise {"runtime": RuntimeError, "bad_request": BadRequest}[error]("boom")
+
+
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def test_enqueued_task_runs_once(self):
+        task = tasks.enqueue(record_task_call, servizio_id=7)
+
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(tasks.run_pending(), 0)
+
+        self.assertEqual(TASK_CALLS, [{"servizio_id": 7}])
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.DONE)
+        self.assertIsNotNone(task.finished_at)
+
+    def test_failure_is_retried_with_backoff(self):
+        task = tasks.enqueue(failing_task, error="runtime")
+
+        tasks.run_pending()
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.PENDING)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.last_error, "boom")
+        self.assertGreater(task.next_attempt_at, timezone.now())
+        # Not due yet.
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_gives_up_after_max_attempts(self):
+        task = tasks.enqueue(failing_task, error="runtime")
+        BackgroundTask.objects.filter(pk=task.pk).update(
+            attempts=tasks.MAX_ATTEMPTS - 1
+        )
+
+        tasks.run_pending()
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.FAILED)
+
+    def test_permanent_telegram_error_is_not_retried(self):
+        task = tasks.enqueue(failing_task, error="bad_request")
+
+        tasks.run_pending()
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, BackgroundTask.Status.FAILED)
+        self.assertEqual(task.attempts, 1)
+
+    def test_task_claimed_by_another_runner_is_skipped(self):
+        task = tasks.enqueue(record_task_call)
+        BackgroundTask.objects.filter(pk=task.pk).update(
+            status=BackgroundTask.Status.RUNNING, started_at=timezone.now()
+        )
+
+        self.assertEqual(tasks.run_pending(), 0)
+        self.assertEqual(TASK_CALLS, [])
+
+    def test_stale_running_task_is_requeued(self):
+        task = tasks.enqueue(record_task_call)
+        BackgroundTask.objects.filter(pk=task.pk).update(
+            status=BackgroundTask.Status.RUNNING,
+            started_at=timezone.now() - tasks.STALE_AFTER - timedelta(minutes=1),
+        )
+
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(TASK_CALLS, [{}])
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="token")
+class WebLoginTests(TestCase):
+    def setUp(self):
+        self.volontario = Volontario.objects.create(
+            nome="Mario", cognome="Rossi", codice_fiscale=VALID_CF
+        )
+        self.telegram_user = TelegramUser.objects.create(
+            telegram_id=1001, volontario=self.volontario
+        )
+
+    def test_post_sends_approval_message(self):
+        with patch(
+            "tg_bot.views._send_login_approval_message", return_value=555
+        ) as send:
+            response = self.client.post(
+                reverse("web_login"), {"codice_fiscale": VALID_CF}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tg_bot/web_login_pending.html")
+        send.assert_called_once()
+        self.assertEqual(WebLoginRequest.objects.get().telegram_message_id, 555)
+
+    def test_send_failure_is_reported(self):
+        with patch(
+            "tg_bot.views._send_login_approval_message",
+            side_effect=NetworkError("timeout"),
+        ):
+            response = self.client.post(
+                reverse("web_login"), {"codice_fiscale": VALID_CF}
+            )
+
+        self.assertTemplateUsed(response, "tg_bot/web_login.html")
+        self.assertContains(response, "Errore nell&#x27;invio del messaggio Telegram")
+        self.assertFalse(WebLoginRequest.objects.exists())
+
+
+FAKE_BOT_USER = {
+    "id": 999,
+    "is_bot": True,
+    "first_name": "GestiPC",
+    "username": "gesti_bot",
+}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Local stand-in for the Bot API server: records calls and answers them."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return 1
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+        if endpoint == "getMe":
+            result = FAKE_BOT_USER
+        elif endpoint == "sendMessage":
+            result = {
+                "message_id": len(self.calls),
+                "date": 0,
+                "chat": {"id": params["chat_id"], "type": "private"},
+                "text": params["text"],
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def called(self, endpoint):
+        return [params for name, params in self.calls if name == endpoint]
+
+
+def _command_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Mario"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+class WebhookTests(TestCase):
+    URL = "https://gesti-pc.example.org/telegram/webhook/"
+
+    def setUp(self):
+        self.telegram = FakeTelegramRequest()
+        self.django_app = AsyncMock()
+
+        async def ping(update, context):
+            await update.message.reply_text("pong")
+
+        def factory():
+            application = (
+                Application.builder()
+                .token("123:ABC")
+                .request(self.telegram)
+                .get_updates_request(FakeTelegramRequest())
+                .concurrent_updates(4)
+                .build()
+            )
+            application.add_handler(CommandHandler("ping", ping))
+            return application
+
+        self.factory = factory
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.lock_file = str(Path(lock_dir.name) / "webhook.lock")
+        self.app = self._webhook()
+
+    def _webhook(self):
+        return webhook.TelegramWebhook(
+            self.django_app,
+            url=self.URL,
+            secret_token="s3cret",
+            application_factory=self.factory,
+            lock_file=self.lock_file,
+        )
+
+    async def _request(self, path, body=b"", method="POST", secret=b"s3cret"):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b"content-type", b"application/json")]
+        if secret is not None:
+            headers.append((webhook.SECRET_HEADER, secret))
+        scope = {"type": "http", "method": method, "path": path, "headers": headers}
+        await self.app(scope, receive, send)
+        return sent[0]["status"] if sent else None
+
+    async def _lifespan(self):
+        """Run the lifespan protocol; returns a coroutine function ending it."""
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.create_task(
+            self.app({"type": "lifespan"}, incoming.get, outgoing.put)
+        )
+        await incoming.put({"type": "lifespan.startup"})
+        self.assertEqual((await outgoing.get())["type"], "lifespan.startup.complete")
+
+        async def stop():
+            await incoming.put({"type": "lifespan.shutdown"})
+            self.assertEqual(
+                (await outgoing.get())["type"], "lifespan.shutdown.complete"
+            )
+            await task
+
+        return stop
+
+    async def _wait_for(self, endpoint, count=1):
+        for _ in range(100):
+            if len(self.telegram.called(endpoint)) >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"{endpoint} not called {count} times")
+
+    async def test_update_is_processed_by_application(self):
+        stop = await self._lifespan()
+        try:
+            [set_webhook] = self.telegram.called("setWebhook")
+            self.assertEqual(set_webhook["url"], self.URL)
+            self.assertEqual(set_webhook["secret_token"], "s3cret")
+
+            status = await self._request(
+                "/telegram/webhook/",
+                json.dumps(_command_update(1, 42, "/ping")).encode(),
+            )
+            self.assertEqual(status, 200)
+            await self._wait_for("sendMessage")
+        finally:
+            await stop()
+
+        [reply] = self.telegram.called("sendMessage")
+        self.assertEqual((reply["chat_id"], reply["text"]), (42, "pong"))
+
+    async def test_updates_from_different_users_are_all_processed(self):
+        stop = await self._lifespan()
+        try:
+            for update_id, chat_id in enumerate([1, 2, 3], start=1):
+                await self._request(
+                    "/telegram/webhook/",
+                    json.dumps(_command_update(update_id, chat_id, "/ping")).encode(),
+                )
+            await self._wait_for("sendMessage", count=3)
+        finally:
+            await stop()
+
+    async def test_wrong_secret_is_rejected(self):
+        stop = await self._lifespan()
+        try:
+            status = await self._request(
+                "/telegram/webhook/",
+                json.dumps(_command_update(1, 42, "/ping")).encode(),
+                secret=b"wrong",
+            )
+        finally:
+            await stop()
+
+        self.assertEqual(status, 403)
+        self.assertEqual(self.telegram.called("sendMessage"), [])
+
+    async def test_invalid_payload_and_method(self):
+        stop = await self._lifespan()
+        try:
+            self.assertEqual(await self._request("/telegram/webhook/", b"{"), 400)
+            for body in (b"[1]", b"5", b'"x"', b"null"):
+                with self.subTest(body=body):
+                    self.assertEqual(
+                        await self._request("/telegram/webhook/", body), 400
+                    )
+            self.assertEqual(
+                await self._request("/telegram/webhook/", method="GET"), 405
+            )
+        finally:
+            await stop()
+
+    async def test_second_process_cannot_start(self):
+        stop = await self._lifespan()
+        try:
+            second = self._webhook()
+            with self.assertRaisesRegex(RuntimeError, "single worker"):
+                await second.startup()
+            self.assertIsNone(second.application)
+        finally:
+            await stop()
+
+        # Only the process holding the lock registered the webhook.
+        self.assertEqual(len(self.telegram.called("setWebhook")), 1)
+        # Once the first one stops, the lock is free again.
+        second = self._webhook()
+        await second.startup()
+        await second.shutdown()
+
+    async def test_startup_requires_a_secret(self):
+        app = webhook.TelegramWebhook(
+            self.django_app,
+            url=self.URL,
+            secret_token="",
+            application_factory=self.factory,
+            lock_file=self.lock_file,
+        )
+
+        with self.assertRaises(ImproperlyConfigured):
+            await app.startup()
+
+        self.assertIsNone(app.application)
+        self.assertEqual(self.telegram.called("setWebhook"), [])
+
+    async def test_update_before_startup_is_refused(self):
+        status = await self._request("/telegram/webhook/", b"{}")
+
+        self.assertEqual(status, 503)
+
+    async def test_other_paths_go_to_django(self):
+        await self._request("/admin/", method="GET", secret=None)
+
+        self.django_app.assert_awaited_once()
+
+
+class CreateApplicationTests(TestCase):
+    @override_settings(TELEGRAM_BOT_TOKEN="123:ABC")
+    def test_webhook_application_has_handlers_but_no_jobs(self):
+        application = bot.create_application(jobs=False, concurrent_updates=8)
+
+        self.assertEqual(application.job_queue.jobs(), ())
+        self.assertTrue(application.handlers)
+        self.assertEqual(application.update_processor.max_concurrent_updates, 8)
+
+    @override_settings(TELEGRAM_BOT_TOKEN="123:ABC")
+    def test_jobs_only_application_has_no_handlers(self):
+        application = bot.create_application(handlers=False)
+
+        self.assertEqual(application.handlers, {})
+
+
+class OrderedUpdateProcessorTests(TestCase):
+    def _update(self, update_id, user_id):
+        return Update.de_json(_command_update(update_id, user_id, "/entrata"), None)
+
+    async def test_same_user_updates_run_in_order(self):
+        processor = OrderedUpdateProcessor(4)
+        release = asyncio.Event()
+        events = []
+
+        async def handle(name, wait=False):
+            events.append(f"{name}:start")
+            if wait:
+                await release.wait()
+            events.append(f"{name}:end")
+
+        first = asyncio.create_task(
+            processor.process_update(self._update(1, 10), handle("first", wait=True))
+        )
+        second = asyncio.create_task(
+            processor.process_update(self._update(2, 10), handle("second"))
+        )
+        await asyncio.sleep(0.01)
+        self.assertEqual(events, ["first:start"])
+
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(
+            events, ["first:start", "first:end", "second:start", "second:end"]
+        )
+
+    async def test_other_users_are_not_blocked(self):
+        processor = OrderedUpdateProcessor(2)
+        release = asyncio.Event()
+        done = []
+
+        async def slow():
+            await release.wait()
+            done.append("slow")
+
+        async def fast(name):
+            done.append(name)
+
+        blocked = [
+            asyncio.create_task(processor.process_update(self._update(1, 10), slow())),
+            # Queued behind the slow update: must not take the second slot.
+            asyncio.create_task(
+                processor.process_update(self._update(2, 10), fast("same user"))
+            ),
+        ]
+        await processor.process_update(self._update(3, 20), fast("other user"))
+        self.assertEqual(done, ["other user"])
+
+        release.set()
+        await asyncio.gather(*blocked)
+        self.assertEqual(done, ["other user", "slow", "same user"])
+        # Idle locks are dropped.
+        self.assertEqual(processor._locks, {})
@@ -0,0 +1,69 @@
+"""Concurrent update processing that keeps each user's updates in order.
+
+With plain ``concurrent_updates`` a user's second message can be handled before the
+first one finishes, which breaks conversation steps and can race a clock-in against
+the matching clock-out. :class:`OrderedUpdateProcessor` processes updates of
+different users in parallel but serialises updates sharing an ordering key: the
+sender's user id, or the chat id for updates without a sender (channel posts, chat
+boosts...). Updates with neither run unordered.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Hashable
+from typing import Any
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def ordering_key(update: object) -> Hashable | None:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    if update.effective_chat is not None:
+        return ("chat", update.effective_chat.id)
+    return None
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs up to ``max_concurrent_updates`` updates at once, in order per user/chat."""
+
+    __slots__ = ("_locks", "_users")
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+        # How many updates currently hold or wait for each lock, to drop idle ones.
+        self._users: dict[Hashable, int] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Take the per-key lock before a concurrency slot, so updates queued behind
+        # a slow one of the same user don't occupy slots other users could use.
+        # asyncio.Lock wakes waiters in FIFO order, which preserves arrival order.
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 
 from django.conf import settings
@@ -7,10 +6,12 @@ from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.views.decorators.http import require_GET, require_http_methods
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 
 from volontario.models import Volontario
 
+from . import client as telegram_client
 from .models import LoginToken, TelegramUser, WebLoginRequest
 
 logger = logging.getLogger(__name__)
@@ -53,15 +54,10 @@ def token_login(request, token: str):
     return redirect("admin:index")
 
 
-async def _send_login_approval_message(
+def _send_login_approval_message(
     chat_id: int, volontario: Volontario, token: str
-) -> int | None:
+) -> int:
     """Send login approval message with inline keyboard. Returns message_id."""
-    bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
-    if not bot_token:
-        logger.warning("TELEGRAM_BOT_TOKEN not configured")
-        return None
-
     keyboard = InlineKeyboardMarkup(
         [
             [
@@ -75,9 +71,8 @@ async def _send_login_approval_message(
         ]
     )
 
-    bot = Bot(token=bot_token)
-    async with bot:
-        message = await bot.send_message(
+    message = telegram_client.run(
+        lambda bot: bot.send_message(
             chat_id=chat_id,
             text=(
                 f"🔐 *Richiesta di accesso web*\n\n"
@@ -88,6 +83,7 @@ async def _send_login_approval_message(
             parse_mode="Markdown",
             reply_markup=keyboard,
         )
+    )
     return message.message_id
 
 
@@ -102,6 +98,9 @@ def web_login(request):
 
         if not codice_fiscale:
             error = "Inserisci il codice fiscale."
+        elif not getattr(settings, "TELEGRAM_BOT_TOKEN", None):
+            logger.warning("TELEGRAM_BOT_TOKEN not configured")
+            error = "Errore nell'invio del messaggio Telegram. Riprova."
         else:
             try:
                 volontario = Volontario.objects.get(codice_fiscale=codice_fiscale)
@@ -120,16 +119,19 @@ def web_login(request):
                         telegram_user=telegram_user,
                     )
 
-                    # Send Telegram message with approval buttons
-                    message_id = asyncio.run(
-                        _send_login_approval_message(
+                    # Sent inline so a failure is reported right away; the shared
+                    # client keeps this to a single request on a warm connection.
+                    try:
+                        message_id = _send_login_approval_message(
                             telegram_user.telegram_id,
                             volontario,
                             login_request.token,
                         )
-                    )
-
-                    if message_id:
+                    except (TelegramError, TimeoutError) as e:
+                        logger.error(f"Could not send web login approval: {e}")
+                        login_request.delete()
+                        error = "Errore nell'invio del messaggio Telegram. Riprova."
+                    else:
                         login_request.telegram_message_id = message_id
                         login_request.save(update_fields=["telegram_message_id"])
 
@@ -141,9 +143,6 @@ def web_login(request):
                                 "token": login_request.token,
                             },
                         )
-                    else:
-                        login_request.delete()
-                        error = "Errore nell'invio del messaggio Telegram. Riprova."
 
     return render(
         request,
@@ -0,0 +1,192 @@
+"""Webhook mode: Telegram updates served by the ASGI app next to Django.
+
+:class:`TelegramWebhook` wraps the Django ASGI application. It answers POSTs to the
+webhook path by feeding the update into the bot ``Application``'s update queue, and
+passes every other request on to Django. The ``Application`` is started and stopped
+with the ASGI server's lifespan events, so the server must support them (uvicorn
+does, e.g. ``gunicorn -k uvicorn.workers.UvicornWorker gesti_pc.asgi``).
+
+Conversation state (``/start``, ``/nuovoservizio``) and ``user_data`` live in the
+``Application``'s memory, so every update must reach the same process: the webhook is
+served by exactly one process, which also registers it with Telegram. Run the ASGI
+server with a single worker (e.g. ``uvicorn gesti_pc.asgi:application --workers 1``;
+asyncio still handles many updates at once). A second worker on the same host fails
+its startup on ``TELEGRAM_WEBHOOK_LOCK_FILE``. With several instances, set
+``TELEGRAM_WEBHOOK_URL`` on one of them only and route the webhook path to it.
+The scheduled jobs run in a single ``runbot --jobs-only`` process.
+"""
+
+import fcntl
+import hmac
+import json
+import logging
+from collections.abc import Callable
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+# Updates are a few KB at most; anything bigger is not from Telegram.
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def _acquire_lock(path: str):
+    """Lock ``path`` for this process, or fail if another process holds it."""
+    lock = open(path, "a")  # noqa: SIM115 - held until shutdown
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise RuntimeError(
+            f"Another process already serves the Telegram webhook (lock {path}): "
+            "run the ASGI server with a single worker"
+        ) from None
+    return lock
+
+
+def _default_application_factory() -> Application:
+    from tg_bot.bot import create_application
+
+    return create_application(
+        jobs=False, concurrent_updates=settings.TELEGRAM_CONCURRENT_UPDATES
+    )
+
+
+class TelegramWebhook:
+    """ASGI middleware routing Telegram webhook calls to the bot ``Application``."""
+
+    def __init__(
+        self,
+        app,
+        url: str | None = None,
+        secret_token: str | None = None,
+        application_factory: Callable[[], Application] = _default_application_factory,
+        lock_file: str | None = None,
+    ):
+        self.app = app
+        self.url = url if url is not None else settings.TELEGRAM_WEBHOOK_URL
+        self.path = urlsplit(self.url).path or "/"
+        self.secret_token = (
+            secret_token
+            if secret_token is not None
+            else settings.TELEGRAM_WEBHOOK_SECRET
+        )
+        self.application_factory = application_factory
+        self.lock_file = (
+            lock_file if lock_file is not None else settings.TELEGRAM_WEBHOOK_LOCK_FILE
+        )
+        self.application: Application | None = None
+        self._lock = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == self.path:
+            await self._handle_update(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def startup(self) -> None:
+        from tg_bot.bot import start_application
+
+        if self.url and not self.secret_token:
+            # Without it anyone knowing the URL could post updates as any user.
+            raise ImproperlyConfigured(
+                "TELEGRAM_WEBHOOK_SECRET must be set when TELEGRAM_WEBHOOK_URL is"
+            )
+        self._lock = _acquire_lock(self.lock_file)
+        try:
+            self.application = self.application_factory()
+            await start_application(self.application)
+        except BaseException:
+            self._release_lock()
+            raise
+        await self.application.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Telegram webhook listening on {self.path}")
+
+    async def shutdown(self) -> None:
+        from tg_bot.bot import stop_application
+
+        if self.application is not None:
+            await stop_application(self.application)
+            self.application = None
+        self._release_lock()
+
+    def _release_lock(self) -> None:
+        if self._lock is not None:
+            self._lock.close()  # Closing the file releases the lock.
+            self._lock = None
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Telegram webhook startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle_update(self, scope, receive, send) -> None:
+        if scope["method"] != "POST":
+            await _respond(send, 405)
+            return
+        received = dict(scope["headers"]).get(SECRET_HEADER, b"")
+        if not self.secret_token or not hmac.compare_digest(
+            received, self.secret_token.encode()
+        ):
+            await _respond(send, 403)
+            return
+        if self.application is None:
+            # Lifespan not run (or failed): let Telegram retry later.
+            await _respond(send, 503)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > MAX_BODY_SIZE:
+                await _respond(send, 413)
+                return
+
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise TypeError("not a JSON object")
+            update = Update.de_json(payload, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            await _respond(send, 400)
+            return
+
+        await self.application.update_queue.put(update)
+        await _respond(send, 200)
+
+
+async def _respond(send, status: int) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-length", b"0")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b""})
@@ -1,4 +1,7 @@
+from datetime import date, timedelta
+
 from django.contrib import admin
+from django.utils import timezone
 
 from magazzino.models import Dotazione
 
@@ -60,6 +63,46 @@ class DotazioneInline(admin.TabularInline):
     verbose_name_plural = "Dotazioni assegnate"
 
 
+def _years_ago(today: date, years: int) -> date:
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # 29 February
+        return today.replace(year=today.year - years, day=28)
+
+
+class FasciaEtaFilter(admin.SimpleListFilter):
+    """Age bands, filtered on ``data_nascita`` in SQL."""
+
+    title = "fascia d'età"
+    parameter_name = "eta"
+
+    # value -> (label, min age, max age included or None)
+    BANDS = {
+        "0-17": ("Minorenni", 0, 17),
+        "18-30": ("18-30 anni", 18, 30),
+        "31-50": ("31-50 anni", 31, 50),
+        "51-65": ("51-65 anni", 51, 65),
+        "66+": ("Oltre 65 anni", 66, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, (label, _, _) in self.BANDS.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.BANDS:
+            return queryset
+        _, min_age, max_age = self.BANDS[self.value()]
+        today = timezone.localdate()
+        # Aged at least min_age: born on or before the min_age-th birthday date.
+        queryset = queryset.filter(data_nascita__lte=_years_ago(today, min_age))
+        if max_age is not None:
+            # Not yet max_age + 1.
+            queryset = queryset.filter(
+                data_nascita__gte=_years_ago(today, max_age + 1) + timedelta(days=1)
+            )
+        return queryset
+
+
 @admin.register(Volontario)
 class VolontarioAdmin(admin.ModelAdmin):
     list_display = [
@@ -74,7 +117,7 @@ class VolontarioAdmin(admin.ModelAdmin):
     inlines = [CertificazioneVolontarioMapInline, DotazioneInline]
     autocomplete_fields = ["fkorganizzazione"]
     search_fields = ["nome", "cognome", "codice_fiscale"]
-    list_filter = ["fkorganizzazione"]
+    list_filter = ["fkorganizzazione", FasciaEtaFilter, "provincia_nascita"]
 
     def get_fields(self, request, obj=None):
         fields = [
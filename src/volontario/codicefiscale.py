@@ -1,5 +1,8 @@
 from enum import StrEnum
 from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
 from codicefiscale import codicefiscale
 
 
@@ -8,20 +11,61 @@ class SexEnum(StrEnum):
     FEMALE = "F"
 
 
-class CodiceFiscale:
-    cf: str
+class _Decoded(NamedTuple):
     sex: SexEnum
     birth_date: datetime
     birth_place: str
     birth_province: str
 
+
+@lru_cache(maxsize=4096)
+def _decode(cf: str) -> _Decoded:
+    # codicefiscale.decode looks the birthplace up in the full municipality table:
+    # by far the slowest part of loading a volunteer, so decode each code once.
+    decoded = codicefiscale.decode(cf)
+    return _Decoded(
+        sex=decoded["gender"],
+        birth_date=decoded["birthdate"],
+        birth_place=decoded["birthplace"]["name"],
+        birth_province=decoded["birthplace"]["province"],
+    )
+
+
+class CodiceFiscale:
+    """A codice fiscale, decoded lazily on first access to the personal data."""
+
+    __slots__ = ("_decoded", "cf")
+
+    cf: str
+
     def __init__(self, cf: str):
         self.cf = cf
-        decoded = codicefiscale.decode(self.cf)
-        self.sex = decoded["gender"]
-        self.birth_date = decoded["birthdate"]
-        self.birth_place = decoded["birthplace"]["name"]
-        self.birth_province = decoded["birthplace"]["province"]
+        self._decoded: _Decoded | None = None
+
+    def _fields(self) -> _Decoded:
+        if self._decoded is None:
+            self._decoded = _decode(self.cf.upper())
+        return self._decoded
+
+    def validate(self) -> None:
+        """Decode now, raising if the code is not valid."""
+        self._fields()
+
+    @property
+    def sex(self) -> SexEnum:
+        return self._fields().sex
+
+    @property
+    def birth_date(self) -> datetime:
+        return self._fields().birth_date
+
+    @property
+    def birth_place(self) -> str:
+        return self._fields().birth_place
+
+    @property
+    def birth_province(self) -> str:
+        return self._fields().birth_province
 
     def __str__(self):
         return self.cf
@@ -31,3 +75,15 @@ class CodiceFiscale:
 
     def __len__(self):
         return 16
+
+    def __eq__(self, other):
+        # Equal to another CodiceFiscale or to the code as stored (upper case), so
+        # primary keys loaded from the database match the ones in memory.
+        if isinstance(other, CodiceFiscale):
+            return self.cf.upper() == other.cf.upper()
+        if isinstance(other, str):
+            return self.cf.upper() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cf.upper())
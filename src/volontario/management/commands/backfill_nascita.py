@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from volontario.models import Volontario
+
+
+class Command(BaseCommand):
+    help = (
+        "Compila data, luogo e provincia di nascita dei volontari dal codice "
+        "fiscale, a blocchi (da eseguire dopo la migrazione che aggiunge le colonne)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Volontari aggiornati per transazione (default 500)",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Ricalcola anche i volontari già compilati",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = Volontario.objects.order_by("pk").only("codice_fiscale")
+        if not options["all"]:
+            queryset = queryset.filter(data_nascita__isnull=True)
+
+        updated = invalid = 0
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(page[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            valid = [v for v in batch if v.set_birth_fields()]
+            invalid += len(batch) - len(valid)
+            with transaction.atomic():
+                Volontario.objects.bulk_update(valid, Volontario.BIRTH_FIELDS)
+            updated += len(valid)
+
+        self.stdout.write(self.style.SUCCESS(f"Aggiornati {updated} volontari"))
+        if invalid:
+            self.stdout.write(
+                self.style.WARNING(f"{invalid} codici fiscali non decodificabili")
+            )
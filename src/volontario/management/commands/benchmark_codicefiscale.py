@@ -0,0 +1,86 @@
+import time
+from datetime import datetime, timedelta
+
+from codicefiscale import codicefiscale
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from volontario.codicefiscale import _decode
+from volontario.models import Volontario
+
+COMUNI = ["Milano", "Roma", "Torino", "Bergamo", "Brescia", "Monza", "Como", "Lecco"]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Misura il caricamento dei volontari con la decodifica del codice fiscale "
+        "immediata (comportamento precedente) e pigra con cache. I volontari di "
+        "prova vengono creati in una transazione annullata al termine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=2000,
+            help="Volontari di prova da creare (default 2000)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._create(options["count"])
+                self._run()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _create(self, count: int) -> None:
+        volontari = []
+        seen = set()
+        day = datetime(1960, 1, 1)
+        for i in range(count):
+            cf = codicefiscale.encode(
+                lastname=f"Prova{i}",
+                firstname="Volontario",
+                gender="M" if i % 2 else "F",
+                birthdate=day + timedelta(days=i * 7),
+                birthplace=COMUNI[i % len(COMUNI)],
+            )
+            if cf not in seen:
+                seen.add(cf)
+                volontari.append(
+                    Volontario(
+                        codice_fiscale=cf, nome="Volontario", cognome=f"Prova{i}"
+                    )
+                )
+        Volontario.objects.bulk_create(volontari, batch_size=500)
+        self.stdout.write(f"{len(volontari)} volontari di prova")
+
+    def _run(self) -> None:
+        def eager():
+            # What from_db_value used to do: decode every code while loading.
+            for volontario in Volontario.objects.all():
+                codicefiscale.decode(volontario.codice_fiscale.cf)
+
+        def lazy():
+            list(Volontario.objects.all())
+
+        def birth_dates():
+            return [v.codice_fiscale.birth_date for v in Volontario.objects.all()]
+
+        _decode.cache_clear()
+        for name, fn in [
+            ("decodifica immediata", eager),
+            ("pigra, solo caricamento", lazy),
+            ("pigra, data di nascita (cache fredda)", birth_dates),
+            ("pigra, data di nascita (cache calda)", birth_dates),
+        ]:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"  {name:<40} {elapsed * 1000:9.1f} ms")
@@ -0,0 +1,28 @@
+# Generated by Django 6.1.2 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volontario', '0002_alter_volontario_codice_fiscale_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='volontario',
+            name='data_nascita',
+            field=models.DateField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='volontario',
+            name='luogo_nascita',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='volontario',
+            name='provincia_nascita',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=2),
+        ),
+    ]
@@ -21,13 +21,19 @@ class CodiceFiscaleField(models.CharField):
         if isinstance(value, CodiceFiscale):
             return value
 
+        cf = CodiceFiscale(value)
         try:
-            return CodiceFiscale(value)
+            cf.validate()
         except Exception as e:
             raise ValidationError(str(e)) from e
+        return cf
 
     def from_db_value(self, value, *args):
-        """Convert database value to Python object (called when loading from DB)"""
+        """Convert database value to Python object (called when loading from DB).
+
+        Stored codes were validated on input: decoding is deferred until the birth
+        data is actually read.
+        """
         if value is None:
             return value
         return CodiceFiscale(value)
@@ -73,6 +79,14 @@ class Volontario(models.Model):
         blank=True,
         related_name="volontario",
     )
+    # Birth data decoded from the codice fiscale, stored to filter and sort in SQL.
+    data_nascita = models.DateField(null=True, editable=False, db_index=True)
+    luogo_nascita = models.CharField(max_length=100, blank=True, editable=False)
+    provincia_nascita = models.CharField(
+        max_length=2, blank=True, editable=False, db_index=True
+    )
+
+    BIRTH_FIELDS = ["data_nascita", "luogo_nascita", "provincia_nascita"]
 
     class Meta:
         verbose_name = "Volontario"
@@ -87,17 +101,44 @@ class Volontario(models.Model):
     def __str__(self) -> str:
         return f"{self.nome} {self.cognome} - {self.fkorganizzazione if self.fkorganizzazione else ''}"
 
-    @admin.display(description="Data di nascita")
+    def save(self, *args, **kwargs):
+        self.set_birth_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "codice_fiscale" in update_fields:
+            kwargs["update_fields"] = {*update_fields, *self.BIRTH_FIELDS}
+        super().save(*args, **kwargs)
+
+    def set_birth_fields(self) -> bool:
+        """Fill the birth columns from the codice fiscale.
+
+        Returns False (and clears them) if the code cannot be decoded.
+        """
+        cf = self.codice_fiscale
+        if not isinstance(cf, CodiceFiscale):
+            cf = CodiceFiscale(cf)
+        try:
+            self.data_nascita = cf.birth_date.date()
+            self.luogo_nascita = cf.birth_place
+            self.provincia_nascita = cf.birth_province
+        except (ValueError, TypeError):
+            self.data_nascita = None
+            self.luogo_nascita = self.provincia_nascita = ""
+            return False
+        return True
+
+    @admin.display(description="Data di nascita", ordering="data_nascita")
     def data_di_nascita(self):
         from django.utils import formats
 
-        cf: CodiceFiscale = self.codice_fiscale  # type: ignore
-        return formats.date_format(cf.birth_date, "d F Y")
+        if self.data_nascita is None:
+            return ""
+        return formats.date_format(self.data_nascita, "d F Y")
 
-    @admin.display(description="Luogo di nascita")
+    @admin.display(description="Luogo di nascita", ordering="luogo_nascita")
     def luogo_di_nascita(self):
-        cf: CodiceFiscale = self.codice_fiscale  # type: ignore
-        return f"{cf.birth_place}, {cf.birth_province}"
+        if not self.luogo_nascita:
+            return ""
+        return f"{self.luogo_nascita}, {self.provincia_nascita}"
 
 
 class TipoOggetto(models.Model):
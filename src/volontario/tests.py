@@ -1,3 +1,130 @@
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from . import codicefiscale as cf_module
+from .codicefiscale import CodiceFiscale, SexEnum
+from .models import CodiceFiscaleField, Volontario
+
+VALID_CF = "RSSMRA90A01H501W"
+# Born 10/08/1985 in Milano, 01/01/1980 in Torino, 01/03/1992 in Bergamo.
+OTHER_CFS = ["BNCLGU85M10F205B", "VRDGPP80A01L219M", "NREFNC92C41A794K"]
+
+
+class CodiceFiscaleTests(TestCase):
+    """Lazy, cached decoding of CodiceFiscale."""
+
+    def setUp(self):
+        cf_module._decode.cache_clear()
+
+    def _decode_spy(self):
+        return patch.object(
+            cf_module.codicefiscale, "decode", wraps=cf_module.codicefiscale.decode
+        )
+
+    def test_loading_volontari_does_not_decode(self):
+        Volontario.objects.create(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+
+        with self._decode_spy() as decode:
+            volontario = Volontario.objects.get()
+            self.assertEqual(str(volontario.codice_fiscale), VALID_CF)
+
+        decode.assert_not_called()
+
+    def test_decodes_on_first_access_once_per_code(self):
+        with self._decode_spy() as decode:
+            first = CodiceFiscale(VALID_CF)
+            self.assertEqual(first.birth_place, "Roma")
+            self.assertEqual(first.sex, SexEnum.MALE)
+            self.assertEqual(CodiceFiscale(VALID_CF.lower()).birth_date.year, 1990)
+
+        decode.assert_called_once_with(VALID_CF)
+
+    def test_has_no_instance_dict(self):
+        self.assertFalse(hasattr(CodiceFiscale(VALID_CF), "__dict__"))
+
+    def test_to_python_still_validates(self):
+        with self.assertRaises(ValidationError):
+            CodiceFiscaleField().to_python("RSSMRA90A01H501X")
+
+    def test_benchmark_command_runs(self):
+        out = StringIO()
+
+        call_command("benchmark_codicefiscale", count=3, stdout=out)
+
+        self.assertIn("cache calda", out.getvalue())
+        self.assertFalse(Volontario.objects.exists())
+
+
+class BirthFieldsTests(TestCase):
+    """Birth data stored in indexed columns for SQL filtering and sorting."""
+
+    def test_save_fills_birth_fields(self):
+        volontario = Volontario.objects.create(
+            codice_fiscale=VALID_CF, nome="Mario", cognome="Rossi"
+        )
+
+        volontario.refresh_from_db()
+        self.assertEqual(volontario.data_nascita, date(1990, 1, 1))
+        self.assertEqual(volontario.luogo_nascita, "Roma")
+        self.assertEqual(volontario.provincia_nascita, "RM")
+        self.assertEqual(volontario.luogo_di_nascita(), "Roma, RM")
+
+    def test_backfill_in_batches(self):
+        # bulk_create bypasses save(): the columns stay empty until backfilled.
+        Volontario.objects.bulk_create(
+            [
+                Volontario(codice_fiscale=cf, nome="Nome", cognome="Test")
+                for cf in [VALID_CF, *OTHER_CFS]
+            ]
+        )
+        out = StringIO()
+
+        # Per batch: select, savepoint, update, release; then a last empty select.
+        with self.assertNumQueries(2 * 4 + 1):
+            call_command("backfill_nascita", batch_size=2, stdout=out)
+
+        self.assertIn("Aggiornati 4", out.getvalue())
+        self.assertFalse(Volontario.objects.filter(data_nascita__isnull=True).exists())
+        self.assertEqual(
+            Volontario.objects.get(pk=OTHER_CFS[0]).provincia_nascita, "MI"
+        )
+
+    def test_admin_filters_and_sorts_in_sql(self):
+        for cf in [VALID_CF, *OTHER_CFS]:
+            Volontario.objects.create(codice_fiscale=cf, nome="Nome", cognome="Test")
+        user = get_user_model().objects.create_superuser("admin", "", "pw")
+        self.client.force_login(user)
+        url = reverse("admin:volontario_volontario_changelist")
+
+        # OTHER_CFS[0] turns 30 on this day.
+        with patch("django.utils.timezone.localdate", return_value=date(2015, 8, 10)):
+            young = self.client.get(url, {"eta": "18-30"})
+            older = self.client.get(url, {"eta": "31-50"})
+        self.assertEqual(
+            {str(v.pk) for v in young.context["cl"].result_list},
+            {VALID_CF, OTHER_CFS[0], OTHER_CFS[2]},
+        )
+        self.assertEqual(
+            [str(v.pk) for v in older.context["cl"].result_list], [OTHER_CFS[1]]
+        )
+
+        response = self.client.get(url, {"provincia_nascita": "BG"})
+        self.assertEqual(
+            [str(v.pk) for v in response.context["cl"].result_list], [OTHER_CFS[2]]
+        )
 
-# Create your tests here.
+        column = response.context["cl"].list_display.index("data_di_nascita")
+        response = self.client.get(url, {"o": str(column)})
+        self.assertEqual(
+            [str(v.pk) for v in response.context["cl"].result_list],
+            [OTHER_CFS[1], OTHER_CFS[0], VALID_CF, OTHER_CFS[2]],
+        )